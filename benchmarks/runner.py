@@ -0,0 +1,259 @@
+"""Замеры страниц CRM на синтетических данных.
+
+Запуск из корня проекта:
+    python -m benchmarks --size 1k --size 100k
+    python -m benchmarks --size 1k --update-baseline
+
+Для каждого размера создается отдельная база benchmarks/data/
+(миграции + seed_crm с фиксированным зерном). По каждой странице
+считаются p50/p95 времени ответа, количество запросов к БД и пик
+памяти (tracemalloc), результат пишется в JSON и сравнивается
+с benchmarks/baseline.json. При регрессии код выхода 1.
+
+Baseline обновляется отдельным коммитом, по всем размерам сразу
+(--size 1k --size 100k --size 1m --update-baseline), а не вместе
+с изменениями кода: иначе сравнение с ним не покажет регрессию,
+которую внесло само изменение.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from contextlib import ExitStack
+
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BENCH_DIR, 'data')
+BASELINE_PATH = os.path.join(BENCH_DIR, 'baseline.json')
+
+# Размер набора данных -> (сделок, клиентов)
+SIZES = {
+    '1k': (1000, 200),
+    '100k': (100000, 20000),
+    '1m': (1000000, 100000),
+}
+
+SEED = 42
+
+# Разница времени меньше этого порога считается шумом (мс)
+NOISE_MS = 2.0
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+    import django
+    django.setup()
+
+
+def use_database(size):
+    """Переключение соединений на базу набора данных size"""
+    from django.db import connections
+
+    path = os.path.join(DATA_DIR, f'bench_{size}.sqlite3')
+    for connection in connections.all():
+        connection.close()
+        connection.settings_dict['NAME'] = path
+    return path
+
+
+def prepare_dataset(size, stdout):
+    """Создание базы набора данных, если ее еще нет, и миграции"""
+    from django.core.management import call_command
+
+    path = use_database(size)
+    if os.path.exists(path):
+        # Готовый набор: только новые миграции
+        call_command('migrate', verbosity=0)
+        return
+    os.makedirs(DATA_DIR, exist_ok=True)
+    deals, clients = SIZES[size]
+    stdout.write(f'Создание набора {size} ({deals} сделок)...\n')
+    try:
+        call_command('migrate', verbosity=0)
+        call_command('seed_crm', deals=deals, clients=clients, seed=SEED,
+                     stdout=open(os.devnull, 'w'))
+    except BaseException:
+        # Недозаполненная база испортила бы следующие запуски
+        use_database(size)
+        os.remove(path)
+        raise
+
+
+def percentile(values, percent):
+    """Процентиль по ближайшему рангу"""
+    ordered = sorted(values)
+    index = max(0, -(-len(ordered) * percent // 100) - 1)
+    return ordered[int(index)]
+
+
+def measure(client, url, iterations, warmup, warm_cache):
+    """Время, количество запросов и пик памяти для одного адреса"""
+    from django.core.cache import caches
+    from django.db import connections
+
+    def request():
+        if not warm_cache:
+            for backend in caches.all():
+                backend.clear()
+        return client.get(url)
+
+    for _ in range(warmup):
+        request()
+
+    timings = []
+    status = None
+    for _ in range(iterations):
+        started = time.perf_counter()
+        response = request()
+        timings.append((time.perf_counter() - started) * 1000)
+        status = response.status_code
+
+    # CaptureQueriesContext не подходит: request_started очищает
+    # журнал запросов соединения
+    queries = []
+
+    def count_query(execute, sql, params, many, context):
+        queries.append(sql)
+        return execute(sql, params, many, context)
+
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(count_query))
+        request()
+
+    tracemalloc.start()
+    try:
+        request()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'status': status,
+        'p50_ms': round(percentile(timings, 50), 2),
+        'p95_ms': round(percentile(timings, 95), 2),
+        'queries': len(queries),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def run(sizes, iterations, warmup, warm_cache, only, stdout):
+    from django.test import Client
+    from .scenarios import build_scenarios
+
+    results = {}
+    for size in sizes:
+        prepare_dataset(size, stdout)
+        client = Client()
+        results[size] = {}
+        for name, url in build_scenarios():
+            if only and not any(part in name for part in only):
+                continue
+            result = measure(client, url, iterations, warmup, warm_cache)
+            results[size][name] = result
+            stdout.write(
+                f'[{size}] {name:<28} p50 {result["p50_ms"]:>8.2f} мс  '
+                f'p95 {result["p95_ms"]:>8.2f} мс  '
+                f'запросов {result["queries"]:>4}  '
+                f'память {result["peak_kb"]:>9.1f} КБ\n')
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Регрессии относительно baseline: список строк"""
+    regressions = []
+    for size, scenarios in results.items():
+        for name, result in scenarios.items():
+            base = baseline.get(size, {}).get(name)
+            if not base:
+                continue
+            if result['status'] != base['status']:
+                regressions.append(
+                    f'[{size}] {name}: статус {base["status"]} -> '
+                    f'{result["status"]}')
+            if result['queries'] > base['queries']:
+                regressions.append(
+                    f'[{size}] {name}: запросов {base["queries"]} -> '
+                    f'{result["queries"]}')
+            limit = base['p95_ms'] * (1 + threshold)
+            if (result['p95_ms'] > limit
+                    and result['p95_ms'] - base['p95_ms'] > NOISE_MS):
+                regressions.append(
+                    f'[{size}] {name}: p95 {base["p95_ms"]} -> '
+                    f'{result["p95_ms"]} мс')
+            if result['peak_kb'] > base['peak_kb'] * (1 + threshold):
+                regressions.append(
+                    f'[{size}] {name}: память {base["peak_kb"]} -> '
+                    f'{result["peak_kb"]} КБ')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks', description='Замеры страниц CRM')
+    parser.add_argument('--size', action='append', choices=list(SIZES),
+                        help='Размер набора данных (можно несколько), '
+                             'по умолчанию 1k')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--warm-cache', action='store_true',
+                        help='Не очищать кеш между запросами')
+    parser.add_argument('--only', action='append',
+                        help='Только страницы, в имени которых есть строка')
+    parser.add_argument('--output', help='Куда записать результаты (JSON)')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Допустимый рост p95 и памяти (доля)')
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='Записать результаты в baseline')
+    args = parser.parse_args(argv)
+
+    setup_django()
+    import django
+
+    sizes = args.size or ['1k']
+    results = run(sizes, args.iterations, args.warmup, args.warm_cache,
+                  args.only, sys.stdout)
+    report = {
+        'meta': {
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'iterations': args.iterations,
+            'warm_cache': args.warm_cache,
+        },
+        'results': results,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.update_baseline:
+        baseline = {'meta': report['meta'], 'results': {}}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline['meta'] = report['meta']
+        baseline['results'].update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2)
+        sys.stdout.write(f'Baseline обновлен: {args.baseline}\n')
+        return
+
+    if not os.path.exists(args.baseline):
+        sys.stdout.write('Baseline не найден, сравнение пропущено\n')
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)['results']
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        sys.stdout.write('Регрессии:\n')
+        for line in regressions:
+            sys.stdout.write(f'  {line}\n')
+        sys.exit(1)
+    sys.stdout.write('Регрессий нет\n')
@@ -0,0 +1,71 @@
+"""Список замеряемых страниц.
+
+Id сделок и клиентов выбираются из базы детерминированно,
+поэтому на одном и том же наборе данных адреса совпадают.
+"""
+from urllib.parse import urlencode
+
+from django.db.models import Count
+from django.urls import reverse
+
+from clients.models import Client
+from deals.models import Deal
+from deals.views import DEAL_SORT_ORDERINGS
+
+
+DATE_FILTERS = ['today', 'week', 'month', 'quarter']
+
+
+def _url(name, query=None, **kwargs):
+    url = reverse(name, kwargs=kwargs or None)
+    return f'{url}?{urlencode(query)}' if query else url
+
+
+def build_scenarios():
+    """Список (имя, url) для замеров на текущей базе"""
+    deal = Deal.objects.annotate(
+        comments_count=Count('comments')
+    ).order_by('-comments_count', 'id').first()
+    client = Client.objects.order_by('-deals_count', 'id').first()
+
+    scenarios = [
+        ('dashboard', _url('dashboard')),
+        ('all_deals', _url('closed_deals')),
+    ]
+    scenarios += [
+        (f'all_deals status={status}',
+         _url('closed_deals', {'status': status}))
+        for status, _ in Deal.STATUS_CHOICES
+    ]
+    scenarios += [
+        (f'all_deals date={date}', _url('closed_deals', {'date': date}))
+        for date in DATE_FILTERS
+    ]
+    scenarios += [
+        (f'all_deals sort={sort}', _url('closed_deals', {'sort': sort}))
+        for sort in DEAL_SORT_ORDERINGS
+    ]
+    scenarios += [
+        ('deals_api', _url('deals_api', {'limit': 25})),
+        ('deals_api limit=1000', _url('deals_api', {'limit': 1000})),
+    ]
+    if client:
+        scenarios.append((
+            'all_deals search',
+            _url('closed_deals', {'search': client.name.split()[0]})))
+    if deal:
+        scenarios.append(
+            ('deal_detail', _url('deal_detail', deal_id=deal.pk)))
+    if client:
+        scenarios += [
+            ('client_detail', _url('client_detail', client_id=client.pk)),
+            ('find_client_api',
+             _url('find_client_api', {'phone': client.phone})),
+        ]
+    scenarios += [
+        ('contacts', _url('contacts')),
+        ('contacts sort=spent', _url('contacts', {'sort': 'spent'})),
+        ('services', _url('services')),
+        ('statistics', _url('statistics')),
+    ]
+    return scenarios
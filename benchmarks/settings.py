@@ -0,0 +1,27 @@
+"""Настройки для замеров: отдельная база на каждый размер данных.
+
+benchmarks.runner переключает соединения на базу набора данных
+(use_database меняет NAME в settings_dict). CRM_BENCH_DB задает
+базу при запуске с этими настройками без runner (например, shell).
+"""
+import os
+
+from grey_crm.settings import *  # noqa: F401,F403
+from grey_crm.settings import BASE_DIR, CACHES, DATABASES, LOGGING
+
+
+DATABASES['default']['NAME'] = os.environ.get(
+    'CRM_BENCH_DB', os.path.join(BASE_DIR, 'benchmarks', 'data',
+                                 'bench_1k.sqlite3'))
+DATABASES['read']['NAME'] = DATABASES['default']['NAME']
+
+ALLOWED_HOSTS = ['testserver']
+
+# Замеры идут в одном процессе: кеш в памяти, отдельный от кеша сервера
+CACHES['default'] = {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'grey-crm-bench',
+}
+
+# Строки лога crm.perf (и превышения бюджетов) не нужны при замерах
+LOGGING['loggers']['crm.perf']['level'] = 'ERROR'
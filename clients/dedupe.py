@@ -0,0 +1,229 @@
+"""Поиск и слияние дублей клиентов.
+
+Пары клиентов не сравниваются все со всеми: кандидаты собираются по
+ключам блокировки, которые считает база (GROUP BY ... HAVING COUNT > 1),
+поэтому в Python попадают только клиенты с общим ключом:
+    - последние 7 цифр телефона: внутри такого блока дубли - одинаковый
+      номер без кода страны (phone_suffix) или одинаковое имя, когда
+      один номер - окончание другого (записан без кода города);
+    - email без учета регистра: дубли - одинаковое имя (общий email
+      семьи или организации не сливает разных людей).
+Имена сравниваются по name_key. Связанные совпадения объединяются
+в кластеры (система непересекающихся множеств): A и B с одним
+телефоном, B и C с одним email - один клиент.
+
+Слияние кластера - одна транзакция: сделки переносятся на основного
+клиента (самого раннего) одним UPDATE, пустые поля основного
+заполняются из дублей, дубли удаляются, счетчики сделок основного
+пересчитываются.
+"""
+import re
+
+from django.db import transaction
+from django.db.models import Case, Count, IntegerField, Value, When
+from django.db.models.functions import Length, Lower, Right
+
+from core.cache import bump_versions_on_commit
+from .models import Client
+from .stats import refresh_client_stats
+
+
+# Сколько последних цифр телефона образуют блок кандидатов
+PHONE_BLOCK_DIGITS = 7
+
+# Блоки больше этого размера не сравниваются попарно по имени
+MAX_BLOCK_SIZE = 200
+
+# Кластеры больше этого размера не сливаются автоматически:
+# обычно это номер-заглушка или общий email организации
+MAX_CLUSTER_SIZE = 20
+
+# Сколько кластеров сливать в одной транзакции
+MERGE_BATCH_SIZE = 200
+
+MEMBER_FIELDS = ('id', 'name', 'phone_suffix', 'email')
+
+
+def name_key(name):
+    """Имя для сравнения: регистр, ё/е и порядок слов не важны"""
+    words = re.findall(r'\w+', (name or '').lower().replace('ё', 'е'))
+    return ' '.join(sorted(words))
+
+
+class _DisjointSet:
+    """Система непересекающихся множеств по id клиентов"""
+
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, item):
+        root = self.parent.setdefault(item, item)
+        while self.parent[root] != root:
+            root = self.parent[root]
+        # Сжатие пути: следующие поиски - за один шаг
+        while item != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, first, second):
+        first, second = self.find(first), self.find(second)
+        if first != second:
+            # Корень - меньший id, то есть самый ранний клиент
+            if second < first:
+                first, second = second, first
+            self.parent[second] = first
+
+    def groups(self):
+        groups = {}
+        for item in self.parent:
+            groups.setdefault(self.find(item), []).append(item)
+        return [sorted(items) for items in groups.values()]
+
+
+def _blocks(clients, key_expression):
+    """Клиенты с общим ключом блокировки, по блокам.
+
+    Ключи с повторами считает база; строки приходят отсортированными по
+    ключу одним запросом, в памяти - только текущий блок.
+    """
+    keyed = clients.annotate(block_key=key_expression).exclude(
+        block_key__isnull=True).exclude(block_key='')
+    duplicate_keys = keyed.order_by().values('block_key').annotate(
+        members=Count('id')).filter(members__gt=1).values('block_key')
+    rows = keyed.filter(block_key__in=duplicate_keys).order_by(
+        'block_key', 'id').values_list('block_key', *MEMBER_FIELDS)
+
+    block, current_key = [], None
+    for key, *member in rows.iterator(chunk_size=5000):
+        if key != current_key and block:
+            yield block
+            block = []
+        current_key = key
+        block.append(dict(zip(MEMBER_FIELDS, member)))
+    if block:
+        yield block
+
+
+def _link_phone_block(members, clusters):
+    """Дубли среди клиентов с одинаковыми последними цифрами телефона"""
+    by_suffix = {}
+    for member in members:
+        first = by_suffix.setdefault(member['phone_suffix'], member['id'])
+        clusters.union(first, member['id'])
+
+    if len(by_suffix) == 1 or len(members) > MAX_BLOCK_SIZE:
+        return
+    # Номер без кода города - окончание полного номера того же клиента
+    for index, member in enumerate(members):
+        key = name_key(member['name'])
+        for other in members[index + 1:]:
+            short, full = sorted(
+                (member['phone_suffix'], other['phone_suffix']), key=len)
+            if (short != full and full.endswith(short)
+                    and key == name_key(other['name'])):
+                clusters.union(member['id'], other['id'])
+
+
+def find_duplicate_clusters(clients=None):
+    """Кластеры дублей: списки id по возрастанию, первый - основной.
+
+    Возвращает (кластеры, слишком большие кластеры).
+    """
+    if clients is None:
+        clients = Client.objects.all()
+    clusters = _DisjointSet()
+
+    with_phone = clients.annotate(
+        phone_length=Length('phone_normalized')).filter(
+            phone_length__gte=PHONE_BLOCK_DIGITS)
+    for members in _blocks(
+            with_phone, Right('phone_normalized', PHONE_BLOCK_DIGITS)):
+        _link_phone_block(members, clusters)
+
+    for members in _blocks(clients, Lower('email')):
+        by_name = {}
+        for member in members:
+            first = by_name.setdefault(name_key(member['name']), member['id'])
+            clusters.union(first, member['id'])
+
+    found, oversized = [], []
+    for ids in clusters.groups():
+        if len(ids) < 2:
+            continue
+        (oversized if len(ids) > MAX_CLUSTER_SIZE else found).append(ids)
+    found.sort()
+    oversized.sort()
+    return found, oversized
+
+
+def _merge_into(primary, duplicates):
+    """Пустые поля основного клиента из дублей (дубли - по возрастанию id)"""
+    digits = len(primary.phone_normalized)
+    notes = [primary.notes] if primary.notes else []
+    for duplicate in duplicates:
+        if not primary.email and duplicate.email:
+            primary.email = duplicate.email
+        # Полный номер вместо записанного без кода
+        if len(duplicate.phone_normalized) > digits:
+            primary.phone = duplicate.phone
+            digits = len(duplicate.phone_normalized)
+        if duplicate.notes and duplicate.notes not in notes:
+            notes.append(duplicate.notes)
+    primary.notes = '\n'.join(notes)
+    primary.fill_phone_keys()
+
+
+def merge_clusters(clusters):
+    """Слияние кластеров в одной транзакции.
+
+    Клиенты перечитываются внутри транзакции: удаленные после поиска
+    пропускаются. Возвращает (слито кластеров, удалено дублей).
+    """
+    # Локальный импорт для избежания циклической зависимости
+    from deals.models import Deal
+    from deals.signals import deals_changed
+
+    with transaction.atomic():
+        ids = [client_id for cluster in clusters for client_id in cluster]
+        clients = Client.objects.select_for_update().in_bulk(ids)
+
+        primaries, targets = [], {}
+        for cluster in clusters:
+            members = [clients[pk] for pk in cluster if pk in clients]
+            if len(members) < 2:
+                continue
+            primary, duplicates = members[0], members[1:]
+            _merge_into(primary, duplicates)
+            primaries.append(primary)
+            for duplicate in duplicates:
+                targets[duplicate.pk] = primary.pk
+
+        if not targets:
+            return 0, 0
+
+        # Email основного клиента мог измениться - он есть в поиске сделок
+        deal_ids = list(Deal.objects.filter(
+            client_id__in=ids).values_list('id', flat=True))
+        # Все сделки дублей переносятся одним UPDATE
+        Deal.objects.filter(client_id__in=targets).update(client_id=Case(
+            *(When(client_id=duplicate, then=Value(primary))
+              for duplicate, primary in targets.items()),
+            output_field=IntegerField()))
+        Client.objects.bulk_update(
+            primaries, ['phone', 'phone_normalized', 'phone_suffix',
+                        'email', 'notes'])
+        # У дублей уже нет сделок, каскадное удаление ничего не затронет
+        Client.objects.filter(id__in=targets).delete()
+        # Сделки дублей теперь у основных клиентов
+        refresh_client_stats([primary.pk for primary in primaries])
+
+        bump_versions_on_commit([Client._meta.label_lower])
+        if deal_ids:
+            deals_changed.send(sender=Client, deal_ids=deal_ids)
+
+    return len(primaries), len(targets)
+
+
+def merge_cluster(ids):
+    """Слияние одного кластера (id по возрастанию, первый - основной)"""
+    return merge_clusters([ids])
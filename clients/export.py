@@ -0,0 +1,89 @@
+"""Фильтры списка клиентов и выгрузка клиентов"""
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Q
+
+from core.export import datetime_formatter
+from core.pagination import nulls_last_ordering
+from .phones import normalize_phone
+
+
+CLIENT_EXPORT_HEADER = [
+    'ID', 'ФИО', 'Телефон', 'Email', 'Сделок', 'Потрачено',
+    'Дата создания', 'Заметки',
+]
+
+EXPORT_CHUNK_SIZE = 2000
+
+# Сортировки списка клиентов по сохраненным счетчикам (clients.stats):
+# ключ курсора заканчивается уникальным id, клиенты без сделок
+# (last_deal_at - NULL) идут в конце
+CLIENT_SORT_ORDERINGS = {
+    'name': ('name', 'id'),
+    'spent': ('-total_spent', '-id'),
+    'deals': ('-deals_count', '-id'),
+    'recent': ('-last_deal_at', '-id'),
+}
+
+# Фильтры по сделкам клиента
+CLIENT_DEAL_FILTERS = {
+    'active': Q(active_deals_count__gt=0),
+    'with_deals': Q(deals_count__gt=0),
+    'without_deals': Q(deals_count=0),
+}
+
+
+def filter_clients(clients, params):
+    """Фильтрация QuerySet клиентов по параметрам запроса.
+
+    Поиск по имени или цифрам телефона, фильтр по сделкам
+    (?deals=active|with_deals|without_deals), потрачено не меньше
+    ?min_spent=. Возвращает (clients, filters) - выбранные значения
+    для шаблона.
+    """
+    search_query = params.get('search', '').strip()
+    if search_query:
+        condition = Q(name__icontains=search_query)
+        digits = normalize_phone(search_query)
+        if digits:
+            condition |= Q(phone_normalized__contains=digits)
+        clients = clients.filter(condition)
+
+    deals_filter = params.get('deals', 'all')
+    if deals_filter in CLIENT_DEAL_FILTERS:
+        clients = clients.filter(CLIENT_DEAL_FILTERS[deals_filter])
+    else:
+        deals_filter = 'all'
+
+    min_spent = params.get('min_spent', '').strip()
+    try:
+        if min_spent:
+            clients = clients.filter(total_spent__gte=Decimal(min_spent))
+    except InvalidOperation:
+        min_spent = ''
+
+    sort_by = params.get('sort', 'name')
+    if sort_by not in CLIENT_SORT_ORDERINGS:
+        sort_by = 'name'
+
+    return clients, {
+        'search_query': search_query,
+        'deals_filter': deals_filter,
+        'min_spent': min_spent,
+        'sort_by': sort_by,
+    }
+
+
+def client_export_rows(clients, sort_by='name'):
+    """Строки выгрузки: счетчики сделок - сохраненные поля клиента"""
+    rows = clients.order_by(*nulls_last_ordering(
+        clients.model, CLIENT_SORT_ORDERINGS[sort_by])).values_list(
+        'id', 'name', 'phone', 'email', 'deals_count', 'total_spent',
+        'created_at', 'notes',
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+    format_datetime = datetime_formatter()
+    for (pk, name, phone, email, deals_count, spent, created_at,
+         notes) in rows:
+        yield [pk, name, phone, email or '', deals_count, spent,
+               format_datetime(created_at), notes]
@@ -0,0 +1,221 @@
+"""Импорт клиентов из CSV и XLSX.
+
+Строки читаются потоково (core.imports) и обрабатываются пачками:
+на пачку один запрос поиска существующих клиентов по телефону
+(phone_suffix__in), bulk_create новых и bulk_update измененных.
+Клиенты сопоставляются по последним цифрам телефона, как в поиске
+клиента по телефону; повторы телефона внутри файла сливаются в одного
+клиента (непустые значения более поздней строки побеждают).
+Каждая пачка - отдельная транзакция: при сбое уже загруженные пачки
+остаются, повторный импорт того же файла их не задублирует.
+"""
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+
+from core.cache import bump_versions_on_commit
+from .models import Client
+from .phones import normalize_phone, phone_suffix
+
+
+IMPORT_BATCH_SIZE = 1000
+
+# Сколько ошибок по строкам возвращать в отчете
+MAX_REPORTED_ERRORS = 100
+
+# Названия колонок (в нижнем регистре) для полей клиента.
+# Подходят и файлы выгрузки клиентов (CLIENT_EXPORT_HEADER)
+HEADER_ALIASES = {
+    'name': {'фио', 'фио клиента', 'имя', 'клиент', 'name'},
+    'phone': {'телефон', 'тел', 'тел.', 'phone'},
+    'email': {'email', 'e-mail', 'почта'},
+    'notes': {'заметки', 'примечание', 'комментарий', 'notes'},
+}
+REQUIRED_COLUMNS = {'name': 'ФИО', 'phone': 'Телефон'}
+
+UPDATE_FIELDS = ['name', 'email', 'notes']
+
+
+def _header_columns(header):
+    """Номера колонок полей клиента по строке заголовка"""
+    columns = {}
+    for index, title in enumerate(header):
+        title = (title or '').strip().lower()
+        for field, aliases in HEADER_ALIASES.items():
+            if title in aliases:
+                columns.setdefault(field, index)
+    missing = [title for field, title in REQUIRED_COLUMNS.items()
+               if field not in columns]
+    if missing:
+        raise ValidationError(
+            f'В файле нет колонок: {", ".join(missing)}')
+    return columns
+
+
+def _clean_row(values, columns):
+    """Поля клиента из строки файла; None - пустая строка"""
+    data = {}
+    for field, index in columns.items():
+        value = values[index] if index < len(values) else ''
+        data[field] = (value or '').strip()
+    if not any(data.values()):
+        return None
+
+    if not data['name']:
+        raise ValidationError('не указано ФИО')
+    if len(data['name']) > Client._meta.get_field('name').max_length:
+        raise ValidationError('слишком длинное ФИО')
+    if not data['phone']:
+        raise ValidationError('не указан телефон')
+    if len(data['phone']) > Client._meta.get_field('phone').max_length:
+        raise ValidationError('слишком длинный телефон')
+    data['suffix'] = phone_suffix(normalize_phone(data['phone']))
+    if not data['suffix']:
+        raise ValidationError('в телефоне нет цифр')
+    if data.get('email'):
+        try:
+            validate_email(data['email'])
+        except ValidationError:
+            raise ValidationError(f'неверный email {data["email"]}')
+    return data
+
+
+def _merge(client, data):
+    """Непустые значения из файла в клиента; True - если что-то изменилось"""
+    changed = False
+    for field in UPDATE_FIELDS:
+        value = data.get(field)
+        if value and getattr(client, field) != value:
+            setattr(client, field, value)
+            changed = True
+    return changed
+
+
+class _ClientImport:
+    """Состояние одного импорта: счетчики и клиенты, уже взятые из файла"""
+
+    def __init__(self, update_existing):
+        self.update_existing = update_existing
+        self.report = {
+            'rows': 0, 'created': 0, 'updated': 0, 'unchanged': 0,
+            'duplicates': 0, 'skipped': 0, 'errors': [],
+        }
+        # id клиентов, созданных или обновленных этим импортом
+        self.imported_ids = set()
+
+    def error(self, line_number, message):
+        self.report['skipped'] += 1
+        if len(self.report['errors']) < MAX_REPORTED_ERRORS:
+            self.report['errors'].append(f'Строка {line_number}: {message}')
+
+    def import_batch(self, batch):
+        # Повторы телефона внутри пачки сливаются до запроса к базе
+        by_suffix = {}
+        for data in batch:
+            if data['suffix'] in by_suffix:
+                self.report['duplicates'] += 1
+                _merge(by_suffix[data['suffix']], data)
+            else:
+                by_suffix[data['suffix']] = Client(
+                    name=data['name'], phone=data['phone'],
+                    email=data.get('email') or None,
+                    notes=data.get('notes', ''))
+
+        existing = {}
+        for client in Client.objects.filter(
+                phone_suffix__in=by_suffix).order_by('id'):
+            existing.setdefault(client.phone_suffix, client)
+
+        new_clients, changed, reindex = [], [], []
+        for suffix, imported in by_suffix.items():
+            client = existing.get(suffix)
+            if client is None:
+                imported.fill_phone_keys()
+                new_clients.append(imported)
+                continue
+
+            if client.pk in self.imported_ids:
+                # Телефон уже встречался в предыдущих пачках файла
+                self.report['duplicates'] += 1
+            elif not self.update_existing:
+                self.report['unchanged'] += 1
+                continue
+
+            indexed = (client.name, client.email)
+            if not _merge(client, {
+                    'name': imported.name, 'email': imported.email,
+                    'notes': imported.notes}):
+                if client.pk not in self.imported_ids:
+                    self.report['unchanged'] += 1
+                continue
+            if client.pk not in self.imported_ids:
+                self.report['updated'] += 1
+            changed.append(client)
+            if (client.name, client.email) != indexed:
+                reindex.append(client.pk)
+
+        with transaction.atomic():
+            Client.objects.bulk_create(new_clients)
+            if changed:
+                Client.objects.bulk_update(changed, UPDATE_FIELDS)
+            if new_clients or changed:
+                # bulk-операции не отправляют post_save
+                bump_versions_on_commit([Client._meta.label_lower])
+            if reindex:
+                self._reindex_deals(reindex)
+
+        self.report['created'] += len(new_clients)
+        self.imported_ids.update(client.pk for client in new_clients)
+        self.imported_ids.update(client.pk for client in changed)
+
+    def _reindex_deals(self, client_ids):
+        """Имя и email клиента входят в документы поиска сделок"""
+        # Локальный импорт для избежания циклической зависимости
+        from deals.models import Deal
+        from deals.signals import deals_changed
+
+        deal_ids = list(Deal.objects.filter(
+            client_id__in=client_ids).values_list('id', flat=True))
+        if deal_ids:
+            deals_changed.send(sender=Client, deal_ids=deal_ids)
+
+
+def import_client_rows(rows, batch_size=IMPORT_BATCH_SIZE,
+                       update_existing=True, progress=None):
+    """Импорт клиентов из строк (номер строки, значения) с заголовком.
+
+    update_existing=False - существующих клиентов не менять.
+    progress(report) вызывается после каждой пачки.
+    Возвращает отчет: rows, created, updated, unchanged, duplicates,
+    skipped и errors (первые MAX_REPORTED_ERRORS ошибок по строкам).
+    """
+    rows = iter(rows)
+    header = next(rows, None)
+    if header is None:
+        raise ValidationError('Файл пуст')
+    columns = _header_columns(header[1])
+
+    state = _ClientImport(update_existing)
+    report = state.report
+    batch = []
+    for line_number, values in rows:
+        try:
+            data = _clean_row(values, columns)
+        except ValidationError as e:
+            report['rows'] += 1
+            state.error(line_number, e.messages[0])
+            continue
+        if data is None:
+            continue
+        report['rows'] += 1
+        batch.append(data)
+        if len(batch) >= batch_size:
+            state.import_batch(batch)
+            batch = []
+            if progress:
+                progress(report)
+    if batch:
+        state.import_batch(batch)
+        if progress:
+            progress(report)
+    return report
@@ -0,0 +1,64 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from clients.dedupe import (MAX_CLUSTER_SIZE, MERGE_BATCH_SIZE,
+                            find_duplicate_clusters, merge_clusters)
+from clients.models import Client
+
+
+class Command(BaseCommand):
+    """Поиск и слияние дублей клиентов.
+
+    Дубли ищутся по телефону, email и имени (clients.dedupe); сделки
+    дублей переносятся на самого раннего клиента кластера. Сначала
+    стоит посмотреть найденное с --dry-run.
+    """
+    help = 'Находит и сливает дубли клиентов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только показать найденные дубли')
+        parser.add_argument('--show', type=int, default=20,
+                            help='Сколько кластеров показать')
+        parser.add_argument('--batch-size', type=int,
+                            default=MERGE_BATCH_SIZE,
+                            help='Кластеров в одной транзакции')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        clusters, oversized = find_duplicate_clusters()
+        duplicates = sum(len(ids) - 1 for ids in clusters)
+        self.stdout.write(
+            f'Кластеров: {len(clusters)}, дублей: {duplicates} '
+            f'({time.perf_counter() - started:.1f} с)')
+        if oversized:
+            self.stdout.write(self.style.WARNING(
+                f'Пропущено кластеров больше {MAX_CLUSTER_SIZE} клиентов: '
+                f'{len(oversized)} (первые id: '
+                f'{", ".join(str(ids[0]) for ids in oversized[:10])})'))
+
+        if options['dry_run']:
+            self._show(clusters[:options['show']])
+            return
+
+        started = time.perf_counter()
+        merged = removed = 0
+        batch_size = options['batch_size']
+        for start in range(0, len(clusters), batch_size):
+            batch_merged, batch_removed = merge_clusters(
+                clusters[start:start + batch_size])
+            merged += batch_merged
+            removed += batch_removed
+        self.stdout.write(self.style.SUCCESS(
+            f'Слито кластеров: {merged}, удалено дублей: {removed} '
+            f'({time.perf_counter() - started:.1f} с)'))
+
+    def _show(self, clusters):
+        ids = [client_id for cluster in clusters for client_id in cluster]
+        clients = Client.objects.in_bulk(ids)
+        for cluster in clusters:
+            self.stdout.write(' | '.join(
+                f'{clients[pk].pk}: {clients[pk].name}, {clients[pk].phone}'
+                f'{", " + clients[pk].email if clients[pk].email else ""}'
+                for pk in cluster if pk in clients))
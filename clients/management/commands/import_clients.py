@@ -0,0 +1,57 @@
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from clients.imports import IMPORT_BATCH_SIZE, import_client_rows
+from core.imports import IMPORT_FORMATS, detect_format, read_rows
+
+
+class Command(BaseCommand):
+    """Импорт клиентов из CSV или XLSX файла.
+
+    Клиенты с тем же телефоном обновляются (непустые ФИО, email,
+    заметки из файла), с --no-update остаются как есть.
+    """
+    help = 'Импортирует клиентов из CSV или XLSX'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=IMPORT_FORMATS,
+                            help='Формат файла (по умолчанию - по расширению)')
+        parser.add_argument('--batch-size', type=int,
+                            default=IMPORT_BATCH_SIZE)
+        parser.add_argument('--no-update', action='store_true',
+                            help='Не менять существующих клиентов')
+
+    def handle(self, *args, **options):
+        import_format = options['format'] or detect_format(options['path'])
+        if import_format is None:
+            raise CommandError('Укажите формат файла: --format csv|xlsx')
+
+        started = time.perf_counter()
+
+        def progress(report):
+            self.stdout.write(
+                f'Строк: {report["rows"]}, '
+                f'{time.perf_counter() - started:.1f} с')
+
+        try:
+            with open(options['path'], 'rb') as file:
+                report = import_client_rows(
+                    read_rows(file, import_format),
+                    batch_size=options['batch_size'],
+                    update_existing=not options['no_update'],
+                    progress=progress)
+        except (OSError, ValidationError) as e:
+            raise CommandError(
+                e.messages[0] if isinstance(e, ValidationError) else e)
+
+        for error in report['errors']:
+            self.stdout.write(self.style.WARNING(error))
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано: {report["created"]}, обновлено: {report["updated"]}, '
+            f'без изменений: {report["unchanged"]}, '
+            f'повторов в файле: {report["duplicates"]}, '
+            f'пропущено: {report["skipped"]} '
+            f'({time.perf_counter() - started:.1f} с)'))
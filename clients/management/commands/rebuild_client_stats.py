@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from clients.stats import STATS_BATCH_SIZE, rebuild_client_stats
+
+
+class Command(BaseCommand):
+    """Проверка и пересчет счетчиков сделок клиентов"""
+    help = ('Сверяет счетчики сделок клиентов (количество, активные, '
+            'потрачено, последняя сделка) со сделками')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только проверить счетчики, ничего не изменяя')
+        parser.add_argument(
+            '--batch-size', type=int, default=STATS_BATCH_SIZE,
+            help='Клиентов в одной пачке сверки')
+
+    def handle(self, *args, **options):
+        checked, stale = rebuild_client_stats(
+            options['batch_size'], fix=not options['check'])
+
+        self.stdout.write(
+            f'Проверено клиентов: {checked}, расхождений: {len(stale)}')
+
+        if options['check']:
+            if stale:
+                preview = ', '.join(str(pk) for pk in stale[:20])
+                raise CommandError(
+                    f'Неверные счетчики у клиентов: {preview}'
+                    f'{"..." if len(stale) > 20 else ""}')
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано клиентов: {len(stale)}'))
@@ -0,0 +1,62 @@
+# Generated by Django 4.2 on 2026-10-18 13:39
+
+import re
+
+from django.db import migrations, models
+
+
+# Копия clients.phones на момент миграции: последующие правки модуля
+# не должны менять то, что делает уже примененная миграция
+PHONE_SUFFIX_LENGTH = 10
+
+
+def normalize_phone(value):
+    digits = re.sub(r'\D', '', value or '')
+    if len(digits) == 11 and digits.startswith('8'):
+        return '7' + digits[1:]
+    if len(digits) == 10 and digits.startswith('9'):
+        return '7' + digits
+    return digits
+
+
+def phone_suffix(normalized):
+    return normalized[-PHONE_SUFFIX_LENGTH:]
+
+
+def fill_phone_keys(apps, schema_editor):
+    """Заполнение нормализованных телефонов у существующих клиентов"""
+    Client = apps.get_model('clients', 'Client')
+    batch = []
+    for client in Client.objects.only('id', 'phone').iterator(
+            chunk_size=2000):
+        client.phone_normalized = normalize_phone(client.phone)
+        client.phone_suffix = phone_suffix(client.phone_normalized)
+        batch.append(client)
+        if len(batch) >= 2000:
+            Client.objects.bulk_update(
+                batch, ['phone_normalized', 'phone_suffix'])
+            batch = []
+    if batch:
+        Client.objects.bulk_update(
+            batch, ['phone_normalized', 'phone_suffix'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='client',
+            name='phone_normalized',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=20, verbose_name='Телефон (цифры)'),
+        ),
+        migrations.AddField(
+            model_name='client',
+            name='phone_suffix',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=10, verbose_name='Телефон без кода страны'),
+        ),
+        migrations.RunPython(fill_phone_keys, migrations.RunPython.noop),
+    ]
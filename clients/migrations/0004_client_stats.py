@@ -0,0 +1,73 @@
+# Generated by Django 4.2 on 2026-10-18 15:13
+
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_client_stats(apps, schema_editor):
+    """Заполнение счетчиков сделок у существующих клиентов"""
+    Client = apps.get_model('clients', 'Client')
+    Deal = apps.get_model('deals', 'Deal')
+    client_deals = Deal.objects.filter(
+        client=OuterRef('pk')).order_by().values('client')
+
+    def deals_value(value):
+        return Subquery(client_deals.annotate(value=value).values('value'))
+
+    Client.objects.update(
+        deals_count=Coalesce(deals_value(Count('id')), Value(0)),
+        active_deals_count=Coalesce(deals_value(Count('id', filter=Q(
+            status__in=['new', 'in_progress', 'ready']))), Value(0)),
+        total_spent=Coalesce(
+            deals_value(Sum('total', filter=Q(
+                status__in=['completed', 'successful']))),
+            Value(0),
+            output_field=models.DecimalField(max_digits=14,
+                                             decimal_places=2)),
+        last_deal_at=deals_value(Max('created_at')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0003_client_phone_normalized'),
+        ('deals', '0003_deal_total'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='client',
+            name='active_deals_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Активных сделок'),
+        ),
+        migrations.AddField(
+            model_name='client',
+            name='deals_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Сделок'),
+        ),
+        migrations.AddField(
+            model_name='client',
+            name='last_deal_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Последняя сделка'),
+        ),
+        migrations.AddField(
+            model_name='client',
+            name='total_spent',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=14, verbose_name='Потрачено'),
+        ),
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['total_spent', 'id'], name='client_spent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['deals_count', 'id'], name='client_deals_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['last_deal_at', 'id'], name='client_last_deal_idx'),
+        ),
+        migrations.RunPython(fill_client_stats, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
-from django.db.models import Sum
+
+from .phones import normalize_phone, phone_suffix
 
 
 class Client(models.Model):
@@ -8,41 +9,83 @@ class Client(models.Model):
                             verbose_name="ФИО клиента")
     phone = models.CharField(max_length=20,
                              verbose_name="Телефон")
+    phone_normalized = models.CharField(max_length=20, blank=True,
+                                        db_index=True, editable=False,
+                                        verbose_name="Телефон (цифры)")
+    phone_suffix = models.CharField(max_length=10, blank=True,
+                                    db_index=True, editable=False,
+                                    verbose_name="Телефон без кода страны")
     email = models.EmailField(blank=True, null=True,
                               verbose_name="Email")
     notes = models.TextField(blank=True,
                              verbose_name="Заметки")
-    created_at = models.DateTimeField(auto_now_add=True,
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True,
                                       verbose_name="Дата создания")
+    # Счетчики сделок: пересчитываются при изменении сделок (clients.stats)
+    deals_count = models.PositiveIntegerField(default=0, editable=False,
+                                              verbose_name="Сделок")
+    active_deals_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="Активных сделок")
+    total_spent = models.DecimalField(max_digits=14, decimal_places=2,
+                                      default=0, editable=False,
+                                      verbose_name="Потрачено")
+    last_deal_at = models.DateTimeField(null=True, blank=True,
+                                        editable=False,
+                                        verbose_name="Последняя сделка")
+
+    # Поля, которые обычное сохранение клиента не перезаписывает
+    STATS_FIELDS = ('deals_count', 'active_deals_count', 'total_spent',
+                    'last_deal_at')
 
     class Meta:
         verbose_name = "Клиент"
         verbose_name_plural = "Клиенты"
         ordering = ['name']
+        indexes = [
+            # Сортировки страницы контактов
+            models.Index(fields=['total_spent', 'id'],
+                         name='client_spent_idx'),
+            models.Index(fields=['deals_count', 'id'],
+                         name='client_deals_count_idx'),
+            models.Index(fields=['last_deal_at', 'id'],
+                         name='client_last_deal_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        """Заполнение нормализованного телефона перед сохранением"""
+        self.fill_phone_keys()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'phone' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {
+                'phone_normalized', 'phone_suffix'}
+        elif update_fields is None and not self._state.adding:
+            # Счетчики в объекте могут быть старше, чем в базе
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.STATS_FIELDS]
+        super().save(*args, **kwargs)
+
+    def fill_phone_keys(self):
+        """Ключи поиска по телефону (нужно вызывать перед bulk_create)"""
+        self.phone_normalized = normalize_phone(self.phone)
+        self.phone_suffix = phone_suffix(self.phone_normalized)
+
     def get_total_spent(self):
         """Общая сумма потраченная клиентом
         (только завершенные и успешные сделки)"""
-        # Локальный импорт для избежания циклической зависимости
-        from deals.models import DealService
-
-        total = DealService.objects.filter(
-            deal__client=self,
-            deal__status__in=['completed', 'successful']
-        ).aggregate(total=Sum('price'))['total']
-        return total or 0
+        return self.total_spent
 
     def get_deals_count(self):
         """Количество сделок клиента"""
-        return self.deals.count()  # использует related_name из модели Deal
+        return self.deals_count
 
     def get_active_deals(self):
-        """Активные сделки клиента"""
-        return self.deals.exclude(
-            status__in=['completed', 'cancelled', 'closed'])
+        """Активные сделки клиента (те же статусы, что в active_deals_count)"""
+        return self.deals.filter(status__in=self.deals.model.ACTIVE_STATUSES)
 
 
 class AdditionalContact(models.Model):
@@ -0,0 +1,36 @@
+import re
+
+
+# Количество последних цифр, по которым совпадают варианты записи номера
+PHONE_SUFFIX_LENGTH = 10
+# Минимальная длина частично введенного номера для поиска по префиксу
+PHONE_PREFIX_MIN_LENGTH = 5
+
+
+def normalize_phone(value):
+    """Телефон только цифрами в едином формате 7XXXXXXXXXX.
+
+    +7 (900) 123-45-67, 8 900 123 45 67 и 9001234567
+    приводятся к 79001234567.
+    """
+    digits = re.sub(r'\D', '', value or '')
+    if len(digits) == 11 and digits.startswith('8'):
+        return '7' + digits[1:]
+    if len(digits) == 10 and digits.startswith('9'):
+        return '7' + digits
+    return digits
+
+
+def phone_suffix(normalized):
+    """Последние цифры номера без кода страны"""
+    return normalized[-PHONE_SUFFIX_LENGTH:]
+
+
+def phone_search_prefix(value):
+    """Префикс нормализованного номера для частично введенного телефона"""
+    digits = re.sub(r'\D', '', value or '')
+    if digits.startswith('8'):
+        return '7' + digits[1:]
+    if digits.startswith('9'):
+        return '7' + digits
+    return digits
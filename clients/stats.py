@@ -0,0 +1,129 @@
+"""Счетчики сделок клиента, хранящиеся в самом клиенте.
+
+deals_count, active_deals_count, total_spent и last_deal_at
+пересчитываются одним UPDATE с подзапросами по сделкам (индекс
+client_id) для затронутых клиентов - в той же транзакции, что и
+изменение сделок (deals.signals). rebuild_client_stats сверяет
+счетчики всех клиентов с агрегатами по сделкам и исправляет
+расхождения.
+"""
+from decimal import Decimal
+
+from django.db.models import (Count, DecimalField, IntegerField, Max,
+                              OuterRef, Q, Subquery, Sum, Value)
+from django.db.models.functions import Coalesce
+
+from .models import Client
+
+
+# Статусы сделок, которые входят в сумму потраченного
+SPENT_STATUSES = ['completed', 'successful']
+
+STATS_BATCH_SIZE = 5000
+
+# Счетчики клиента без сделок
+EMPTY_STATS = {'deals_count': 0, 'active_deals_count': 0,
+               'total_spent': 0, 'last_deal_at': None}
+
+_CENT = Decimal('0.01')
+
+
+def _stats_values():
+    """Агрегаты сделок для счетчиков (имя поля клиента - выражение)"""
+    # Локальный импорт для избежания циклической зависимости
+    from deals.models import Deal
+
+    return {
+        'deals_count': Count('id'),
+        'active_deals_count': Count(
+            'id', filter=Q(status__in=Deal.ACTIVE_STATUSES)),
+        'total_spent': Sum('total', filter=Q(status__in=SPENT_STATUSES)),
+        'last_deal_at': Max('created_at'),
+    }
+
+
+def _stats_subqueries():
+    """Счетчики одного клиента подзапросами по его сделкам"""
+    # Локальный импорт для избежания циклической зависимости
+    from deals.models import Deal
+
+    client_deals = Deal.objects.filter(
+        client=OuterRef('pk')).order_by().values('client')
+    subqueries = {
+        name: Subquery(client_deals.annotate(value=value).values('value'))
+        for name, value in _stats_values().items()
+    }
+    return {
+        'deals_count': Coalesce(subqueries['deals_count'], Value(0),
+                                output_field=IntegerField()),
+        'active_deals_count': Coalesce(
+            subqueries['active_deals_count'], Value(0),
+            output_field=IntegerField()),
+        'total_spent': Coalesce(
+            subqueries['total_spent'], Value(0),
+            output_field=DecimalField(max_digits=14, decimal_places=2)),
+        'last_deal_at': subqueries['last_deal_at'],
+    }
+
+
+def refresh_client_stats(client_ids):
+    """Пересчет счетчиков клиентов одним UPDATE.
+
+    client_ids - список id или QuerySet со значениями id.
+    """
+    return Client.objects.filter(pk__in=client_ids).update(
+        **_stats_subqueries())
+
+
+def refresh_deal_clients(deal_ids):
+    """Пересчет счетчиков клиентов указанных сделок"""
+    # Локальный импорт для избежания циклической зависимости
+    from deals.models import Deal
+
+    return refresh_client_stats(
+        Deal.objects.filter(pk__in=deal_ids).values('client_id'))
+
+
+def _normalized(stats):
+    return (stats['deals_count'], stats['active_deals_count'],
+            Decimal(stats['total_spent'] or 0).quantize(_CENT),
+            stats['last_deal_at'])
+
+
+def rebuild_client_stats(batch_size=STATS_BATCH_SIZE, fix=True):
+    """Сверка счетчиков всех клиентов с агрегатами по сделкам.
+
+    Клиенты проверяются пачками по id: на пачку один запрос клиентов
+    и один GROUP BY по сделкам. fix=False - только проверка.
+    Возвращает (проверено клиентов, id клиентов с расхождениями).
+    """
+    # Локальный импорт для избежания циклической зависимости
+    from deals.models import Deal
+
+    fields = list(Client.STATS_FIELDS)
+    checked, stale_ids = 0, []
+    last_id = 0
+    while True:
+        clients = list(Client.objects.filter(pk__gt=last_id).order_by(
+            'pk').values('pk', *fields)[:batch_size])
+        if not clients:
+            break
+        first_id, last_id = clients[0]['pk'], clients[-1]['pk']
+        expected = {
+            row['client_id']: row for row in Deal.objects.filter(
+                client_id__gte=first_id, client_id__lte=last_id
+            ).order_by().values('client_id').annotate(**_stats_values())
+        }
+
+        stale = [
+            stored['pk'] for stored in clients
+            if _normalized(stored) != _normalized(
+                expected.get(stored['pk'], EMPTY_STATS))
+        ]
+        checked += len(clients)
+        stale_ids += stale
+        if fix and stale:
+            # Пересчет тем же UPDATE, что и при изменении сделок:
+            # сделки могли измениться после сверки
+            refresh_client_stats(stale)
+    return checked, stale_ids
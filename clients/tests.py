@@ -1,3 +1,341 @@
-from django.test import TestCase
+import os
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.urls import reverse
+from django.utils import timezone
+
+from core.pagination import KeysetPaginator, nulls_last_ordering
+from core.testing import CRMTestCase, walk_pages
+from deals.models import Deal, DealService
+from price.models import Service
+from .dedupe import find_duplicate_clusters, merge_cluster
+from .export import CLIENT_SORT_ORDERINGS, filter_clients
+from .models import Client
+from .phones import normalize_phone
+
+
+class PhoneLookupTests(CRMTestCase):
+    """Поиск клиента по нормализованному телефону"""
+
+    def setUp(self):
+        super().setUp()
+        self.ivan = Client.objects.create(name='Иван Петров',
+                                          phone='+7 (900) 111-22-33')
+        self.anna = Client.objects.create(name='Анна Смирнова',
+                                          phone='8 900 444 55 66')
+
+    def find(self, phone):
+        return self.client.get(reverse('find_client_api'),
+                               {'phone': phone}).json()
+
+    def test_normalize_phone(self):
+        for value in ('+7 (900) 123-45-67', '8 900 123 45 67', '9001234567'):
+            self.assertEqual(normalize_phone(value), '79001234567')
+        self.assertEqual(self.anna.phone_normalized, '79004445566')
+        self.assertEqual(self.anna.phone_suffix, '9004445566')
+
+    def test_full_number_in_any_format(self):
+        for phone in ('89001112233', '+79001112233', '900 111 22 33'):
+            with self.subTest(phone=phone):
+                data = self.find(phone)
+                self.assertTrue(data['success'])
+                self.assertEqual(data['client']['id'], self.ivan.pk)
+
+    def test_partial_number_matches_prefix(self):
+        data = self.find('8900444')
+        self.assertEqual(data['client']['id'], self.anna.pk)
+        # Слишком короткий ввод и цифры из середины номера не ищутся
+        self.assertFalse(self.find('8900')['success'])
+        self.assertFalse(self.find('1112233')['success'])
+        self.assertEqual(self.find('')['message'], 'Не указан телефон')
+
+    def test_phone_change_updates_lookup_keys(self):
+        self.ivan.phone = '+7 999 000-00-01'
+        self.ivan.save(update_fields=['phone'])
+        self.assertEqual(self.find('89990000001')['client']['id'],
+                         self.ivan.pk)
+        self.assertFalse(self.find('89001112233')['success'])
+
+
+class ClientKeysetPaginationTests(CRMTestCase):
+    """Курсорная пагинация контактов, в том числе по полям с NULL"""
+
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        for number in range(17):
+            client = Client.objects.create(name=f'Клиент {number % 5}',
+                                           phone=f'+7900000{number:04}')
+            # Часть клиентов без сделок: last_deal_at = NULL
+            if number % 3:
+                Client.objects.filter(pk=client.pk).update(
+                    last_deal_at=now - timedelta(days=number % 4),
+                    deals_count=number % 2, total_spent=number % 4)
+
+    def test_pages_follow_ordering_both_ways(self):
+        for sort_by, ordering in CLIENT_SORT_ORDERINGS.items():
+            with self.subTest(sort=sort_by):
+                expected = list(Client.objects.order_by(
+                    *nulls_last_ordering(Client, ordering)).values_list(
+                    'pk', flat=True))
+                forward, backward = walk_pages(KeysetPaginator(
+                    Client.objects.all(), ordering, per_page=4))
+                self.assertEqual(sum(forward, []), expected)
+                self.assertEqual(backward, forward)
+
+    def test_recent_sort_lists_clients_without_deals_last(self):
+        response = self.client.get(reverse('contacts'), {'sort': 'recent'})
+        clients = list(response.context['clients'])
+        self.assertEqual(len(clients), 17)
+        self.assertEqual(
+            {client.pk for client in clients[-6:]},
+            set(Client.objects.filter(last_deal_at__isnull=True)
+                .values_list('pk', flat=True)))
+
+
+class ClientImportTests(CRMTestCase):
+    """Импорт клиентов: сопоставление по телефону и повторы в файле"""
+
+    CSV = (
+        'ФИО;Телефон;Email;Заметки\n'
+        'Иван Петров;8 900 111-22-33;ivan@example.com;\n'
+        'Анна Смирнова;+79004445566;;постоянный клиент\n'
+        ';+79005550000;;\n'
+        'Анна С.;9004445566;anna@example.com;\n'
+        'Петр Волков;+79007778899;не-email;\n'
+    )
+
+    def setUp(self):
+        super().setUp()
+        self.ivan = Client.objects.create(name='Иван', phone='+79001112233',
+                                          notes='звонить вечером')
+
+    def upload(self, content, name='clients.csv', **data):
+        with self.commit():
+            return self.client.post(reverse('import_clients'), {
+                'file': SimpleUploadedFile(name, content), **data}).json()
+
+    def test_csv_upload_upserts_by_phone(self):
+        report = self.upload(self.CSV.encode('cp1251'))
+        self.assertEqual(
+            {key: report[key] for key in ('rows', 'created', 'updated',
+                                          'duplicates', 'skipped')},
+            {'rows': 5, 'created': 1, 'updated': 1, 'duplicates': 1,
+             'skipped': 2})
+        self.assertEqual(len(report['errors']), 2)
+
+        self.ivan.refresh_from_db()
+        self.assertEqual(
+            (self.ivan.name, self.ivan.email, self.ivan.notes),
+            ('Иван Петров', 'ivan@example.com', 'звонить вечером'))
+        anna = Client.objects.get(phone_suffix='9004445566')
+        self.assertEqual((anna.name, anna.email, anna.notes),
+                         ('Анна С.', 'anna@example.com',
+                          'постоянный клиент'))
+
+        # Повторный импорт ничего не дублирует
+        report = self.upload(self.CSV.encode('utf-8-sig'))
+        self.assertEqual((report['created'], report['unchanged']), (0, 2))
+        self.assertEqual(Client.objects.count(), 2)
+
+    def test_command_batches_and_no_update(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'clients.csv')
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write(self.CSV)
+            out = StringIO()
+            with self.commit():
+                call_command('import_clients', path, '--batch-size', '1',
+                             '--no-update', stdout=out)
+        self.assertIn('Создано: 1, обновлено: 0, без изменений: 1, '
+                      'повторов в файле: 1, пропущено: 2', out.getvalue())
+        self.ivan.refresh_from_db()
+        self.assertEqual(self.ivan.name, 'Иван')
+
+    def test_export_imports_back_unchanged(self):
+        Client.objects.create(name='Анна Смирнова', phone='+79004445566',
+                              email='anna@example.com')
+        response = self.client.get(reverse('export_clients', args=['xlsx']))
+        report = self.upload(b''.join(response.streaming_content),
+                             name='clients.xlsx')
+        self.assertEqual((report['rows'], report['unchanged'],
+                          report['skipped']), (2, 2, 0))
+
+        response = self.client.post(reverse('import_clients'), {
+            'file': SimpleUploadedFile('clients.csv', b'name;email\n')})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Телефон', response.json()['errors']['file'])
+
+
+class ClientDealsTestCase(CRMTestCase):
+    """Клиенты со сделками, созданными через ORM с сигналами"""
+
+    def setUp(self):
+        super().setUp()
+        self.service = Service.objects.create(name='Ремонт', price=1000)
+
+    def create_deal(self, client, price, status='new'):
+        now = timezone.now()
+        with self.commit():
+            deal = Deal.objects.create(
+                client=client, status=status, start_date=now,
+                end_date=now + timedelta(days=7))
+            DealService.objects.create(deal=deal, service=self.service,
+                                       price=price)
+        return deal
+
+
+class ClientDedupeTests(ClientDealsTestCase):
+    """Поиск кластеров дублей и слияние с переносом сделок"""
+
+    def setUp(self):
+        super().setUp()
+        self.ivan = Client.objects.create(name='Иван Петров',
+                                          phone='+79001112233')
+        # Тот же номер в другом формате
+        self.ivan_copy = Client.objects.create(
+            name='Петров Иван', phone='8 900 111 22 33',
+            email='IVAN@example.com')
+        # Тот же email и имя: связан с кластером через второго
+        self.ivan_email = Client.objects.create(
+            name='иван петров', phone='+79990000000',
+            email='ivan@example.com', notes='рабочий')
+        # Номер без кода города и то же имя
+        self.ivan_short = Client.objects.create(name='Петров Иван',
+                                                phone='1112233')
+        # Общий email, но другое имя - не дубль
+        self.anna = Client.objects.create(name='Анна Петрова',
+                                          phone='+79004445566',
+                                          email='ivan@example.com')
+
+    def test_find_clusters(self):
+        clusters, oversized = find_duplicate_clusters()
+        self.assertEqual(clusters, [[
+            self.ivan.pk, self.ivan_copy.pk, self.ivan_email.pk,
+            self.ivan_short.pk]])
+        self.assertEqual(oversized, [])
+
+    def test_merge_moves_deals_and_fills_fields(self):
+        self.create_deal(self.ivan, 1000, status='successful')
+        self.create_deal(self.ivan_copy, 300)
+        self.create_deal(self.ivan_email, 200)
+
+        clusters, _ = find_duplicate_clusters()
+        with self.commit():
+            self.assertEqual(merge_cluster(clusters[0]), (1, 3))
+
+        self.assertEqual(
+            list(Client.objects.order_by('id').values_list('pk', flat=True)),
+            [self.ivan.pk, self.anna.pk])
+        self.ivan.refresh_from_db()
+        self.assertEqual(
+            (self.ivan.email, self.ivan.notes, self.ivan.deals_count,
+             self.ivan.active_deals_count, self.ivan.total_spent),
+            ('IVAN@example.com', 'рабочий', 3, 2, 1000))
+        self.assertEqual(
+            set(Deal.objects.values_list('client_id', flat=True)),
+            {self.ivan.pk})
+
+    def test_dry_run_changes_nothing(self):
+        out = StringIO()
+        call_command('dedupe_clients', '--dry-run', stdout=out)
+        self.assertIn('Кластеров: 1, дублей: 3', out.getvalue())
+        self.assertEqual(Client.objects.count(), 5)
+
+        with self.commit():
+            call_command('dedupe_clients', stdout=StringIO())
+        self.assertEqual(Client.objects.count(), 2)
+
+
+class ClientStatsTests(ClientDealsTestCase):
+    """Счетчики сделок клиента поддерживаются сигналами сделок"""
+
+    def setUp(self):
+        super().setUp()
+        self.ivan = Client.objects.create(name='Иван Петров',
+                                          phone='+79001112233')
+        self.anna = Client.objects.create(name='Анна Смирнова',
+                                          phone='+79004445566')
+
+    def assert_stats(self, client, deals_count, active_deals_count,
+                     total_spent):
+        client.refresh_from_db()
+        self.assertEqual(
+            (client.deals_count, client.active_deals_count,
+             client.total_spent),
+            (deals_count, active_deals_count, Decimal(total_spent)))
+
+    def assert_in_sync(self):
+        out = StringIO()
+        call_command('rebuild_client_stats', '--check', stdout=out)
+        self.assertIn('расхождений: 0', out.getvalue())
+
+    def test_counters_follow_deal_changes(self):
+        first = self.create_deal(self.ivan, 1000, status='successful')
+        second = self.create_deal(self.ivan, 500)
+        self.assert_stats(self.ivan, 2, 1, '1000')
+        self.assertEqual(self.ivan.last_deal_at, second.created_at)
+        self.assertEqual(list(self.ivan.get_active_deals()), [second])
+
+        with self.commit():
+            second.status = 'successful'
+            second.save(update_fields=['status', 'updated_at'])
+        self.assert_stats(self.ivan, 2, 0, '1500')
+
+        with self.commit():
+            # Свежий экземпляр: полное сохранение пишет и поле total
+            first = Deal.objects.get(pk=first.pk)
+            first.client = self.anna
+            first.save()
+        self.assert_stats(self.ivan, 1, 0, '500')
+        self.assert_stats(self.anna, 1, 0, '1000')
+
+        with self.commit():
+            second.delete()
+        self.assert_stats(self.ivan, 0, 0, '0')
+        self.assertIsNone(self.ivan.last_deal_at)
+        self.assert_in_sync()
+
+    def test_client_save_keeps_counters(self):
+        self.create_deal(self.ivan, 1000, status='successful')
+        client = Client.objects.get(pk=self.ivan.pk)
+        Client.objects.filter(pk=client.pk).update(deals_count=0)
+        # Обычное сохранение не перезаписывает счетчики устаревшими
+        client.name = 'Иван Сергеевич Петров'
+        client.save()
+        self.assert_stats(self.ivan, 0, 0, '1000')
+
+    def test_check_reports_and_fix_repairs_stale_counters(self):
+        self.create_deal(self.ivan, 1000, status='successful')
+        Client.objects.filter(pk=self.ivan.pk).update(total_spent=1)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_client_stats', '--check', stdout=StringIO())
+
+        call_command('rebuild_client_stats', stdout=StringIO())
+        self.assert_stats(self.ivan, 1, 0, '1000')
+        self.assert_in_sync()
+
+    def test_filters_and_sorting_use_counters(self):
+        self.create_deal(self.ivan, 1000, status='successful')
+        self.create_deal(self.anna, 300)
+        without_deals = Client.objects.create(name='Без сделок',
+                                              phone='+79007778899')
+
+        clients, _ = filter_clients(Client.objects.all(), {'deals': 'active'})
+        self.assertEqual(list(clients), [self.anna])
+
+        clients, _ = filter_clients(Client.objects.all(),
+                                    {'deals': 'with_deals',
+                                     'min_spent': '500'})
+        self.assertEqual(list(clients), [self.ivan])
+
+        response = self.client.get(reverse('contacts'), {'sort': 'spent'})
+        # При равной сумме - сначала новые клиенты
+        self.assertEqual(list(response.context['clients']),
+                         [self.ivan, without_deals, self.anna])
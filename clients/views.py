@@ -1,54 +1,118 @@
 from django.shortcuts import render, get_object_or_404, redirect
+from django.core.exceptions import ValidationError
 from django.http import JsonResponse
+from django.utils import timezone
+from core.export import export_response
+from core.imports import detect_format, read_rows
+from core.pagination import KeysetPaginator, requested_count_mode
+from core.routers import use_read_database
+from .export import (CLIENT_EXPORT_HEADER, CLIENT_SORT_ORDERINGS,
+                     client_export_rows, filter_clients)
+from .imports import import_client_rows
 from .models import Client
+from .phones import PHONE_SUFFIX_LENGTH, normalize_phone, phone_suffix
 
 
+@use_read_database
 def client_detail(request, client_id):
-    """Детальная страница клиента"""
-    client = get_object_or_404(
-        Client.objects.prefetch_related(
-            'deals__services', 'deals__dealservice_set'),
-        id=client_id
-    )
+    """Детальная страница клиента.
 
-    deals = client.deals.all().select_related('client').prefetch_related(
-        'services', 'dealservice_set'
-    ).order_by('-created_at')
+    Итоги по сделкам - сохраненные счетчики клиента (clients.stats),
+    сделки с услугами загружаются двумя запросами.
+    """
+    client = get_object_or_404(Client, id=client_id)
+
+    deals = client.deals.prefetch_related(
+        'dealservice_set__service').order_by('-created_at')
 
     context = {
         'client': client,
         'deals': deals,
-        'total_deals': deals.count(),
-        'total_spent': sum(
-            deal.total_price for deal in deals if deal.status
-            in ['completed', 'successful']),
-        'active_deals': deals.exclude(
-            status__in=['completed', 'cancelled', 'successful', 'closed']
-            ).count(),
+        'total_deals': client.deals_count,
+        'total_spent': client.total_spent,
+        'active_deals': client.active_deals_count,
     }
 
     return render(request, 'client_detail.html', context)
 
 
+@use_read_database
 def client_deals(request, client_id):
     """Страница со сделками клиента"""
     client = get_object_or_404(Client, id=client_id)
 
     deals = client.deals.all().select_related('client').prefetch_related(
         'services', 'dealservice_set'
-    ).order_by('-created_at')
+    )
+    page_obj = KeysetPaginator(
+        deals, ('-created_at', '-id'), per_page=25,
+        count=requested_count_mode(request)
+    ).get_page(request.GET.get('cursor'))
 
     context = {
         'client': client,
-        'deals': deals,
+        'deals': page_obj,
     }
     return render(request, 'client_deals.html', context)
 
 
+@use_read_database
 def contacts(request):
-    """Страница контактов"""
-    clients = Client.objects.all().order_by('name')
-    return render(request, 'contacts.html', {'clients': clients})
+    """Страница контактов: сортировки и фильтры по счетчикам сделок"""
+    clients, filters = filter_clients(Client.objects.all(), request.GET)
+    page_obj = KeysetPaginator(
+        clients, CLIENT_SORT_ORDERINGS[filters['sort_by']], per_page=48,
+        count=requested_count_mode(request)
+    ).get_page(request.GET.get('cursor'))
+
+    # Параметры фильтров для ссылок пагинации и выгрузки
+    filter_query = request.GET.copy()
+    filter_query.pop('cursor', None)
+
+    return render(request, 'contacts.html', {
+        'clients': page_obj,
+        'filter_query': filter_query.urlencode(),
+        **filters,
+    })
+
+
+@use_read_database
+def export_clients(request, export_format):
+    """Выгрузка клиентов в CSV или XLSX с фильтрами страницы контактов"""
+    clients, filters = filter_clients(Client.objects.all(), request.GET)
+    rows = client_export_rows(clients, filters['sort_by'])
+    return export_response(export_format, CLIENT_EXPORT_HEADER, rows,
+                           f'clients_{timezone.now():%Y%m%d}')
+
+
+def import_clients(request):
+    """Импорт клиентов из загруженного CSV или XLSX"""
+    if request.method != 'POST':
+        return JsonResponse({
+            'success': False,
+            'errors': {'general': 'Неверный метод запроса'}
+        }, status=405)
+
+    upload = request.FILES.get('file')
+    if upload is None:
+        return JsonResponse({
+            'success': False,
+            'errors': {'file': 'Выберите файл'}
+        }, status=400)
+
+    import_format = detect_format(
+        upload.name, default=request.POST.get('format'))
+    try:
+        report = import_client_rows(
+            read_rows(upload, import_format),
+            update_existing=request.POST.get('update', '1') != '0')
+    except ValidationError as e:
+        return JsonResponse({
+            'success': False,
+            'errors': {'file': e.messages[0]}
+        }, status=400)
+
+    return JsonResponse({'success': True, **report})
 
 
 def create_client(request):
@@ -60,6 +124,19 @@ def create_client(request):
             email = request.POST.get('email')
             notes = request.POST.get('notes')
 
+            # Тот же номер в другой записи - дубль (см. dedupe_clients)
+            suffix = phone_suffix(normalize_phone(phone))
+            existing = None
+            if len(suffix) == PHONE_SUFFIX_LENGTH:
+                existing = Client.objects.filter(
+                    phone_suffix=suffix).order_by('id').first()
+            if existing is not None:
+                return JsonResponse({
+                    'success': False,
+                    'errors': {'phone': (
+                        f'Клиент с этим телефоном уже есть: {existing.name}')}
+                }, status=400)
+
             client = Client.objects.create(
                 name=name,
                 phone=phone,
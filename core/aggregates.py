@@ -0,0 +1,32 @@
+from django.db.models import Aggregate, JSONField, TextField, Value
+
+
+class GroupConcat(Aggregate):
+    """Склейка значений группы в строку через separator.
+
+    SQLite: group_concat, PostgreSQL: string_agg.
+    Порядок значений внутри строки не гарантируется.
+    """
+    function = 'GROUP_CONCAT'
+    output_field = TextField()
+
+    def __init__(self, expression, separator=', ', **extra):
+        super().__init__(expression, Value(separator), **extra)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler, connection, function='STRING_AGG', **extra_context)
+
+
+class JSONGroupArray(Aggregate):
+    """JSON-массив значений группы (например JSONObject) одной строкой.
+
+    SQLite: json_group_array, PostgreSQL: jsonb_agg.
+    Порядок элементов не гарантируется.
+    """
+    function = 'JSON_GROUP_ARRAY'
+    output_field = JSONField()
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler, connection, function='JSONB_AGG', **extra_context)
@@ -1,24 +1,74 @@
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponseNotAllowed
 from django.db.models import Q
+from django.core.exceptions import ValidationError
 from clients.models import Client
+from clients.phones import (normalize_phone, phone_suffix,
+                            phone_search_prefix, PHONE_SUFFIX_LENGTH,
+                            PHONE_PREFIX_MIN_LENGTH)
 from price.models import Service
+from deals.api import (deal_detail_json, deals_page, parse_fields,
+                       parse_limit)
+from deals.bulk import create_deals, update_deal_statuses
+from deals.cards import FRAGMENT_NAMES
+from deals.dashboard import dashboard_etag, aload_dashboard_json
+from core.cache import (cache_stats, acached_bundle,
+                        fragment_counter_name)
+from core.conditional import conditional_get
+from core.pagination import requested_count_mode
+from core.routers import use_read_database
+from statistic.rollups import PERIOD_MONTHS
+from statistic.views import (STATISTICS_DEPENDENCIES, statistics_etag,
+                             aload_statistics_summary)
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.gzip import gzip_page
 from django.views.decorators.http import require_http_methods
 import json
 
 
-def find_client_api(request):
-    """API для поиска клиента по телефону"""
+def client_phone_lookup(phone):
+    """QuerySet поиска клиента по индексированным нормализованным полям
+    телефона (первая запись - найденный клиент) или None"""
+    normalized = normalize_phone(phone)
+    if len(normalized) >= PHONE_SUFFIX_LENGTH:
+        # Полный номер: точное совпадение или совпадение без кода страны
+        return Client.objects.filter(
+            Q(phone_normalized=normalized) |
+            Q(phone_suffix=phone_suffix(normalized))
+        ).order_by('id')
+
+    prefix = phone_search_prefix(phone)
+    if len(prefix) < PHONE_PREFIX_MIN_LENGTH:
+        return None
+    # Частичный ввод: диапазон по индексу вместо LIKE '%...%'
+    # (':' идет в ASCII сразу после '9')
+    return Client.objects.filter(
+        phone_normalized__gte=prefix,
+        phone_normalized__lt=prefix + ':'
+    ).order_by('phone_normalized')
+
+
+def find_client_by_phone(phone):
+    """Поиск клиента по телефону"""
+    clients = client_phone_lookup(phone)
+    return clients.first() if clients is not None else None
+
+
+async def afind_client_by_phone(phone):
+    """Поиск клиента по телефону (асинхронный ORM)"""
+    clients = client_phone_lookup(phone)
+    return await clients.afirst() if clients is not None else None
+
+
+@use_read_database
+async def find_client_api(request):
+    """API для поиска клиента по телефону (асинхронное, для автодополнения)"""
     phone = request.GET.get('phone', '').strip()
 
     if not phone:
         return JsonResponse({'success': False, 'message': 'Не указан телефон'})
 
     try:
-        # Ищем клиента по точному совпадению телефона
-        client = Client.objects.filter(
-            Q(phone=phone) | Q(phone__contains=phone)
-        ).first()
+        client = await afind_client_by_phone(phone)
 
         if client:
             return JsonResponse({
@@ -64,6 +114,196 @@ def create_service_api(request):
             'error': str(e)
         }, status=400)
 
+# Максимальное количество сделок в одном пакетном запросе
+DEALS_BATCH_LIMIT = 500
+
+# Максимальное количество изменений статуса в одном запросе
+DEAL_STATUS_BATCH_LIMIT = 500
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def create_deals_batch_api(request):
+    """API для пакетного создания сделок одной транзакцией"""
+    try:
+        data = json.loads(request.body)
+        deals_data = data.get('deals') if isinstance(data, dict) else None
+
+        if not deals_data or not isinstance(deals_data, list):
+            return JsonResponse({
+                'success': False,
+                'error': 'Не переданы сделки'
+            }, status=400)
+        if len(deals_data) > DEALS_BATCH_LIMIT:
+            return JsonResponse({
+                'success': False,
+                'error': f'Не более {DEALS_BATCH_LIMIT} сделок за запрос'
+            }, status=400)
+
+        deals = create_deals(deals_data)
+
+        return JsonResponse({
+            'success': True,
+            'deal_ids': [deal.id for deal in deals],
+            'message': f'Создано сделок: {len(deals)}'
+        })
+
+    except json.JSONDecodeError:
+        return JsonResponse({
+            'success': False,
+            'error': 'Неверный формат JSON'
+        }, status=400)
+    except ValidationError as e:
+        return JsonResponse({
+            'success': False,
+            'errors': getattr(e, 'message_dict', None) or e.messages
+        }, status=400)
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=400)
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def update_deal_statuses_api(request):
+    """API для массовой смены статусов сделок (канбан)"""
+    try:
+        data = json.loads(request.body)
+        changes = data.get('changes') if isinstance(data, dict) else None
+
+        if not changes or not isinstance(changes, list):
+            return JsonResponse({
+                'success': False,
+                'error': 'Не переданы изменения'
+            }, status=400)
+        if len(changes) > DEAL_STATUS_BATCH_LIMIT:
+            return JsonResponse({
+                'success': False,
+                'error': f'Не более {DEAL_STATUS_BATCH_LIMIT} изменений '
+                         f'за запрос'
+            }, status=400)
+
+        results = update_deal_statuses(changes)
+        updated = sum(1 for result in results if result.get('changed'))
+
+        return JsonResponse({
+            'success': all(result['success'] for result in results),
+            'results': results,
+            'message': f'Обновлено сделок: {updated}'
+        })
+
+    except json.JSONDecodeError:
+        return JsonResponse({
+            'success': False,
+            'error': 'Неверный формат JSON'
+        }, status=400)
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=400)
+
+
+# Компактный JSON для часто опрашиваемых API
+COMPACT_JSON = {'separators': (',', ':'), 'ensure_ascii': False}
+
+
+def _method_not_allowed(request):
+    if request.method not in ('GET', 'HEAD'):
+        # require_http_methods в Django 4.2 не работает с async view
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+    return None
+
+
+@use_read_database
+@conditional_get(dashboard_etag)
+async def dashboard_api(request):
+    """API канбана (колонки, счетчики, просроченные) с ETag"""
+    not_allowed = _method_not_allowed(request)
+    if not_allowed:
+        return not_allowed
+    data = await aload_dashboard_json()
+    return JsonResponse(
+        {'success': True, **data}, json_dumps_params=COMPACT_JSON)
+
+
+@use_read_database
+@conditional_get(statistics_etag)
+async def statistics_api(request):
+    """API агрегатов статистики с ETag (запросы выполняются параллельно)"""
+    not_allowed = _method_not_allowed(request)
+    if not_allowed:
+        return not_allowed
+    data = await acached_bundle(
+        'statistics_api', STATISTICS_DEPENDENCIES, aload_statistics_summary)
+    return JsonResponse(
+        {'success': True, **data}, json_dumps_params=COMPACT_JSON)
+
+
+def _deal_api_params(request):
+    """Поля ответа и размер страницы из запроса"""
+    return (parse_fields(request.GET.get('fields')),
+            parse_limit(request.GET.get('limit')))
+
+
+@gzip_page
+@use_read_database
+@require_http_methods(["GET", "HEAD"])
+def deals_api(request):
+    """API списка сделок: фильтры страницы всех сделок, выбор полей
+    (?fields=), курсорная пагинация (?cursor=, ?limit=, ?count=)"""
+    try:
+        fields, limit = _deal_api_params(request)
+    except ValidationError as e:
+        return JsonResponse({'success': False, 'error': e.messages[0]},
+                            status=400)
+
+    page = deals_page(request.GET, fields, limit,
+                      count=requested_count_mode(request))
+    data = {
+        'success': True,
+        'deals': page.object_list,
+        'next_cursor': page.next_cursor,
+        'previous_cursor': page.previous_cursor,
+    }
+    if page.count is not None:
+        data['count'] = page.count
+        data['count_is_estimate'] = page.count_is_estimate
+    return JsonResponse(data, json_dumps_params=COMPACT_JSON)
+
+
+@gzip_page
+@use_read_database
+@require_http_methods(["GET", "HEAD"])
+def deal_detail_api(request, deal_id):
+    """API одной сделки (поля - как в списке)"""
+    try:
+        fields, _ = _deal_api_params(request)
+    except ValidationError as e:
+        return JsonResponse({'success': False, 'error': e.messages[0]},
+                            status=400)
+
+    deal = deal_detail_json(deal_id, fields)
+    if deal is None:
+        return JsonResponse({'success': False, 'error': 'Сделка не найдена'},
+                            status=404)
+    return JsonResponse({'success': True, 'deal': deal},
+                        json_dumps_params=COMPACT_JSON)
+
+
+def cache_stats_api(request):
+    """API со счетчиками попаданий в кеш агрегатов и фрагментов"""
+    names = ['dashboard', 'statistics', 'statistics_api'] + [
+        f'statistics_{period}' for period in PERIOD_MONTHS]
+    fragments = cache_stats([
+        fragment_counter_name(name) for name in FRAGMENT_NAMES])
+    return JsonResponse({
+        'success': True,
+        'bundles': cache_stats(names),
+        'fragments': fragments,
+    })
+
 ''' Пока ненужно не работает
 @csrf_exempt
 @require_http_methods(["GET", "PUT", "DELETE"])
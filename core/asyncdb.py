@@ -0,0 +1,31 @@
+"""Параллельные запросы к БД из асинхронных view.
+
+Асинхронный ORM Django 4.2 выполняет запросы одного запроса
+последовательно в общем потоке, поэтому asyncio.gather по ним ничего
+не ускоряет. run_parallel запускает независимые функции с запросами
+каждую в своем потоке пула со своим соединением и закрывает его
+после выполнения. Функции должны только читать данные и возвращать
+готовые значения (list(), aggregate), а не ленивые QuerySet.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.db import connections
+
+
+def _with_own_connection(func):
+    def wrapper():
+        try:
+            return func()
+        finally:
+            # Соединения потока пула не закрываются по request_finished
+            connections.close_all()
+    return wrapper
+
+
+async def run_parallel(*funcs):
+    """Результаты funcs() в том же порядке, запросы выполняются параллельно"""
+    return await asyncio.gather(*(
+        sync_to_async(_with_own_connection(func), thread_sensitive=False)()
+        for func in funcs
+    ))
@@ -0,0 +1,201 @@
+"""Кеширование агрегатов с версиями данных.
+
+Для каждой модели в кеше хранится номер версии данных, который
+увеличивается после коммита любых изменений (сигналы в deals.signals).
+Ключ закешированного набора агрегатов включает версии всех моделей,
+от которых он зависит, поэтому после изменения данных старый набор
+просто перестает запрашиваться. Работает с любым бэкендом кеша Django;
+с общим бэкендом (файловый, БД, memcached) результаты видят все процессы.
+Версии меняются после коммита в основной базе, поэтому и данные для
+кеша читаются из нее (core.routers.read_from_primary), а не из реплики.
+
+Так же кешируются HTML-фрагменты отдельных объектов (cached_fragments):
+ключ включает id и updated_at объекта, фрагменты страницы читаются
+и записываются одним запросом к кешу. Для них можно задать отдельный
+кеш 'fragments' (например, в памяти процесса): версии, входящие
+в ключ, все равно берутся из общего кеша по умолчанию.
+"""
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache, caches
+
+from .deferred import defer_on_commit
+from .routers import read_from_primary
+
+
+VERSION_KEY = 'crm:version:{}'
+BUNDLE_KEY = 'crm:bundle:{}:{}'
+COUNTER_KEY = 'crm:counter:{}:{}'
+FRAGMENT_KEY = 'crm:fragment:{}:{}:{}:{}'
+
+# Время жизни наборов агрегатов по умолчанию (секунды)
+BUNDLE_TIMEOUT = 300
+
+# Время жизни фрагментов: устаревшие ключи просто вытесняются
+FRAGMENT_TIMEOUT = 24 * 3600
+
+# Кеш фрагментов: отдельный, если настроен
+FRAGMENT_CACHE = 'fragments'
+
+# Имена наборов, по которым собирается статистика попаданий
+_bundle_names = set()
+
+_missing = object()
+
+
+def _initial_version():
+    # Версия от времени: если ключ версии вытеснен из кеша,
+    # новая версия не совпадет со старыми наборами
+    return int(time.time() * 1000)
+
+
+def get_versions(labels):
+    """Текущие версии данных для списка моделей"""
+    keys = {VERSION_KEY.format(label): label for label in labels}
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _initial_version(), timeout=None)
+            versions[key] = cache.get(key)
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def bump_versions(labels):
+    """Увеличение версий данных (старые наборы становятся недоступны)"""
+    for label in labels:
+        key = VERSION_KEY.format(label)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _initial_version(), timeout=None)
+
+
+def bump_versions_on_commit(labels):
+    """Увеличение версий после коммита текущей транзакции"""
+    defer_on_commit('cache_versions', labels, bump_versions)
+
+
+def _count(name, kind, delta=1):
+    key = COUNTER_KEY.format(name, kind)
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        if not cache.add(key, delta, timeout=None):
+            cache.incr(key, delta)
+
+
+def cached_bundle(name, labels, builder, timeout=BUNDLE_TIMEOUT):
+    """Набор агрегатов name, зависящий от моделей labels.
+
+    builder вызывается только если набора для текущих версий нет в кеше.
+    """
+    key, value = _lookup_bundle(name, labels)
+    if value is _missing:
+        with read_from_primary():
+            value = builder()
+        cache.set(key, value, timeout)
+    return value
+
+
+async def acached_bundle(name, labels, builder, timeout=BUNDLE_TIMEOUT):
+    """cached_bundle для асинхронных view: builder - корутинная функция"""
+    key, value = await sync_to_async(_lookup_bundle)(name, labels)
+    if value is _missing:
+        with read_from_primary():
+            value = await builder()
+        await cache.aset(key, value, timeout)
+    return value
+
+
+def _lookup_bundle(name, labels):
+    """Ключ набора для текущих версий и значение из кеша (или _missing)"""
+    _bundle_names.add(name)
+    versions = get_versions(labels)
+    version = '.'.join(str(versions[label]) for label in sorted(labels))
+    key = BUNDLE_KEY.format(name, version)
+
+    value = cache.get(key, _missing)
+    _count(name, 'hits' if value is not _missing else 'misses')
+    return key, value
+
+
+def _fragment_cache():
+    if FRAGMENT_CACHE in settings.CACHES:
+        return caches[FRAGMENT_CACHE]
+    return cache
+
+
+def fragment_counter_name(name):
+    """Имя счетчиков попаданий для фрагментов name"""
+    return f'fragment:{name}'
+
+
+def cached_fragments(name, versions, render_missing, labels=(),
+                     timeout=FRAGMENT_TIMEOUT):
+    """HTML-фрагменты name по объектам: {pk: html}.
+
+    versions - {pk: updated_at} объектов страницы, labels - модели,
+    данные которых выводятся во фрагменте, но не меняют updated_at.
+    render_missing(pks) рендерит отсутствующие в кеше фрагменты
+    и возвращает {pk: html}.
+    """
+    if not versions:
+        return {}
+    data_version = '.'.join(
+        str(version) for _, version in sorted(get_versions(labels).items()))
+    keys = {
+        FRAGMENT_KEY.format(name, data_version, pk,
+                            int(updated_at.timestamp() * 1000000)): pk
+        for pk, updated_at in versions.items()
+    }
+    fragment_cache = _fragment_cache()
+    found = fragment_cache.get_many(keys)
+    fragments = {keys[key]: html for key, html in found.items()}
+
+    missing = [pk for pk in versions if pk not in fragments]
+    if missing:
+        if labels:
+            # Ключ включает версии labels основной базы
+            with read_from_primary():
+                rendered = render_missing(missing)
+        else:
+            rendered = render_missing(missing)
+        fragments.update(rendered)
+        fragment_cache.set_many({
+            key: rendered[pk] for key, pk in keys.items()
+            if pk in rendered
+        }, timeout)
+
+    counter = fragment_counter_name(name)
+    _bundle_names.add(counter)
+    if found:
+        _count(counter, 'hits', len(found))
+    if missing:
+        _count(counter, 'misses', len(missing))
+    return fragments
+
+
+def cache_stats(names=None):
+    """Счетчики попаданий и промахов по наборам агрегатов.
+
+    Без names - наборы, которые запрашивались в этом процессе.
+    """
+    names = sorted(names or _bundle_names)
+    keys = [
+        COUNTER_KEY.format(name, kind)
+        for name in names for kind in ('hits', 'misses')
+    ]
+    counters = cache.get_many(keys)
+    stats = {}
+    for name in names:
+        hits = counters.get(COUNTER_KEY.format(name, 'hits'), 0)
+        misses = counters.get(COUNTER_KEY.format(name, 'misses'), 0)
+        total = hits + misses
+        stats[name] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / total, 3) if total else None,
+        }
+    return stats
@@ -0,0 +1,82 @@
+"""Условные GET-запросы (ETag) для часто опрашиваемых страниц и API.
+
+ETag считается по отпечатку данных, общему для всех процессов:
+id последнего события ленты сделок (deals.events), количество строк
+и max updated_at небольших таблиц, агрегаты по индексам. Отпечаток -
+несколько дешевых запросов вместо полного набора запросов страницы;
+если он совпал с If-None-Match, клиент получает 304 Not Modified,
+а view не вызывается.
+"""
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from django.views.decorators.http import condition
+
+
+def model_fingerprint(model, queryset=None, **aggregates):
+    """Отпечаток данных небольшой таблицы с полем updated_at:
+    количество строк и последнее изменение.
+
+    aggregates - дополнительные агрегаты, считаются тем же запросом.
+    """
+    if queryset is None:
+        queryset = model._default_manager.all()
+    fingerprint = queryset.order_by().aggregate(
+        count=Count('pk'), last=Max('updated_at'), **aggregates)
+    return sorted(fingerprint.items())
+
+
+def make_etag(*parts):
+    """Сильный ETag по частям отпечатка"""
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def csrf_cookie(request):
+    """CSRF cookie запроса: страницы с формой зависят от него"""
+    return request.COOKIES.get(settings.CSRF_COOKIE_NAME)
+
+
+def conditional_get(etag_func):
+    """Декоратор view: ETag от etag_func(request, *args, **kwargs),
+    ответ 304 при совпадении с If-None-Match.
+
+    Поддерживает и асинхронные view (condition в Django 4.2 - только
+    синхронные): etag_func тогда выполняется через sync_to_async.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            return _async_conditional(view, etag_func)
+
+        conditional_view = condition(etag_func=etag_func)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            # Браузер кеширует ответ, но проверяет его при каждом запросе
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
+
+
+def _async_conditional(view, etag_func):
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        etag = None
+        response = None
+        if request.method in ('GET', 'HEAD'):
+            etag = quote_etag(
+                await sync_to_async(etag_func)(request, *args, **kwargs))
+            response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = await view(request, *args, **kwargs)
+        if etag:
+            response.headers.setdefault('ETag', etag)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+    return wrapper
@@ -0,0 +1,27 @@
+import threading
+
+from django.db import transaction
+
+
+_pending = threading.local()
+
+
+def defer_on_commit(name, values, flush):
+    """Накопление значений до коммита транзакции.
+
+    Все значения, добавленные под одним именем в пределах транзакции,
+    передаются в flush одним набором после коммита. Вне транзакции
+    flush вызывается сразу. Если транзакция откатилась, значения
+    будут обработаны при следующем коммите (flush должен быть
+    идемпотентным и брать актуальные данные из БД).
+    """
+    store = _pending.__dict__.setdefault(name, set())
+    store.update(values)
+
+    def run():
+        items = _pending.__dict__.get(name)
+        if items:
+            _pending.__dict__[name] = set()
+            flush(items)
+
+    transaction.on_commit(run)
@@ -3,7 +3,10 @@ from django import forms
 from deals.models import Deal, DealService, Comment
 from clients.models import Client
 from price.models import Service
+from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator
+from django.db import transaction
+from deals.bulk import upsert_client, replace_deal_services
 
 
 class ServiceForm(forms.ModelForm):
@@ -180,50 +183,41 @@ class DealForm(forms.ModelForm):
         client_name = self.cleaned_data['client_name']
         client_phone = self.cleaned_data['client_phone']
 
-        # Создание или поиск клиента
-        client, created = Client.objects.get_or_create(
-            phone=client_phone,
-            defaults={'name': client_name}
-        )
-
-        # Обновление имени если клиент уже существует
-        if not created and client.name != client_name:
-            client.name = client_name
-            client.save()
-
-        # Сохранение сделки
-        deal = super().save(commit=False)
-        deal.client = client
-
-        if commit:
-            deal.save()
-
-            # Обработка услуг
-            services_data = self.cleaned_data.get('services_data')
-            if services_data:
-                import json
-                try:
-                    services_list = json.loads(services_data)
-
-                    # Удаление старых услуг
-                    deal.dealservice_set.all().delete()
-
-                    # Добавление новых услуг
-                    for service_data in services_list:
-                        service_id = service_data.get('service_id')
-                        price = service_data.get('price')
-
-                        if service_id and price:
-                            service = Service.objects.get(id=service_id)
-                            DealService.objects.create(
-                                deal=deal,
-                                service=service,
-                                price=price
-                            )
-
-                except (json.JSONDecodeError, Service.DoesNotExist) as e:
-                    raise forms.ValidationError(
-                        f"Ошибка обработки услуг: {str(e)}")
+        with transaction.atomic():
+            # Создание или поиск клиента с обновлением имени
+            client = upsert_client(client_name, client_phone)
+
+            # Сохранение сделки
+            deal = super().save(commit=False)
+            deal.client = client
+
+            if commit:
+                if deal.pk:
+                    # Без total: стоимость пересчитывается сигналами
+                    # DealService, в объекте она может быть устаревшей
+                    deal.save(update_fields=[
+                        *self._meta.fields, 'client', 'updated_at'])
+                else:
+                    deal.save()
+
+                # Обработка услуг: одно удаление и один bulk_create
+                services_data = self.cleaned_data.get('services_data')
+                if services_data:
+                    import json
+                    try:
+                        items = [
+                            (service_data.get('service_id'),
+                             service_data.get('price'))
+                            for service_data in json.loads(services_data)
+                            if service_data.get('service_id')
+                            and service_data.get('price')
+                        ]
+                        replace_deal_services(deal, items)
+
+                    except (json.JSONDecodeError,
+                            ValidationError) as e:
+                        raise forms.ValidationError(
+                            f"Ошибка обработки услуг: {str(e)}")
 
         return deal
 
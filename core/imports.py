@@ -0,0 +1,246 @@
+"""Потоковое чтение таблиц CSV и XLSX для импорта.
+
+Пара к core.export: строки читаются по одной и отдаются генератором,
+поэтому файл любого размера не загружается в память целиком.
+CSV - UTF-8 (с BOM или без) или cp1251, разделитель ";", "," или
+табуляция определяется по первой строке. XLSX разбирается без
+сторонних библиотек: первый лист читается частями и разбирается
+XMLParser с обработчиком вместо дерева элементов. В памяти остается
+только общая таблица строк книги (sharedStrings), если она есть.
+"""
+import codecs
+import csv
+import io
+import posixpath
+import re
+import zipfile
+from decimal import Decimal, InvalidOperation
+from itertools import chain
+from xml.etree import ElementTree
+
+from django.core.exceptions import ValidationError
+
+
+IMPORT_FORMATS = ('csv', 'xlsx')
+
+# Сколько байт CSV смотреть для определения кодировки
+ENCODING_SAMPLE_SIZE = 64 * 1024
+
+CSV_DELIMITERS = (';', ',', '\t')
+
+# По сколько байт читать лист XLSX
+XLSX_READ_SIZE = 64 * 1024
+
+_RELATIONSHIP_NS = ('http://schemas.openxmlformats.org/officeDocument/'
+                    '2006/relationships')
+_CELL_REF_RE = re.compile(r'([A-Z]+)(\d*)')
+
+
+def detect_format(filename, default=None):
+    """Формат импорта по расширению файла"""
+    extension = posixpath.splitext(filename or '')[1].lower().lstrip('.')
+    return extension if extension in IMPORT_FORMATS else default
+
+
+def read_rows(file, import_format):
+    """Строки таблицы: пары (номер строки в файле, список значений).
+
+    file - бинарный файл с seek (загруженный файл или open(path, 'rb')).
+    Первая строка - заголовок.
+    """
+    if import_format == 'csv':
+        return csv_rows(file)
+    if import_format == 'xlsx':
+        return xlsx_rows(file)
+    raise ValidationError('Неизвестный формат файла')
+
+
+# --- CSV ---
+
+def _detect_encoding(file):
+    sample = file.read(ENCODING_SAMPLE_SIZE)
+    file.seek(0)
+    try:
+        # final=False: обрезанный в конце образца символ - не ошибка
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+    except UnicodeDecodeError:
+        return 'cp1251'
+    return 'utf-8-sig'
+
+
+def _detect_delimiter(line):
+    counts = {delimiter: line.count(delimiter)
+              for delimiter in CSV_DELIMITERS}
+    return max(CSV_DELIMITERS, key=lambda delimiter: counts[delimiter])
+
+
+def csv_rows(file):
+    text = io.TextIOWrapper(file, encoding=_detect_encoding(file),
+                            newline='')
+    try:
+        first_line = text.readline()
+        reader = csv.reader(chain([first_line], text),
+                            delimiter=_detect_delimiter(first_line))
+        for row in reader:
+            yield reader.line_num, row
+    except UnicodeDecodeError:
+        raise ValidationError('Не удалось определить кодировку файла')
+    finally:
+        # Файл закрывает тот, кто его открыл
+        if not text.closed:
+            text.detach()
+
+
+# --- XLSX ---
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def _first_sheet_path(archive):
+    """Путь к первому листу книги (по workbook.xml и связям)"""
+    try:
+        workbook = ElementTree.fromstring(archive.read('xl/workbook.xml'))
+        relations = ElementTree.fromstring(
+            archive.read('xl/_rels/workbook.xml.rels'))
+    except KeyError:
+        return 'xl/worksheets/sheet1.xml'
+
+    sheet = next((element for element in workbook.iter()
+                  if _local_name(element.tag) == 'sheet'), None)
+    if sheet is None:
+        raise ValidationError('В книге нет листов')
+    relation_id = sheet.get(f'{{{_RELATIONSHIP_NS}}}id')
+    for relation in relations:
+        if relation.get('Id') == relation_id:
+            target = relation.get('Target')
+            if target.startswith('/'):
+                return target.lstrip('/')
+            return posixpath.normpath(posixpath.join('xl', target))
+    return 'xl/worksheets/sheet1.xml'
+
+
+def _text(element):
+    """Текст ячейки или строки с форматированием (несколько <t>)"""
+    return ''.join(node.text or '' for node in element.iter()
+                   if _local_name(node.tag) == 't')
+
+
+def _shared_strings(archive):
+    try:
+        stream = archive.open('xl/sharedStrings.xml')
+    except KeyError:
+        return []
+    strings = []
+    with stream:
+        for _, element in ElementTree.iterparse(stream):
+            if _local_name(element.tag) == 'si':
+                strings.append(_text(element))
+                element.clear()
+    return strings
+
+
+def _column_index(ref):
+    match = _CELL_REF_RE.match(ref or '')
+    if not match:
+        return None
+    index = 0
+    for letter in match.group(1):
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index - 1
+
+
+def _number(value):
+    """Число из ячейки без хвоста ".0" и экспоненты:
+    телефон 79001234567 хранится в XLSX как число"""
+    try:
+        number = Decimal(value)
+    except InvalidOperation:
+        return value
+    if number == number.to_integral_value():
+        return str(number.quantize(Decimal(1)))
+    return str(number.normalize())
+
+
+class _SheetReader:
+    """Цель XMLParser для листа: собирает значения ячеек по строкам,
+    не строя дерево элементов"""
+
+    def __init__(self, shared_strings):
+        self.shared_strings = shared_strings
+        self.rows = []
+        self.line_number = 0
+        self.values = None
+        self.cell_type = None
+        self.cell_text = []
+        self.text = None
+
+    def start(self, tag, attrib):
+        name = _local_name(tag)
+        if name == 'row':
+            self.line_number = int(attrib.get('r') or self.line_number + 1)
+            self.values = []
+        elif name == 'c':
+            index = _column_index(attrib.get('r'))
+            if index is not None and index > len(self.values):
+                self.values.extend([''] * (index - len(self.values)))
+            self.cell_type = attrib.get('t', 'n')
+            self.cell_text = []
+        elif name in ('v', 't'):
+            self.text = []
+
+    def data(self, text):
+        if self.text is not None:
+            self.text.append(text)
+
+    def end(self, tag):
+        name = _local_name(tag)
+        if name in ('v', 't'):
+            self.cell_text.append(''.join(self.text))
+            self.text = None
+        elif name == 'c':
+            self.values.append(self._cell_value())
+        elif name == 'row':
+            self.rows.append((self.line_number, self.values))
+
+    def close(self):
+        pass
+
+    def _cell_value(self):
+        value = ''.join(self.cell_text)
+        if self.cell_type == 's' and value:
+            return self.shared_strings[int(value)]
+        if self.cell_type == 'n' and value:
+            return _number(value)
+        return value
+
+
+def xlsx_rows(file):
+    try:
+        archive = zipfile.ZipFile(file)
+    except zipfile.BadZipFile:
+        raise ValidationError('Файл не похож на XLSX')
+
+    with archive:
+        shared_strings = _shared_strings(archive)
+        try:
+            sheet = archive.open(_first_sheet_path(archive))
+        except KeyError:
+            raise ValidationError('В книге нет листов')
+
+        with sheet:
+            reader = _SheetReader(shared_strings)
+            parser = ElementTree.XMLParser(target=reader)
+            try:
+                while True:
+                    data = sheet.read(XLSX_READ_SIZE)
+                    if not data:
+                        break
+                    parser.feed(data)
+                    # Отдаем строки, разобранные из прочитанной части
+                    yield from reader.rows
+                    reader.rows = []
+                parser.close()
+            except ElementTree.ParseError:
+                raise ValidationError('Файл XLSX поврежден')
+            yield from reader.rows
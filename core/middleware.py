@@ -0,0 +1,256 @@
+"""Замеры запросов к БД и времени ответа для каждого запроса.
+
+PerformanceMiddleware подключает execute_wrapper к каждому соединению
+(сигнал connection_created), время шаблонов учитывает бэкенд
+core.template_backend.TimedDjangoTemplates из settings.TEMPLATES.
+Счетчики текущего запроса хранятся в ContextVar, поэтому учитываются
+и запросы из потоков sync_to_async под ASGI. Итог отдается
+в заголовке Server-Timing и одной JSON строкой в логгер crm.perf;
+при превышении бюджета страницы (CRM_PERF['BUDGETS']) пишется warning.
+У потоковых ответов (выгрузки, поток событий) тело формируется после
+отправки заголовков, поэтому они замеряются до конца потока и
+попадают только в лог.
+
+Настройки (settings.CRM_PERF):
+    ENABLED - включить замеры (по умолчанию True)
+    SERVER_TIMING - отдавать заголовок Server-Timing (по умолчанию True)
+    DUPLICATE_THRESHOLD - с какого числа одинаковых запросов
+        считать их повторами (N+1), по умолчанию 3
+    BUDGETS - {'имя url': {'queries': 10, 'time_ms': 500}}
+"""
+import json
+import logging
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+
+logger = logging.getLogger('crm.perf')
+
+# Метрики текущего запроса (None вне запроса)
+_current = ContextVar('crm_perf_metrics', default=None)
+
+# Сколько символов SQL писать в лог для повторяющихся запросов
+SQL_PREVIEW_LENGTH = 200
+
+
+def perf_settings():
+    options = {
+        'ENABLED': True,
+        'SERVER_TIMING': True,
+        'DUPLICATE_THRESHOLD': 3,
+        'BUDGETS': {},
+    }
+    options.update(getattr(settings, 'CRM_PERF', {}))
+    return options
+
+
+class RequestMetrics:
+    """Счетчики одного запроса"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_time = 0.0
+        self.queries = 0
+        # SQL приходит с плейсхолдерами, поэтому одинаковый текст -
+        # один и тот же запрос с разными параметрами
+        self.statements = Counter()
+        self.template_time = 0.0
+        self.template_depth = 0
+
+    def duplicates(self, threshold):
+        return [
+            {'sql': sql[:SQL_PREVIEW_LENGTH], 'count': count}
+            for sql, count in self.statements.most_common()
+            if count >= threshold
+        ]
+
+
+def current_metrics():
+    """Метрики текущего запроса или None"""
+    return _current.get()
+
+
+def _record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_time += time.perf_counter() - started
+        metrics.queries += 1
+        metrics.statements[sql] += 1
+
+
+def _attach_recorder(sender=None, connection=None, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def _install_query_recorder():
+    """Учет запросов во всех соединениях, в том числе будущих"""
+    connection_created.connect(
+        _attach_recorder, dispatch_uid='crm_perf_query_recorder')
+    for connection in connections.all(initialized_only=True):
+        _attach_recorder(connection=connection)
+
+
+def timed_render(render, context=None, request=None):
+    """Рендеринг шаблона с учетом времени в метриках текущего запроса.
+
+    Вызывается бэкендом шаблонов core.template_backend.
+    """
+    metrics = _current.get()
+    if metrics is None:
+        return render(context, request)
+    # Вложенный рендеринг (render_to_string внутри шаблона)
+    # уже входит во время внешнего
+    metrics.template_depth += 1
+    started = time.perf_counter()
+    try:
+        return render(context, request)
+    finally:
+        metrics.template_depth -= 1
+        if not metrics.template_depth:
+            metrics.template_time += time.perf_counter() - started
+
+
+class PerformanceMiddleware:
+    """Время ответа, время и количество запросов к БД, время шаблонов"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        options = perf_settings()
+        if not options['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.server_timing = options['SERVER_TIMING']
+        self.duplicate_threshold = options['DUPLICATE_THRESHOLD']
+        self.budgets = options['BUDGETS']
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        _install_query_recorder()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, metrics)
+
+    def _finish(self, request, response, metrics):
+        if response.streaming:
+            # Тело (выгрузка, поток событий) формируется уже после
+            # возврата ответа: замер и лог - по окончании потока
+            response.streaming_content = self._measure_stream(
+                request, response, metrics)
+            return response
+        total_time = time.perf_counter() - metrics.started
+        if self.server_timing:
+            response['Server-Timing'] = self._server_timing(
+                metrics, total_time)
+        self._log(request, response, metrics, total_time)
+        return response
+
+    def _measure_stream(self, request, response, metrics):
+        """streaming_content с учетом запросов, выполненных при его
+        чтении; лог пишется, когда поток закончился или закрыт"""
+        content = response.streaming_content
+        if response.is_async:
+            async def measured():
+                iterator = aiter(content)
+                try:
+                    while True:
+                        token = _current.set(metrics)
+                        try:
+                            chunk = await anext(iterator)
+                        except StopAsyncIteration:
+                            return
+                        finally:
+                            _current.reset(token)
+                        yield chunk
+                finally:
+                    self._log(request, response, metrics,
+                              time.perf_counter() - metrics.started)
+        else:
+            def measured():
+                iterator = iter(content)
+                try:
+                    while True:
+                        token = _current.set(metrics)
+                        try:
+                            chunk = next(iterator)
+                        except StopIteration:
+                            return
+                        finally:
+                            _current.reset(token)
+                        yield chunk
+                finally:
+                    self._log(request, response, metrics,
+                              time.perf_counter() - metrics.started)
+        return measured()
+
+    def _server_timing(self, metrics, total_time):
+        return (
+            f'total;dur={total_time * 1000:.1f}, '
+            f'db;dur={metrics.db_time * 1000:.1f};'
+            f'desc="{metrics.queries} queries", '
+            f'tpl;dur={metrics.template_time * 1000:.1f}'
+        )
+
+    def _log(self, request, response, metrics, total_time):
+        match = request.resolver_match
+        view = match.view_name if match else None
+        record = {
+            'view': view,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round(total_time * 1000, 1),
+            'db_ms': round(metrics.db_time * 1000, 1),
+            'queries': metrics.queries,
+            'template_ms': round(metrics.template_time * 1000, 1),
+        }
+        duplicates = metrics.duplicates(self.duplicate_threshold)
+        if duplicates:
+            record['duplicates'] = duplicates
+
+        exceeded = self._exceeded(self.budgets.get(view), record)
+        if exceeded:
+            record['budget_exceeded'] = exceeded
+            logger.warning(json.dumps(record, ensure_ascii=False))
+        elif logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps(record, ensure_ascii=False))
+
+    def _exceeded(self, budget, record):
+        """Превышенные пункты бюджета страницы"""
+        if not budget:
+            return []
+        exceeded = []
+        if 'queries' in budget and record['queries'] > budget['queries']:
+            exceeded.append('queries')
+        if 'time_ms' in budget and record['total_ms'] > budget['time_ms']:
+            exceeded.append('time_ms')
+        return exceeded
@@ -0,0 +1,236 @@
+"""Курсорная (keyset) пагинация.
+
+Вместо OFFSET и COUNT(*) страница выбирается условием по значениям
+полей сортировки последней показанной строки, поэтому глубокие
+страницы стоят столько же, сколько первая. Курсоры непрозрачны для
+клиента: это base64 от JSON со значениями ключа и направлением.
+"""
+import base64
+import json
+from types import SimpleNamespace
+
+from django.db import connection
+from django.db.models import F, Q
+
+
+class InvalidCursor(ValueError):
+    """Курсор поврежден или не подходит к сортировке"""
+
+
+def encode_cursor(values, direction):
+    payload = json.dumps({'v': values, 'd': direction}, default=str)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if payload['d'] not in ('n', 'p') or not isinstance(
+                payload['v'], list):
+            raise InvalidCursor(cursor)
+        return payload['v'], payload['d']
+    except (ValueError, TypeError, KeyError):
+        raise InvalidCursor(cursor)
+
+
+def estimate_count(queryset):
+    """Примерное количество строк по плану запроса.
+
+    На PostgreSQL берется оценка планировщика (без выполнения запроса),
+    на остальных СУБД оценки нет и возвращается None.
+    """
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def nulls_last_ordering(model, ordering):
+    """Выражения order_by для ordering: NULL в конце при любом
+    направлении (по умолчанию СУБД ставят их по-разному)"""
+    expressions = []
+    for name in ordering:
+        field = model._meta.get_field(name.lstrip('-'))
+        if not field.null:
+            expressions.append(name)
+        elif name.startswith('-'):
+            expressions.append(F(field.name).desc(nulls_last=True))
+        else:
+            expressions.append(F(field.name).asc(nulls_last=True))
+    return expressions
+
+
+def requested_count_mode(request):
+    """Подсчет общего количества: ?count=exact или ?count=estimate"""
+    count = request.GET.get('count')
+    return count if count in ('exact', 'estimate') else None
+
+
+class KeysetPage:
+    """Страница курсорной пагинации"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None,
+                 count=None, count_is_estimate=False):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.count = count
+        self.count_is_estimate = count_is_estimate
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """Курсорная пагинация QuerySet по набору полей сортировки.
+
+    ordering - поля как в order_by(), например ('-created_at', '-id');
+    последнее поле должно быть уникальным. NULL в полях сортировки
+    идут в конце (nulls_last_ordering). count: None - без подсчета,
+    'exact' - COUNT(*), 'estimate' - оценка планировщика.
+    QuerySet может быть и values(): поля сортировки входят в выборку.
+    """
+
+    def __init__(self, queryset, ordering, per_page=25, count=None):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+        self.count_mode = count
+        self.fields = [
+            queryset.model._meta.get_field(name.lstrip('-'))
+            for name in self.ordering
+        ]
+
+    def _terms(self, reverse):
+        """(поле, по убыванию) для прямого или обратного порядка"""
+        return [
+            (field, name.startswith('-') != reverse)
+            for name, field in zip(self.ordering, self.fields)
+        ]
+
+    def _order_by(self, reverse):
+        if not reverse:
+            return nulls_last_ordering(self.queryset.model, self.ordering)
+        # Точно обратный порядок: NULL в начале
+        return [
+            ('-' if descending else '') + field.name if not field.null
+            else F(field.name).desc(nulls_first=True) if descending
+            else F(field.name).asc(nulls_first=True)
+            for field, descending in self._terms(reverse)
+        ]
+
+    def _key(self, obj):
+        if isinstance(obj, dict):
+            # Строка values(): значения по именам полей
+            obj = SimpleNamespace(**obj)
+        return [
+            None if getattr(obj, field.attname) is None
+            else field.value_to_string(obj) if field.get_internal_type()
+            in ('DateTimeField', 'DateField', 'DecimalField')
+            else getattr(obj, field.attname)
+            for field in self.fields
+        ]
+
+    @staticmethod
+    def _greater(field, descending, value, nulls_first):
+        """Строки строго после value по одному полю (None - таких нет)"""
+        if value is None:
+            return Q(**{f'{field.name}__isnull': False}) if (
+                nulls_first) else None
+        lookup = 'lt' if descending else 'gt'
+        condition = Q(**{f'{field.name}__{lookup}': value})
+        if field.null and not nulls_first:
+            condition |= Q(**{f'{field.name}__isnull': True})
+        return condition
+
+    def _after(self, values, reverse):
+        """Условие "строго после values" в прямом или обратном порядке"""
+        condition = Q(pk__in=[])
+        equal = Q()
+        for (field, descending), value in zip(self._terms(reverse), values):
+            step = self._greater(field, descending, value, reverse)
+            if step is not None:
+                condition |= equal & step
+            equal &= Q(**({f'{field.name}__isnull': True} if value is None
+                          else {field.name: value}))
+        field, descending = self._terms(reverse)[0]
+        if field.null:
+            return condition
+        # Граница по первому полю позволяет СУБД начать с поиска по индексу
+        first_lookup = 'lte' if descending else 'gte'
+        return Q(**{f'{field.name}__{first_lookup}': values[0]}) & condition
+
+    def _parse_values(self, values):
+        if len(values) != len(self.fields):
+            raise InvalidCursor(values)
+        try:
+            return [
+                None if value is None else field.to_python(value)
+                for field, value in zip(self.fields, values)
+            ]
+        except Exception:
+            raise InvalidCursor(values)
+
+    def _count(self):
+        if self.count_mode == 'exact':
+            return self.queryset.count(), False
+        if self.count_mode == 'estimate':
+            return estimate_count(self.queryset), True
+        return None, False
+
+    def get_page(self, cursor=None):
+        """Страница после (или перед) курсором; без курсора - первая"""
+        direction = 'n'
+        values = None
+        if cursor:
+            try:
+                raw_values, direction = decode_cursor(cursor)
+                values = self._parse_values(raw_values)
+            except InvalidCursor:
+                # Поврежденный курсор - показываем первую страницу
+                direction, values = 'n', None
+
+        reverse = direction == 'p'
+        queryset = self.queryset.order_by(*self._order_by(reverse))
+        if values is not None:
+            queryset = queryset.filter(self._after(values, reverse))
+
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == 'p':
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if direction == 'n':
+                if has_more:
+                    next_cursor = encode_cursor(self._key(rows[-1]), 'n')
+                if values is not None:
+                    previous_cursor = encode_cursor(self._key(rows[0]), 'p')
+            else:
+                next_cursor = encode_cursor(self._key(rows[-1]), 'n')
+                if has_more:
+                    previous_cursor = encode_cursor(self._key(rows[0]), 'p')
+
+        count, is_estimate = self._count()
+        return KeysetPage(rows, next_cursor, previous_cursor,
+                          count, is_estimate)
@@ -0,0 +1,187 @@
+"""Маршрутизация запросов между основной базой и репликами.
+
+Запись всегда идет в default. View с декоратором use_read_database
+читают из реплики (settings.CRM_READ_DATABASES, случайная на запрос),
+кроме двух случаев, когда реплика может не видеть свежих данных:
+    - в текущем запросе уже была запись;
+    - в этой сессии браузера недавно была запись: PrimaryStickyMiddleware
+      ставит cookie на CRM_PRIMARY_STICKY_SECONDS после запросов с записью.
+Состояние маршрутизации хранится в ContextVar, поэтому действует и в
+потоках sync_to_async асинхронных view.
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+
+STICKY_COOKIE = 'crm_primary'
+
+# Методы, которые могут менять данные
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+
+class _RoutingState:
+    """Маршрутизация одного запроса"""
+
+    def __init__(self):
+        self.read_alias = None
+        self.wrote = False
+
+
+_state = ContextVar('crm_db_routing', default=None)
+
+
+def read_database_aliases():
+    """Алиасы для чтения из настроек (только существующие)"""
+    aliases = getattr(settings, 'CRM_READ_DATABASES', [])
+    return [alias for alias in aliases if alias in settings.DATABASES]
+
+
+def sticky_seconds():
+    return getattr(settings, 'CRM_PRIMARY_STICKY_SECONDS', 10)
+
+
+def is_primary_sticky(request):
+    """Была ли в этой сессии браузера недавняя запись"""
+    try:
+        until = float(request.COOKIES.get(STICKY_COOKIE, 0))
+    except ValueError:
+        return False
+    return until > time.time()
+
+
+class PrimaryReplicaRouter:
+    """Чтение внутри use_read_database - из реплики, остальное - default"""
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.wrote:
+            return None
+        return state.read_alias
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            # Дальнейшие чтения этого запроса - из основной базы
+            state.wrote = True
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Все алиасы смотрят на одни и те же данные
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Миграции только через основное соединение
+        return db == 'default'
+
+
+def _choose_read_alias(request):
+    aliases = read_database_aliases()
+    if not aliases or is_primary_sticky(request):
+        return None
+    return random.choice(aliases)
+
+
+@contextmanager
+def read_from_primary():
+    """Чтения внутри блока - из основной базы, даже в use_read_database.
+
+    Для данных, которые кешируются под версиями основной базы:
+    собранные из отстающей реплики, они жили бы в кеше под новой версией.
+    """
+    state = _state.get()
+    if state is None:
+        yield
+        return
+    previous = state.read_alias
+    state.read_alias = None
+    try:
+        yield
+    finally:
+        state.read_alias = previous
+
+
+def use_read_database(view):
+    """Декоратор view: запросы на чтение идут в реплику.
+
+    Только для view, которые ничего не пишут: реплика может отставать
+    от основной базы и не видит ее незакоммиченных изменений.
+    """
+    def enter(request):
+        state = _state.get()
+        token = None
+        if state is None:
+            # Без PrimaryStickyMiddleware состояние живет в пределах view
+            state = _RoutingState()
+            token = _state.set(state)
+        previous = state.read_alias
+        state.read_alias = _choose_read_alias(request)
+        return state, previous, token
+
+    def leave(state, previous, token):
+        state.read_alias = previous
+        if token is not None:
+            _state.reset(token)
+
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            context = enter(request)
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                leave(*context)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        context = enter(request)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            leave(*context)
+    return wrapper
+
+
+class PrimaryStickyMiddleware:
+    """Cookie «читать из основной базы» после запросов с записью"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = _RoutingState()
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self._finish(request, response, state)
+
+    async def __acall__(self, request):
+        state = _RoutingState()
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self._finish(request, response, state)
+
+    def _finish(self, request, response, state):
+        if state.wrote or request.method in WRITE_METHODS:
+            seconds = sticky_seconds()
+            response.set_cookie(
+                STICKY_COOKIE, str(int(time.time()) + seconds),
+                max_age=seconds, httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,91 @@
+"""SQLite для продакшена: ENGINE 'core.sqlite'.
+
+При открытии соединения выставляются прагмы: журнал WAL (читатели
+не блокируются писателем), busy_timeout (ожидание блокировки вместо
+ошибки database is locked), synchronous=NORMAL, mmap и кеш страниц.
+Транзакции начинаются с BEGIN IMMEDIATE: блокировка записи берется
+сразу, и ожидание busy_timeout работает. У DEFERRED транзакции,
+которая сначала читает, а потом пишет, SQLite при конкурентной записи
+сразу отвечает database is locked.
+
+Дополнительные ключи OPTIONS:
+    pragmas - прагмы поверх DEFAULT_PRAGMAS
+    read_only - соединение только для чтения (query_only, BEGIN DEFERRED)
+    transaction_mode - режим BEGIN для записи, по умолчанию IMMEDIATE
+    optimize_every - PRAGMA optimize при закрытии каждого N-го
+        соединения процесса, 0 - не запускать
+"""
+import itertools
+
+from django.db.backends.sqlite3 import base
+
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    # Очередь писателей под нагрузкой ждет дольше нескольких секунд:
+    # с коротким ожиданием запросы падают с database is locked
+    'busy_timeout': 20000,
+    'synchronous': 'NORMAL',
+    # 64 МБ кеша страниц (отрицательное значение - в КиБ)
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+OPTIMIZE_EVERY = 500
+
+CUSTOM_OPTIONS = ('pragmas', 'read_only', 'transaction_mode',
+                  'optimize_every')
+
+_closed_connections = itertools.count(1)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    @property
+    def crm_options(self):
+        return self.settings_dict['OPTIONS']
+
+    @property
+    def read_only(self):
+        return bool(self.crm_options.get('read_only'))
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        for key in CUSTOM_OPTIONS:
+            params.pop(key, None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        pragmas = {**DEFAULT_PRAGMAS, **self.crm_options.get('pragmas', {})}
+        if self.read_only:
+            pragmas['query_only'] = 'ON'
+        for name, value in pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        if self.read_only:
+            mode = 'DEFERRED'
+        else:
+            mode = self.crm_options.get('transaction_mode', 'IMMEDIATE')
+        self.cursor().execute(f'BEGIN {mode}')
+
+    def close(self):
+        if self._should_optimize():
+            try:
+                # Обновление статистики планировщика для таблиц, по
+                # которым были запросы; обычно занимает миллисекунды
+                self.connection.execute('PRAGMA optimize')
+            except base.Database.Error:
+                pass
+        super().close()
+
+    def _should_optimize(self):
+        every = self.crm_options.get('optimize_every', OPTIMIZE_EVERY)
+        return (
+            every and self.connection is not None and not self.read_only
+            and not self.in_atomic_block and not self.is_in_memory_db()
+            and next(_closed_connections) % every == 0
+        )
@@ -0,0 +1,29 @@
+"""Бэкенд шаблонов Django с замером времени рендеринга.
+
+Шаблоны, полученные через бэкенд (render, render_to_string), отдают
+время рендеринга в метрики запроса core.middleware. Шаблоны, которые
+подключаются внутри других ({% include %}), входят во время внешнего.
+"""
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+from .middleware import timed_render
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        return timed_render(super().render, context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates, шаблоны которого учитываются в метриках запроса"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(
+                self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
@@ -0,0 +1,63 @@
+"""Общая основа тестов приложений CRM"""
+from django.core.cache import caches
+from django.test import TestCase, TransactionTestCase, override_settings
+
+
+# Кеши в памяти процесса: тесты не трогают файловый кеш сервера.
+# Чтение view из основной базы: реплика-зеркало в тестовой SQLite в
+# памяти блокировала бы таблицы, открытые транзакцией теста
+crm_test_settings = override_settings(
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'crm-tests',
+        },
+        'fragments': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'crm-tests-fragments',
+        },
+    },
+    CRM_READ_DATABASES=[],
+)
+
+
+class ClearCachesMixin:
+    def setUp(self):
+        super().setUp()
+        for cache in caches.all():
+            cache.clear()
+
+
+@crm_test_settings
+class CRMTransactionTestCase(ClearCachesMixin, TransactionTestCase):
+    """Тесты view, которые читают БД из потоков пула
+    (core.asyncdb.run_parallel): данные должны быть закоммичены"""
+
+
+@crm_test_settings
+class CRMTestCase(ClearCachesMixin, TestCase):
+    """TestCase с чистыми кешами перед каждым тестом"""
+
+    def commit(self):
+        """Выполнение отложенных до коммита обработчиков
+        (счетчики, итоги, версии кеша, события)"""
+        return self.captureOnCommitCallbacks(execute=True)
+
+
+def walk_pages(paginator, key=lambda row: row.pk):
+    """Все страницы курсорной пагинации вперед, затем назад.
+
+    Возвращает (страницы вперед, страницы назад в прямом порядке) -
+    списки ключей строк; при корректных курсорах они совпадают.
+    """
+    forward = [paginator.get_page()]
+    while forward[-1].has_next():
+        forward.append(paginator.get_page(forward[-1].next_cursor))
+
+    backward = [forward[-1]]
+    while backward[-1].has_previous():
+        backward.append(paginator.get_page(backward[-1].previous_cursor))
+    backward.reverse()
+
+    return ([[key(row) for row in page] for page in forward],
+            [[key(row) for row in page] for page in backward])
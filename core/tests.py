@@ -0,0 +1,281 @@
+import json
+import os
+import re
+import tempfile
+import time
+from datetime import timedelta
+
+from django.db import DatabaseError, connections, router, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from clients.models import Client
+from deals.dashboard import load_dashboard_data
+from deals.models import Deal, DealService
+from price.models import Service
+from .cache import cached_bundle, cache_stats
+from .routers import (STICKY_COOKIE, PrimaryStickyMiddleware,
+                      read_from_primary, use_read_database)
+from .sqlite.base import DatabaseWrapper
+from .testing import CRMTestCase, CRMTransactionTestCase
+
+
+class VersionedCacheTests(CRMTestCase):
+    """Наборы агрегатов пересобираются после коммита изменений"""
+
+    def setUp(self):
+        super().setUp()
+        self.builds = 0
+
+    def build(self):
+        self.builds += 1
+        return {'services': Service.objects.count()}
+
+    def bundle(self):
+        return cached_bundle('test', ['price.service'], self.build)
+
+    def test_bundle_rebuilt_after_committed_change(self):
+        self.assertEqual(self.bundle(), {'services': 0})
+        self.assertEqual(self.bundle(), {'services': 0})
+        self.assertEqual(self.builds, 1)
+
+        # До коммита версия не меняется
+        with self.captureOnCommitCallbacks() as callbacks:
+            Service.objects.create(name='Ремонт', price=1500)
+        self.assertEqual(self.bundle(), {'services': 0})
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.bundle(), {'services': 1})
+        self.assertEqual(self.builds, 2)
+        self.assertEqual(cache_stats(['test'])['test'],
+                         {'hits': 2, 'misses': 2, 'hit_rate': 0.5})
+
+    def test_dashboard_aggregates_follow_deal_writes(self):
+        client = Client.objects.create(name='Иван Петров',
+                                       phone='+79001112233')
+        self.assertEqual(load_dashboard_data()['total_deals'], 0)
+
+        now = timezone.now()
+        with self.commit():
+            deal = Deal.objects.create(client=client, start_date=now,
+                                       end_date=now + timedelta(days=7))
+        self.assertEqual(load_dashboard_data()['status_counts'], {'new': 1})
+
+        with self.commit():
+            deal.status = 'successful'
+            deal.save(update_fields=['status', 'updated_at'])
+        self.assertEqual(load_dashboard_data()['status_counts'],
+                         {'successful': 1})
+
+        response = self.client.get(reverse('cache_stats_api'))
+        self.assertEqual(response.json()['bundles']['dashboard']['misses'],
+                         3)
+
+
+class PerformanceMiddlewareTests(CRMTestCase):
+    """Server-Timing и лог crm.perf для обычных и потоковых ответов"""
+
+    def setUp(self):
+        super().setUp()
+        client = Client.objects.create(name='Иван Петров',
+                                       phone='+79001112233')
+        now = timezone.now()
+        with self.commit():
+            Deal.objects.create(client=client, start_date=now,
+                                end_date=now + timedelta(days=7))
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('dashboard'))
+        match = re.fullmatch(
+            r'total;dur=([\d.]+), db;dur=([\d.]+);desc="(\d+) queries", '
+            r'tpl;dur=([\d.]+)', response['Server-Timing'])
+        self.assertIsNotNone(match, response['Server-Timing'])
+        total, db, queries, template = map(float, match.groups())
+        self.assertGreater(queries, 0)
+        self.assertGreater(template, 0)
+        self.assertLessEqual(max(db, template), total)
+
+    @override_settings(CRM_PERF={'BUDGETS': {'dashboard': {'queries': 1}}})
+    def test_budget_exceeded_is_logged(self):
+        with self.assertLogs('crm.perf', 'WARNING') as logs:
+            self.client.get(reverse('dashboard'))
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual((record['view'], record['budget_exceeded']),
+                         ('dashboard', ['queries']))
+
+    def test_streaming_response_logged_after_body(self):
+        with self.assertLogs('crm.perf', 'INFO') as logs:
+            response = self.client.get(
+                reverse('export_deals', args=['csv']))
+            self.assertEqual(logs.records, [])
+            content = b''.join(response.streaming_content)
+        self.assertIn('Иван Петров'.encode(), content)
+        self.assertNotIn('Server-Timing', response)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['view'], 'export_deals')
+        self.assertGreater(record['queries'], 0)
+
+
+class AsyncApiTests(CRMTransactionTestCase):
+    """Асинхронные API поиска клиента, канбана и статистики под ASGI"""
+
+    def setUp(self):
+        super().setUp()
+        self.ivan = Client.objects.create(name='Иван Петров',
+                                          phone='+79001112233')
+        repair = Service.objects.create(name='Ремонт', price=1500)
+        now = timezone.now()
+        for status, price in (('new', 1000), ('successful', 500)):
+            deal = Deal.objects.create(client=self.ivan, status=status,
+                                       start_date=now,
+                                       end_date=now + timedelta(days=7))
+            DealService.objects.create(deal=deal, service=repair,
+                                       price=price)
+
+    async def test_find_client(self):
+        response = await self.async_client.get(
+            reverse('find_client_api'), {'phone': '8 900 111-22-33'})
+        self.assertEqual(response.json()['client']['id'], self.ivan.pk)
+
+    async def test_dashboard(self):
+        response = await self.async_client.get(reverse('dashboard_api'))
+        data = response.json()
+        self.assertEqual(data['counts'], {'new': 1, 'successful': 1})
+        self.assertEqual(data['total_revenue'], 1500.0)
+
+    async def test_statistics_with_conditional_get(self):
+        url = reverse('statistics_api')
+        response = await self.async_client.get(url)
+        data = response.json()
+        self.assertEqual((data['total_deals'], data['total_completed']),
+                         (2, 1))
+        self.assertEqual(data['services'][0]['name'], 'Ремонт')
+        self.assertEqual(data['monthly_revenue'][-1], 1500.0)
+
+        response = await self.async_client.get(
+            url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+        response = await self.async_client.post(url)
+        self.assertEqual(response.status_code, 405)
+
+
+class SQLiteBackendTests(SimpleTestCase):
+    """Прагмы, соединения только для чтения и BEGIN IMMEDIATE"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'crm.sqlite3')
+        self.writer = self.connect('crm_test_writer')
+        self.execute(self.writer, 'CREATE TABLE item (id INTEGER)')
+        self.execute(self.writer, 'INSERT INTO item VALUES (1)')
+
+    def connect(self, alias, **options):
+        settings_dict = {**connections['default'].settings_dict,
+                         'NAME': self.path, 'OPTIONS': options}
+        wrapper = DatabaseWrapper(settings_dict, alias=alias)
+        connections[alias] = wrapper
+        self.addCleanup(wrapper.close)
+        self.addCleanup(connections.__delitem__, alias)
+        return wrapper
+
+    def execute(self, wrapper, sql):
+        with wrapper.cursor() as cursor:
+            cursor.execute(sql)
+            return cursor.fetchall()
+
+    def test_pragmas(self):
+        self.assertEqual(self.execute(self.writer, 'PRAGMA journal_mode'),
+                         [('wal',)])
+        self.assertEqual(self.execute(self.writer, 'PRAGMA busy_timeout'),
+                         [(20000,)])
+        reader = self.connect('crm_test_reader', read_only=True,
+                              pragmas={'busy_timeout': 100})
+        self.assertEqual(self.execute(reader, 'PRAGMA busy_timeout'),
+                         [(100,)])
+        self.assertEqual(self.execute(reader, 'PRAGMA query_only'), [(1,)])
+
+    def test_read_only_connection_rejects_writes(self):
+        reader = self.connect('crm_test_reader', read_only=True)
+        self.assertEqual(self.execute(reader, 'SELECT id FROM item'),
+                         [(1,)])
+        with self.assertRaises(DatabaseError):
+            self.execute(reader, 'INSERT INTO item VALUES (2)')
+
+    def test_transaction_takes_write_lock_at_begin(self):
+        other = self.connect('crm_test_other', pragmas={'busy_timeout': 0})
+        reader = self.connect('crm_test_reader', read_only=True)
+        with transaction.atomic(using='crm_test_writer'):
+            # Транзакция только читала, но блокировка записи уже взята
+            self.execute(self.writer, 'SELECT id FROM item')
+            with self.assertRaisesMessage(DatabaseError, 'locked'):
+                self.execute(other, 'INSERT INTO item VALUES (3)')
+            self.execute(self.writer, 'INSERT INTO item VALUES (2)')
+            # WAL: читатель не ждет писателя и видит закоммиченные данные
+            self.assertEqual(self.execute(reader, 'SELECT id FROM item'),
+                             [(1,)])
+        self.assertEqual(
+            self.execute(reader, 'SELECT id FROM item ORDER BY id'),
+            [(1,), (2,)])
+
+
+@override_settings(CRM_READ_DATABASES=['read'])
+class ReadRouterTests(SimpleTestCase):
+    """Чтение из реплики в use_read_database и основная база после записи"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def route(self, request, write=False):
+        """Алиасы чтения view: до записи, внутри read_from_primary, после"""
+        @use_read_database
+        def view(request):
+            before = router.db_for_read(Deal)
+            with read_from_primary():
+                primary = router.db_for_read(Deal)
+            if write:
+                router.db_for_write(Deal)
+            return before, primary, router.db_for_read(Deal)
+        return PrimaryStickyMiddleware(
+            lambda request: HttpResponse(repr(view(request))))(request)
+
+    def test_reads_go_to_replica_until_write(self):
+        self.assertEqual(router.db_for_read(Deal), 'default')
+        response = self.route(self.factory.get('/'))
+        self.assertEqual(response.content.decode(),
+                         repr(('read', 'default', 'read')))
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+
+        response = self.route(self.factory.get('/'), write=True)
+        self.assertEqual(response.content.decode(),
+                         repr(('read', 'default', 'default')))
+        self.assertIn(STICKY_COOKIE, response.cookies)
+
+    def test_recent_write_keeps_session_on_primary(self):
+        response = self.route(self.factory.post('/'))
+        cookie = response.cookies[STICKY_COOKIE]
+        self.assertGreater(float(cookie.value), time.time())
+
+        request = self.factory.get('/')
+        request.COOKIES[STICKY_COOKIE] = cookie.value
+        self.assertEqual(self.route(request).content.decode(),
+                         repr(('default', 'default', 'default')))
+
+        request.COOKIES[STICKY_COOKIE] = str(int(time.time()) - 1)
+        self.assertEqual(self.route(request).content.decode(),
+                         repr(('read', 'default', 'read')))
+
+    async def test_async_view_reads_from_replica(self):
+        @use_read_database
+        async def view(request):
+            return router.db_for_read(Deal)
+        self.assertEqual(await view(self.factory.get('/')), 'read')
+
+    @override_settings(CRM_READ_DATABASES=['missing'])
+    def test_unknown_alias_falls_back_to_primary(self):
+        self.assertEqual(self.route(self.factory.get('/')).content.decode(),
+                         repr(('default', 'default', 'default')))
@@ -1,8 +1,15 @@
 from django.urls import path
-from .api import find_client_api, create_service_api
-from clients.views import contacts, create_client, client_detail, client_deals
-from deals.views import dashboard, deal_detail, create_deal, update_deal_status, all_deals, delete_deal
-from statistic.views import statistics
+from .api import (find_client_api, create_service_api,
+                  create_deals_batch_api, update_deal_statuses_api,
+                  cache_stats_api, dashboard_api, statistics_api,
+                  deals_api, deal_detail_api)
+from clients.views import (contacts, create_client, client_detail,
+                           client_deals, export_clients, import_clients)
+from deals.views import (dashboard, deal_detail, create_deal,
+                         update_deal_status, all_deals, delete_deal,
+                         export_deals, deal_events, deal_cards,
+                         deal_comments)
+from statistic.views import statistics, update_statistics
 from price.views import services
 
 urlpatterns = [
@@ -11,13 +18,23 @@ urlpatterns = [
          name='dashboard'),  # Главная страница
     path('statistics/', statistics,
          name='statistics'),
+    path('statistics/update/', update_statistics,
+         name='update_statistics'),
     path('closed/', all_deals,
          name='closed_deals'),
+    path('closed/export/<str:export_format>/', export_deals,
+         name='export_deals'),
     path('services/', services,
          name='services'),
     path('deal/delete/<int:deal_id>/', delete_deal, name='delete_deal'),
+    path('events/deals/', deal_events,
+         name='deal_events'),  # Живое обновление канбана
+    path('deals/cards/', deal_cards,
+         name='deal_cards'),
     path('closed/<int:deal_id>/', deal_detail,
          name='deal_detail'),
+    path('closed/<int:deal_id>/comments/', deal_comments,
+         name='deal_comments'),  # Подгрузка старых комментариев
     path('deal/create/', create_deal,
          name='create_deal'),
     path('deal/<int:deal_id>/update_status/', update_deal_status,
@@ -27,10 +44,28 @@ urlpatterns = [
     # API endpoints
     path('api/services/', create_service_api,
          name='create_service_api'),
+    path('api/deals/', deals_api,
+         name='deals_api'),
+    path('api/deals/<int:deal_id>/', deal_detail_api,
+         name='deal_detail_api'),
+    path('api/deals/batch/', create_deals_batch_api,
+         name='create_deals_batch_api'),
+    path('api/deals/status/', update_deal_statuses_api,
+         name='update_deal_statuses_api'),
+    path('api/dashboard/', dashboard_api,
+         name='dashboard_api'),
+    path('api/statistics/', statistics_api,
+         name='statistics_api'),
+    path('api/cache/stats/', cache_stats_api,
+         name='cache_stats_api'),
 
     # Управление контактами и клиентами
     path('contacts/', contacts,
          name='contacts'),
+    path('contacts/export/<str:export_format>/', export_clients,
+         name='export_clients'),
+    path('contacts/import/', import_clients,
+         name='import_clients'),
     path('client/create/', create_client,
          name='create_client'),
     path('client/<int:client_id>/', client_detail,
@@ -0,0 +1,134 @@
+"""Сделки для JSON API: словари из values() без объектов моделей.
+
+Выбираются только колонки запрошенных полей (?fields=), клиент
+присоединяется JOIN, услуги собираются в JSON-массив подзапросом
+в SQL, стоимость - сохраненный Deal.total. Фильтры и сортировки -
+те же, что на странице всех сделок (deals.filters).
+"""
+from django.core.exceptions import ValidationError
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import JSONObject
+
+from core.aggregates import JSONGroupArray
+from core.pagination import KeysetPaginator
+from .filters import DEAL_SORT_ORDERINGS, filter_deals
+from .models import Deal, DealService
+from .search import SearchPaginator
+
+
+# Поля ответа и колонки values(), из которых они собираются
+DEAL_API_FIELDS = {
+    'id': ('id',),
+    'status': ('status',),
+    'client': ('client_id', 'client__name', 'client__phone',
+               'client__email'),
+    'services': ('services_items',),
+    'total': ('total',),
+    'description': ('description',),
+    'start_date': ('start_date',),
+    'end_date': ('end_date',),
+    'created_at': ('created_at',),
+    'updated_at': ('updated_at',),
+}
+
+DEAL_API_PAGE_SIZE = 100
+
+# Максимальный размер страницы (?limit=)
+DEAL_API_MAX_PAGE_SIZE = 5000
+
+
+def parse_fields(value):
+    """Поля ответа из ?fields=id,status,...; без параметра - все.
+    id возвращается всегда"""
+    if not value:
+        return list(DEAL_API_FIELDS)
+    fields = ['id']
+    for name in value.split(','):
+        name = name.strip()
+        if not name or name in fields:
+            continue
+        if name not in DEAL_API_FIELDS:
+            raise ValidationError(f'Неизвестное поле: {name}')
+        fields.append(name)
+    return fields
+
+
+def parse_limit(value):
+    """Размер страницы из ?limit="""
+    if not value:
+        return DEAL_API_PAGE_SIZE
+    if not value.isdigit() or not 1 <= int(value) <= DEAL_API_MAX_PAGE_SIZE:
+        raise ValidationError(
+            f'limit - число от 1 до {DEAL_API_MAX_PAGE_SIZE}')
+    return int(value)
+
+
+def _services_subquery():
+    """Услуги сделки JSON-массивом (подзапрос по индексу deal_id)"""
+    return Subquery(
+        DealService.objects.filter(deal=OuterRef('pk')).order_by().values(
+            'deal').annotate(items=JSONGroupArray(JSONObject(
+                id='service_id', name='service__name',
+                price='price'))).values('items'))
+
+
+def deal_values(deals, fields, ordering=()):
+    """values() сделок с колонками полей fields (и полей сортировки)"""
+    if 'services' in fields:
+        deals = deals.annotate(services_items=_services_subquery())
+    columns = [column for name in fields for column in DEAL_API_FIELDS[name]]
+    columns += [name.lstrip('-') for name in ordering
+                if name.lstrip('-') not in columns]
+    return deals.values(*columns)
+
+
+def deal_json(row, fields):
+    """Словарь сделки для ответа из строки values()"""
+    data = {}
+    for name in fields:
+        if name == 'client':
+            data['client'] = {
+                'id': row['client_id'],
+                'name': row['client__name'],
+                'phone': row['client__phone'],
+                'email': row['client__email'] or '',
+            }
+        elif name == 'services':
+            data['services'] = row['services_items'] or []
+        elif name == 'total':
+            data['total'] = float(row['total'])
+        else:
+            data[name] = row[name]
+    return data
+
+
+def deals_page(params, fields, limit, count=None):
+    """Страница сделок с фильтрами страницы всех сделок.
+
+    Возвращает KeysetPage, object_list - словари deal_json.
+    """
+    deals, filters = filter_deals(Deal.objects.all(), params)
+    cursor = params.get('cursor')
+    if filters['sort_by'] == 'relevance':
+        # Порядок релевантности задает индекс: страница id сделок
+        page = SearchPaginator(
+            deals, filters['search_query'], per_page=limit,
+            count=count).get_page(cursor)
+        rows = {row['id']: row for row in deal_values(
+            Deal.objects.filter(pk__in=page.object_list), fields)}
+        rows = [rows[pk] for pk in page.object_list if pk in rows]
+    else:
+        ordering = DEAL_SORT_ORDERINGS[filters['sort_by']]
+        page = KeysetPaginator(
+            deal_values(deals, fields, ordering), ordering,
+            per_page=limit, count=count).get_page(cursor)
+        rows = page.object_list
+
+    page.object_list = [deal_json(row, fields) for row in rows]
+    return page
+
+
+def deal_detail_json(deal_id, fields):
+    """Сделка для ответа или None"""
+    row = deal_values(Deal.objects.filter(pk=deal_id), fields).first()
+    return deal_json(row, fields) if row else None
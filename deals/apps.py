@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class DealsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'deals'
+
+    def ready(self):
+        # Подключение обработчиков сигналов
+        from . import signals  # noqa: F401
@@ -0,0 +1,294 @@
+import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from deals.models import Deal, DealService
+from deals.signals import deals_changed
+from clients.models import Client
+from clients.phones import normalize_phone, phone_suffix
+from price.models import Service
+
+
+REQUIRED_FIELDS = ['client_name', 'client_phone', 'start_date', 'end_date',
+                   'status']
+
+
+def parse_deal_datetime(value):
+    """Преобразование строки ISO в aware datetime"""
+    try:
+        parsed = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        raise ValidationError(f'Неверный формат даты: {value}')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _parse_price(value, service):
+    """Цена услуги в сделке, по умолчанию цена из прайса"""
+    if value in (None, ''):
+        return service.price
+    try:
+        price = Decimal(str(value))
+    except InvalidOperation:
+        raise ValidationError(f'Неверная цена услуги: {value}')
+    if not price.is_finite() or price < 0:
+        raise ValidationError(f'Неверная цена услуги: {value}')
+    return price
+
+
+def _resolve_services(items_list):
+    """Все услуги всех сделок одним запросом in_bulk"""
+    service_ids = set()
+    for items in items_list:
+        for service_id, _ in items:
+            try:
+                service_ids.add(int(service_id))
+            except (TypeError, ValueError):
+                raise ValidationError(f'Неверный id услуги: {service_id}')
+
+    services = Service.objects.in_bulk(service_ids)
+    missing = service_ids - set(services)
+    if missing:
+        raise ValidationError(
+            'Услуга не найдена: '
+            + ', '.join(str(pk) for pk in sorted(missing)))
+    return services
+
+
+def _build_deal_services(deal, items, services):
+    """Объекты DealService для bulk_create"""
+    deal_services = []
+    seen = set()
+    for service_id, price in items:
+        service = services[int(service_id)]
+        if service.pk in seen:
+            raise ValidationError(
+                f'Услуга "{service.name}" указана в сделке дважды')
+        seen.add(service.pk)
+        deal_services.append(DealService(
+            deal=deal,
+            service=service,
+            price=_parse_price(price, service)
+        ))
+    return deal_services
+
+
+def _upsert_clients(pairs):
+    """Создание или обновление клиентов по телефону.
+
+    pairs - список (имя, телефон). Телефоны сравниваются по последним
+    цифрам нормализованного номера (phone_suffix), как при создании
+    и импорте клиентов, поэтому +7 и 8 находят одного клиента.
+    Существующие клиенты выбираются одним запросом, новые
+    вставляются одним bulk_create. Возвращает словарь
+    {исходный телефон: клиент}.
+    """
+    names_by_key = {}
+    phones_by_key = {}
+    for name, phone in pairs:
+        key = phone_suffix(normalize_phone(phone))
+        names_by_key[key] = name
+        phones_by_key.setdefault(key, phone)
+
+    clients_by_key = {}
+    for client in Client.objects.filter(
+            phone_suffix__in=names_by_key).order_by('id'):
+        clients_by_key.setdefault(client.phone_suffix, client)
+
+    # Если клиент уже существовал, но имя изменилось - обновляем
+    renamed = []
+    for key, client in clients_by_key.items():
+        if client.name != names_by_key[key]:
+            client.name = names_by_key[key]
+            renamed.append(client)
+    if renamed:
+        Client.objects.bulk_update(renamed, ['name'])
+        deals_changed.send(sender=Client, deal_ids=list(
+            Deal.objects.filter(client__in=renamed).values_list(
+                'id', flat=True)))
+
+    new_clients = []
+    for key, name in names_by_key.items():
+        if key not in clients_by_key:
+            client = Client(name=name, phone=phones_by_key[key])
+            client.fill_phone_keys()
+            new_clients.append(client)
+    for client in Client.objects.bulk_create(new_clients):
+        clients_by_key[client.phone_suffix] = client
+
+    return {
+        phone: clients_by_key[phone_suffix(normalize_phone(phone))]
+        for _, phone in pairs
+    }
+
+
+def upsert_client(name, phone):
+    """Поиск клиента по телефону с обновлением имени"""
+    return _upsert_clients([(name, phone)])[phone]
+
+
+def _clean_deal_data(data):
+    """Проверка данных одной сделки, возвращает items услуг"""
+    if not isinstance(data, dict):
+        raise ValidationError('Сделка должна быть объектом')
+    if not all(data.get(field) for field in REQUIRED_FIELDS):
+        raise ValidationError('Все обязательные поля должны быть заполнены')
+    if not all(isinstance(data[field], str) for field in REQUIRED_FIELDS):
+        raise ValidationError('Обязательные поля должны быть строками')
+    if data['status'] not in dict(Deal.STATUS_CHOICES):
+        raise ValidationError(f'Неверный статус: {data["status"]}')
+
+    services = data.get('services') or []
+    if not isinstance(services, list) or not all(
+            isinstance(item, dict) for item in services):
+        raise ValidationError('Услуги должны быть списком объектов')
+    items = [
+        (item.get('service_id'), item.get('price'))
+        for item in services
+        if item.get('service_id')
+    ]
+    if not items:
+        raise ValidationError('Выберите хотя бы одну услугу')
+    return items
+
+
+def create_deals(deals_data):
+    """Создание пачки сделок с услугами в одной транзакции.
+
+    Каждый элемент deals_data - словарь с ключами client_name,
+    client_phone, start_date, end_date, status, description и
+    services (список словарей service_id/price). Ошибка в любой
+    сделке откатывает всю пачку.
+    """
+    items_list = []
+    for index, data in enumerate(deals_data):
+        try:
+            items_list.append(_clean_deal_data(data))
+        except ValidationError as e:
+            raise ValidationError({str(index): e.messages})
+
+    with transaction.atomic():
+        services = _resolve_services(items_list)
+        clients = _upsert_clients([
+            (data['client_name'], data['client_phone'])
+            for data in deals_data
+        ])
+
+        deals = Deal.objects.bulk_create([
+            Deal(
+                client=clients[data['client_phone']],
+                description=data.get('description') or '',
+                status=data['status'],
+                start_date=parse_deal_datetime(data['start_date']),
+                end_date=parse_deal_datetime(data['end_date'])
+            )
+            for data in deals_data
+        ])
+
+        deal_services = []
+        for deal, items in zip(deals, items_list):
+            deal_services.extend(_build_deal_services(deal, items, services))
+        DealService.objects.bulk_create(deal_services)
+
+        # bulk_create не отправляет сигналы, суммы пересчитываем явно
+        deal_ids = [deal.pk for deal in deals]
+        Deal.refresh_totals(deal_ids)
+        deals_changed.send(sender=Deal, deal_ids=deal_ids, change='created')
+
+    return deals
+
+
+def create_deal_with_services(data):
+    """Создание одной сделки с услугами"""
+    return create_deals([data])[0]
+
+
+def replace_deal_services(deal, items):
+    """Замена услуг сделки: одно удаление и один bulk_create.
+
+    items - список пар (service_id, price).
+    """
+    with transaction.atomic():
+        services = _resolve_services([items])
+        deal_services = _build_deal_services(deal, items, services)
+        DealService.objects.filter(deal=deal).delete()
+        DealService.objects.bulk_create(deal_services)
+        Deal.refresh_totals([deal.pk])
+        deal.refresh_from_db(fields=['total'])
+        deals_changed.send(sender=Deal, deal_ids=[deal.pk],
+                           change='services')
+    return deal_services
+
+
+def _parse_status_change(change):
+    """(id, status) из {"id": ..., "status": ...} или пары [id, status]"""
+    if isinstance(change, dict):
+        deal_id, status = change.get('id'), change.get('status')
+    elif isinstance(change, (list, tuple)) and len(change) == 2:
+        deal_id, status = change
+    else:
+        raise ValidationError('Ожидается {"id": ..., "status": ...}')
+    try:
+        deal_id = int(deal_id)
+    except (TypeError, ValueError):
+        raise ValidationError(f'Неверный id сделки: {deal_id}')
+    if not isinstance(status, str) or status not in dict(Deal.STATUS_CHOICES):
+        raise ValidationError(f'Неверный статус: {status}')
+    return deal_id, status
+
+
+def update_deal_statuses(changes):
+    """Массовая смена статусов сделок одной транзакцией.
+
+    Сделки группируются по новому статусу: на каждый статус
+    один UPDATE ... WHERE id IN (...). Для повторяющегося id
+    применяется последнее изменение. Возвращает список результатов
+    в порядке запроса: {'id', 'success', 'status'/'error', 'changed'}.
+    """
+    results = []
+    targets = {}
+    for change in changes:
+        try:
+            deal_id, status = _parse_status_change(change)
+        except ValidationError as e:
+            deal_id = change.get('id') if isinstance(change, dict) else None
+            results.append({'id': deal_id, 'success': False,
+                            'error': '; '.join(e.messages)})
+            continue
+        targets[deal_id] = status
+        results.append({'id': deal_id, 'status': status})
+
+    changed_ids = []
+    with transaction.atomic():
+        current = dict(Deal.objects.select_for_update().filter(
+            pk__in=targets).values_list('pk', 'status'))
+
+        by_status = {}
+        for deal_id, status in targets.items():
+            if deal_id in current and current[deal_id] != status:
+                by_status.setdefault(status, []).append(deal_id)
+
+        now = timezone.now()
+        for status, deal_ids in by_status.items():
+            Deal.objects.filter(pk__in=deal_ids).update(
+                status=status, updated_at=now)
+            changed_ids.extend(deal_ids)
+
+        if changed_ids:
+            deals_changed.send(sender=Deal, deal_ids=changed_ids,
+                               change='status')
+
+    changed = set(changed_ids)
+    for result in results:
+        if 'status' not in result:
+            continue
+        if result['id'] not in current:
+            result.update(success=False, error='Сделка не найдена')
+            del result['status']
+        else:
+            result.update(success=True, changed=result['id'] in changed)
+    return results
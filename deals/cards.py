@@ -0,0 +1,74 @@
+"""HTML карточек канбана и строк таблицы сделок из кеша фрагментов.
+
+Фрагмент сделки зависит от самой сделки, её клиента и услуг:
+изменения клиента и услуг сдвигают Deal.updated_at (deals.signals,
+Deal.refresh_totals), переименование услуги меняет версию прайса.
+Поэтому страница сначала загружает только id и updated_at, а сделки
+с клиентами и услугами - лишь для фрагментов, которых нет в кеше.
+"""
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from core.cache import cached_fragments
+from .models import Deal
+
+
+# Модели, данные которых выводятся во фрагментах, но не меняют updated_at
+FRAGMENT_DEPENDENCIES = ['price.service']
+
+# Имена фрагментов (в ключах кеша и счетчиках попаданий) и их шаблоны
+CARD_FRAGMENT = ('deal_card', 'deal_card.html')
+ROW_FRAGMENT = ('deal_row', 'deal_row.html')
+FRAGMENT_NAMES = [CARD_FRAGMENT[0], ROW_FRAGMENT[0]]
+
+
+# Если в кеше нет большей доли фрагментов, сделки для рендера
+# загружаются запросом страницы целиком, а не длинным списком id
+RELOAD_ALL_SHARE = 0.5
+
+
+def _renderer(template_name, source, total):
+    def render_missing(deal_ids):
+        deals = source.select_related('client').prefetch_related('services')
+        if len(deal_ids) <= total * RELOAD_ALL_SHARE:
+            deals = deals.filter(pk__in=deal_ids)
+        wanted = set(deal_ids)
+        return {
+            deal.pk: render_to_string(template_name, {'deal': deal})
+            for deal in deals if deal.pk in wanted
+        }
+    return render_missing
+
+
+def deal_fragments(name, template_name, deals, source=None):
+    """{id: html} для сделок (нужны только id и updated_at).
+
+    source - запрос, которым выбраны deals (без него отсутствующие
+    в кеше сделки загружаются только по списку id).
+    """
+    if source is None:
+        source, total = Deal.objects.all(), float('inf')
+    else:
+        total = len(deals)
+    return cached_fragments(
+        name, {deal.pk: deal.updated_at for deal in deals},
+        _renderer(template_name, source, total), FRAGMENT_DEPENDENCIES)
+
+
+def attach_fragments(name, template_name, deals, attribute, source=None):
+    """Фрагменты в атрибут attribute каждой сделки (для шаблонов)"""
+    deals = list(deals)
+    fragments = deal_fragments(name, template_name, deals, source)
+    for deal in deals:
+        setattr(deal, attribute, mark_safe(fragments.get(deal.pk, '')))
+    return deals
+
+
+def attach_cards(deals, source=None):
+    """deal.card_html - карточка канбана"""
+    return attach_fragments(*CARD_FRAGMENT, deals, 'card_html', source)
+
+
+def attach_rows(deals):
+    """deal.row_html - ячейки строки таблицы сделок (без действий)"""
+    return attach_fragments(*ROW_FRAGMENT, deals, 'row_html')
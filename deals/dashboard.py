@@ -0,0 +1,156 @@
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from core.asyncdb import run_parallel
+from core.cache import cached_bundle
+from core.conditional import make_etag, model_fingerprint
+from deals.cards import attach_cards
+from deals.events import latest_event_id
+from deals.models import Deal, DealService
+from price.models import Service
+
+
+# Модели, от которых зависят агрегаты главной страницы
+DASHBOARD_DEPENDENCIES = ['deals.deal', 'deals.dealservice', 'price.service']
+
+
+def load_dashboard_data(now=None):
+    """Данные главной страницы за фиксированное число запросов.
+
+    Активные сделки выбираются одним запросом (только поля для колонок
+    и ключа кеша) и раскладываются по колонкам в памяти. HTML карточек
+    берется из кеша фрагментов (deal.card_html); клиенты и услуги
+    загружаются только для карточек, которых в кеше нет.
+    Счетчики по статусам, выручка и популярные услуги берутся
+    из кеша агрегатов и пересчитываются только после изменения данных.
+    """
+    now = now or timezone.now()
+
+    # Запрос 1: активные сделки; 2-3 - клиенты и услуги для промахов кеша
+    active = Deal.objects.filter(status__in=Deal.ACTIVE_STATUSES)
+    active_deals = attach_cards(
+        active.only('id', 'status', 'end_date', 'updated_at'), active)
+
+    columns = {status: [] for status in Deal.ACTIVE_STATUSES}
+    expired_deals = []
+    for deal in active_deals:
+        columns[deal.status].append(deal)
+        if deal.end_date < now:
+            expired_deals.append(deal)
+
+    aggregates = cached_bundle(
+        'dashboard', DASHBOARD_DEPENDENCIES, load_dashboard_aggregates)
+
+    return {
+        'deals_new': columns['new'],
+        'deals_in_progress': columns['in_progress'],
+        'deals_ready': columns['ready'],
+        'expired_deals': expired_deals,
+        **aggregates,
+    }
+
+
+def load_dashboard_aggregates():
+    """Агрегаты главной страницы (кешируются до изменения данных)"""
+    # Количество и выручка по всем статусам одним GROUP BY
+    status_counts = {}
+    total_revenue = 0
+    for row in Deal.objects.order_by().values('status').annotate(
+            count=Count('id'), revenue=Sum('total')):
+        status_counts[row['status']] = row['count']
+        total_revenue += row['revenue'] or 0
+
+    popular_services = list(Service.objects.annotate(
+        deal_count=Count('dealservice')
+    ).order_by('-deal_count')[:5])
+
+    return {
+        'status_counts': status_counts,
+        'total_deals': sum(status_counts.values()),
+        'total_revenue': total_revenue,
+        'popular_services': popular_services,
+    }
+
+
+async def aload_dashboard_json(now=None):
+    """Колонки канбана для API: словари вместо объектов моделей.
+
+    Сделки с клиентами, названия услуг и кеш агрегатов загружаются
+    параллельно. В колонках и просроченных - только id, данные
+    сделок один раз в deals.
+    """
+    rows, services, aggregates = await run_parallel(
+        _active_deal_rows, _active_deal_services, _dashboard_aggregates)
+    return _dashboard_json(rows, services, aggregates, now)
+
+
+def _active_deal_rows():
+    return list(Deal.objects.filter(
+        status__in=Deal.ACTIVE_STATUSES).values(
+        'id', 'status', 'client_id', 'client__name', 'client__phone',
+        'start_date', 'end_date', 'total'))
+
+
+def _active_deal_services():
+    services = {}
+    for deal_id, name in DealService.objects.filter(
+            deal__status__in=Deal.ACTIVE_STATUSES
+    ).order_by('id').values_list('deal_id', 'service__name'):
+        services.setdefault(deal_id, []).append(name)
+    return services
+
+
+def _dashboard_aggregates():
+    return cached_bundle(
+        'dashboard', DASHBOARD_DEPENDENCIES, load_dashboard_aggregates)
+
+
+def _dashboard_json(rows, services, aggregates, now=None):
+    now = now or timezone.now()
+    deals = []
+    columns = {status: [] for status in Deal.ACTIVE_STATUSES}
+    expired = []
+    for deal in rows:
+        deals.append({
+            'id': deal['id'],
+            'status': deal['status'],
+            'client': {
+                'id': deal['client_id'],
+                'name': deal['client__name'],
+                'phone': deal['client__phone'],
+            },
+            'start_date': deal['start_date'].isoformat(),
+            'end_date': deal['end_date'].isoformat(),
+            'total': float(deal['total']),
+            'services': services.get(deal['id'], []),
+        })
+        columns[deal['status']].append(deal['id'])
+        if deal['end_date'] < now:
+            expired.append(deal['id'])
+
+    return {
+        'columns': columns,
+        'expired': expired,
+        'counts': aggregates['status_counts'],
+        'total_deals': aggregates['total_deals'],
+        'total_revenue': float(aggregates['total_revenue']),
+        'deals': deals,
+    }
+
+
+def dashboard_etag(request, now=None):
+    """ETag канбана: последнее событие ленты сделок и отпечаток прайса.
+
+    Любое изменение сделок, их услуг и данных клиентов в карточках
+    записывается в ленту (deals.signals). Число просроченных активных
+    сделок (индекс status, end_date) входит в отпечаток, потому что
+    сделка становится просроченной без изменения данных.
+    """
+    now = now or timezone.now()
+    return make_etag(
+        'dashboard',
+        latest_event_id(),
+        Deal.objects.filter(status__in=Deal.ACTIVE_STATUSES,
+                            end_date__lt=now).count(),
+        model_fingerprint(Service),
+    )
@@ -0,0 +1,133 @@
+"""Лента изменений сделок для живого обновления канбана.
+
+Сигналы (deals.signals) после коммита записывают события в таблицу
+DealEvent и будят ожидающие потоки своего процесса через Condition.
+Читатели ждут события после своего курсора (id последнего события):
+в своем процессе их будит Condition, изменения из других воркеров
+подхватываются опросом таблицы раз в EVENT_POLL_INTERVAL секунд.
+Поток SSE (aevent_stream) - только под ASGI, под WSGI доска
+получает события через long-poll (wait_for_events).
+"""
+import asyncio
+import datetime
+import json
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.db import DatabaseError
+from django.utils import timezone
+
+from core.deferred import defer_on_commit
+from .models import DealEvent
+
+
+# Как часто проверять таблицу событий (изменения из других процессов)
+EVENT_POLL_INTERVAL = 2
+
+# Максимум событий в одном ответе
+EVENT_BATCH_LIMIT = 200
+
+# Сколько хранить события
+EVENT_RETENTION = datetime.timedelta(days=1)
+
+# Удалять старые события примерно раз на столько записей
+EVENT_PRUNE_EVERY = 500
+
+# Поток SSE: длительность одного соединения (потом браузер
+# переподключается с Last-Event-ID), интервал keepalive и пауза
+# перед переподключением
+SSE_MAX_DURATION = 300
+SSE_KEEPALIVE = 15
+SSE_RETRY_MS = 3000
+
+# Ожидание событий в режиме long-poll
+LONG_POLL_TIMEOUT = 25
+
+_changed = threading.Condition()
+
+logger = logging.getLogger('crm.events')
+
+
+def record_deal_events(kind, deal_ids):
+    """Событие kind для сделок deal_ids (записывается после коммита)"""
+    defer_on_commit('deal_events',
+                    [(deal_id, kind) for deal_id in deal_ids],
+                    _write_events)
+
+
+def _write_events(items):
+    # Выполняется после коммита: изменения сделок уже сохранены,
+    # поэтому ошибка записи событий не должна ломать ответ. Доска
+    # без события обновится при следующем изменении или перезагрузке
+    try:
+        events = DealEvent.objects.bulk_create([
+            DealEvent(deal_id=deal_id, kind=kind)
+            for deal_id, kind in sorted(items)
+        ])
+        last_id = max((event.pk or 0) for event in events)
+        if last_id // EVENT_PRUNE_EVERY != (
+                last_id - len(events)) // EVENT_PRUNE_EVERY:
+            prune_events()
+    except DatabaseError:
+        logger.exception('Не удалось записать события сделок: %s',
+                         sorted(items))
+    with _changed:
+        _changed.notify_all()
+
+
+def prune_events():
+    """Удаление событий старше EVENT_RETENTION"""
+    DealEvent.objects.filter(
+        created_at__lt=timezone.now() - EVENT_RETENTION).delete()
+
+
+def latest_event_id():
+    """Id последнего события (курсор для новой страницы)"""
+    return DealEvent.objects.order_by('-id').values_list(
+        'id', flat=True).first() or 0
+
+
+def events_after(after_id, limit=EVENT_BATCH_LIMIT):
+    """События после курсора: список словарей id, deal_id, kind"""
+    return list(DealEvent.objects.filter(id__gt=after_id).order_by(
+        'id').values('id', 'deal_id', 'kind')[:limit])
+
+
+def wait_for_events(after_id, timeout):
+    """События после курсора; если их нет - ждать не дольше timeout"""
+    deadline = time.monotonic() + timeout
+    while True:
+        events = events_after(after_id)
+        remaining = deadline - time.monotonic()
+        if events or remaining <= 0:
+            return events
+        with _changed:
+            _changed.wait(min(EVENT_POLL_INTERVAL, remaining))
+
+
+async def aevent_stream(after_id):
+    """Части ответа text/event-stream с событиями после курсора.
+
+    Только для ASGI: ожидание опросом таблицы без занятого потока.
+    """
+    yield f'retry: {SSE_RETRY_MS}\n\n'
+    deadline = time.monotonic() + SSE_MAX_DURATION
+    keepalive_at = time.monotonic() + SSE_KEEPALIVE
+    while time.monotonic() < deadline:
+        events = await sync_to_async(events_after)(after_id)
+        if events:
+            for event in events:
+                yield _format_event(event)
+            after_id = events[-1]['id']
+            keepalive_at = time.monotonic() + SSE_KEEPALIVE
+            continue
+        if time.monotonic() >= keepalive_at:
+            yield ': keepalive\n\n'
+            keepalive_at = time.monotonic() + SSE_KEEPALIVE
+        await asyncio.sleep(EVENT_POLL_INTERVAL)
+
+
+def _format_event(event):
+    return f'id: {event["id"]}\nevent: deal\ndata: {json.dumps(event)}\n\n'
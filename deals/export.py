@@ -0,0 +1,76 @@
+"""Выгрузка сделок с фильтрами страницы всех сделок"""
+from django.db.models import OuterRef, Subquery
+
+from core.aggregates import GroupConcat
+from core.export import datetime_formatter
+from .filters import DEAL_SORT_ORDERINGS
+from .models import Deal, DealService
+from .search import SearchPaginator
+
+
+DEAL_EXPORT_HEADER = [
+    'ID', 'Дата создания', 'Клиент', 'Телефон', 'Email', 'Услуги',
+    'Стоимость', 'Статус', 'Дата начала', 'Дата окончания', 'Описание',
+]
+
+# Сколько строк читать из БД за один раз
+EXPORT_CHUNK_SIZE = 2000
+
+
+def _services_subquery():
+    """Названия услуг сделки одной строкой (подзапрос по индексу deal_id)"""
+    return Subquery(
+        DealService.objects.filter(deal=OuterRef('pk')).order_by().values(
+            'deal').annotate(
+                names=GroupConcat('service__name')).values('names'))
+
+
+def _deal_values(deals):
+    return deals.annotate(services_names=_services_subquery()).values_list(
+        'id', 'created_at', 'client__name', 'client__phone', 'client__email',
+        'services_names', 'total', 'status', 'start_date', 'end_date',
+        'description',
+    )
+
+
+def _by_relevance(deals, values, search_query):
+    """Строки в порядке релевантности: пачками по страницам поиска"""
+    paginator = SearchPaginator(deals, search_query,
+                                per_page=EXPORT_CHUNK_SIZE)
+    cursor = None
+    while True:
+        page = paginator.get_page(cursor)
+        rows = {row[0]: row for row in values.filter(
+            pk__in=page.object_list)}
+        for pk in page.object_list:
+            if pk in rows:
+                yield rows[pk]
+        if not page.has_next():
+            break
+        cursor = page.next_cursor
+
+
+def deal_export_rows(deals, sort_by, search_query=''):
+    """Строки выгрузки из отфильтрованного QuerySet сделок.
+
+    Читает кортежи values_list через iterator, стоимость берется
+    из сохраненного Deal.total, услуги склеиваются в SQL.
+    """
+    statuses = dict(Deal.STATUS_CHOICES)
+    format_datetime = datetime_formatter()
+    values = _deal_values(deals.select_related(None).prefetch_related(None))
+    if sort_by == 'relevance':
+        rows = _by_relevance(
+            deals, _deal_values(Deal.objects.order_by()), search_query)
+    else:
+        rows = values.order_by(*DEAL_SORT_ORDERINGS[sort_by]).iterator(
+            chunk_size=EXPORT_CHUNK_SIZE)
+
+    for (pk, created_at, client_name, phone, email, services, total,
+         status, start_date, end_date, description) in rows:
+        yield [
+            pk, format_datetime(created_at), client_name, phone,
+            email or '', services or '', total, statuses.get(status, status),
+            format_datetime(start_date), format_datetime(end_date),
+            description,
+        ]
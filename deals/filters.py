@@ -0,0 +1,82 @@
+"""Фильтры и сортировки списка сделок.
+
+Общие для страницы всех сделок и выгрузки, чтобы выгрузка
+содержала ровно то, что пользователь видит в списке.
+"""
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .search import search_filter
+
+
+# Сортировки списка сделок: ключ курсора всегда заканчивается уникальным id
+DEAL_SORT_ORDERINGS = {
+    'newest': ('-created_at', '-id'),
+    'oldest': ('created_at', 'id'),
+    'price_high': ('-total', '-id'),
+    'price_low': ('total', 'id'),
+}
+
+# Фильтры по дате создания: количество дней назад
+DATE_FILTER_DAYS = {
+    'week': 7,
+    'month': 30,
+    'quarter': 90,
+}
+
+
+def filter_deals(deals, params):
+    """Фильтрация QuerySet сделок по параметрам запроса.
+
+    Возвращает (deals, filters): filters - выбранные значения
+    фильтров для шаблона. Сортировка relevance доступна только
+    при полнотекстовом поиске (страницы - deals.search.SearchPaginator).
+    """
+    status_filter = params.get('status', 'all')
+    if status_filter != 'all':
+        deals = deals.filter(status=status_filter)
+
+    service_filter = params.get('service', 'all')
+    if service_filter != 'all' and service_filter.isdigit():
+        deals = deals.filter(dealservice__service_id=int(service_filter))
+
+    date_filter = params.get('date', 'all')
+    now = timezone.now()
+    if date_filter == 'today':
+        # Диапазон вместо created_at__date, чтобы работал индекс
+        deals = deals.filter(created_at__gte=timezone.localtime(now).replace(
+            hour=0, minute=0, second=0, microsecond=0))
+    elif date_filter in DATE_FILTER_DAYS:
+        deals = deals.filter(
+            created_at__gte=now - timedelta(days=DATE_FILTER_DAYS[date_filter]))
+
+    # Поиск по полнотекстовому индексу
+    search_query = params.get('search', '').strip()
+    searched = None
+    if search_query:
+        searched = search_filter(search_query)
+        if searched is None:
+            # СУБД без полнотекстового индекса
+            deals = deals.filter(
+                Q(client__name__icontains=search_query) |
+                Q(client__phone__icontains=search_query) |
+                Q(dealservice__service__name__icontains=search_query)
+            ).distinct()
+        else:
+            deals = deals.filter(searched)
+
+    sort_by = params.get(
+        'sort', 'relevance' if searched is not None else 'newest')
+    if sort_by not in DEAL_SORT_ORDERINGS and (
+            sort_by != 'relevance' or searched is None):
+        sort_by = 'newest'
+
+    return deals, {
+        'status_filter': status_filter,
+        'service_filter': service_filter,
+        'date_filter': date_filter,
+        'search_query': search_query,
+        'sort_by': sort_by,
+    }
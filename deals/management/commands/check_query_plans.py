@@ -0,0 +1,158 @@
+import datetime
+import re
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+
+from clients.models import Client
+from deals.models import Deal, DealService
+from price.models import Service
+
+
+# Полный проход по таблице (SQLite: "SCAN table", PostgreSQL: "Seq Scan")
+SQLITE_SCAN_RE = re.compile(
+    r'\bSCAN (?P<table>\w+)(?: AS \w+)?'
+    r'(?P<index> USING (?:COVERING |INTEGER PRIMARY KEY)?\s*INDEX)?')
+POSTGRESQL_SCAN_RE = re.compile(r'Seq Scan on (?P<table>\w+)')
+
+
+def _sample():
+    """Значения параметров для запросов из текущей базы"""
+    deal = Deal.objects.order_by('id').values('id', 'client_id').first()
+    service_id = Service.objects.order_by('id').values_list(
+        'id', flat=True).first()
+    phone = Client.objects.order_by('id').values_list(
+        'phone_normalized', flat=True).first()
+    return {
+        'deal_id': deal['id'] if deal else 1,
+        'client_id': deal['client_id'] if deal else 1,
+        'service_id': service_id or 1,
+        'phone': phone or '79990000000',
+        'now': timezone.now(),
+    }
+
+
+# Запросы горячих страниц: (имя, построитель QuerySet, допустим ли
+# проход по индексу в порядке сортировки - только для страниц с LIMIT)
+HOT_QUERIES = [
+    ('dashboard: активные сделки', lambda s: Deal.objects.filter(
+        status__in=Deal.ACTIVE_STATUSES).select_related('client'), False),
+    ('dashboard: просроченные сделки', lambda s: Deal.objects.filter(
+        status__in=Deal.ACTIVE_STATUSES, end_date__lt=s['now']), False),
+    ('dashboard: услуги активных сделок', lambda s: Service.objects.filter(
+        deal__in=Deal.objects.filter(status__in=Deal.ACTIVE_STATUSES)),
+     False),
+    ('all_deals: первая страница', lambda s: Deal.objects.order_by(
+        '-created_at', '-id')[:26], True),
+    ('all_deals: сортировка по стоимости', lambda s: Deal.objects.order_by(
+        '-total', '-id')[:26], True),
+    ('all_deals: фильтр по статусу', lambda s: Deal.objects.filter(
+        status='successful').order_by('-created_at', '-id')[:26], False),
+    ('all_deals: фильтр по дате', lambda s: Deal.objects.filter(
+        created_at__gte=s['now'] - datetime.timedelta(days=30)
+    ).order_by('-created_at', '-id')[:26], False),
+    ('client_detail: сделки клиента', lambda s: Deal.objects.filter(
+        client_id=s['client_id']).order_by('-created_at'), False),
+    ('сумма услуг сделки', lambda s: DealService.objects.filter(
+        deal_id=s['deal_id']).order_by().values('deal').annotate(
+            total=Sum('price')), False),
+    ('выручка услуги по статусу', lambda s: DealService.objects.filter(
+        service_id=s['service_id'], deal__status='successful'
+    ).order_by().values('service').annotate(revenue=Sum('price')), False),
+    ('статистика: услуги за месяц', lambda s: DealService.objects.filter(
+        deal__created_at__gte=s['now'] - datetime.timedelta(days=30),
+        deal__created_at__lt=s['now'],
+    ).order_by().values('service').annotate(revenue=Sum('price')), False),
+    ('find_client_api: поиск по телефону', lambda s: Client.objects.filter(
+        phone_normalized=s['phone']), False),
+    ('contacts: сортировка по потраченному', lambda s: Client.objects.order_by(
+        '-total_spent', '-id')[:49], True),
+    ('contacts: недавние сделки', lambda s: Client.objects.filter(
+        last_deal_at__isnull=False).order_by('-last_deal_at', '-id')[:49],
+     True),
+    ('счетчики клиента', lambda s: Deal.objects.filter(
+        client_id=s['client_id']).order_by().values('client').annotate(
+            deals_count=Count('id'), last_deal_at=Max('created_at')), False),
+]
+
+
+class Command(BaseCommand):
+    """Проверка планов запросов горячих страниц"""
+    help = ('Проверяет через EXPLAIN, что запросы горячих страниц '
+            'используют индексы, и замеряет их время')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat', type=int, default=0,
+            help='Сколько раз выполнить каждый запрос для замера времени')
+        parser.add_argument(
+            '--verbose-plans', action='store_true',
+            help='Выводить планы всех запросов')
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            raise CommandError(
+                f'Проверка планов не поддерживается для {connection.vendor}')
+
+        sample = _sample()
+        failures = []
+        for name, build, ordered_scan_ok in HOT_QUERIES:
+            queryset = build(sample)
+            plan = self._explain(queryset)
+            scans = self._full_scans(plan, ordered_scan_ok)
+
+            line = name
+            if options['repeat']:
+                line += f' - {self._timing(queryset, options["repeat"])}'
+            if scans:
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(
+                    f'{line}: полный проход по {", ".join(scans)}'))
+            else:
+                self.stdout.write(f'{line}: OK')
+            if scans or options['verbose_plans']:
+                self.stdout.write(plan)
+
+        if failures:
+            raise CommandError(
+                f'Запросы без индекса: {"; ".join(failures)}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Проверено запросов: {len(HOT_QUERIES)}'))
+
+    def _explain(self, queryset):
+        if connection.vendor == 'postgresql':
+            # На маленьких таблицах планировщик выбирает Seq Scan
+            # независимо от индексов, поэтому запрещаем его
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+                return queryset.explain()
+        return queryset.explain()
+
+    def _full_scans(self, plan, ordered_scan_ok):
+        if connection.vendor == 'postgresql':
+            return [m.group('table')
+                    for m in POSTGRESQL_SCAN_RE.finditer(plan)]
+        scans = []
+        for match in SQLITE_SCAN_RE.finditer(plan):
+            if match.group('table') == 'CONSTANT':
+                continue
+            # Проход по индексу без условия читает весь индекс;
+            # допустим только для сортировки с LIMIT
+            if match.group('index') and ordered_scan_ok:
+                continue
+            scans.append(match.group('table'))
+        return scans
+
+    def _timing(self, queryset, repeat):
+        durations = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            list(queryset.all())
+            durations.append((time.perf_counter() - started) * 1000)
+        return (f'медиана {statistics.median(durations):.2f} мс, '
+                f'макс {max(durations):.2f} мс')
@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    """Обслуживание базы: статистика планировщика и контрольная точка WAL.
+
+    Запускать периодически (cron, раз в час/сутки). На SQLite -
+    PRAGMA optimize (или полный ANALYZE с --analyze) и
+    wal_checkpoint(TRUNCATE), чтобы файл WAL не рос; на PostgreSQL - ANALYZE.
+    """
+    help = 'Обновляет статистику планировщика запросов и сжимает WAL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument('--analyze', action='store_true',
+                            help='Полный ANALYZE вместо PRAGMA optimize')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        started = time.perf_counter()
+
+        with connection.cursor() as cursor:
+            if connection.vendor != 'sqlite':
+                cursor.execute('ANALYZE')
+                self._done('ANALYZE', started)
+                return
+
+            if options['analyze']:
+                cursor.execute('ANALYZE')
+                self._done('ANALYZE', started)
+            else:
+                cursor.execute('PRAGMA optimize')
+                self._done('PRAGMA optimize', started)
+
+            started = time.perf_counter()
+            cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            busy, log_pages, checkpointed = cursor.fetchone()
+            if busy:
+                self.stdout.write(self.style.WARNING(
+                    'Контрольная точка WAL не завершена: база занята'))
+            else:
+                self._done(
+                    f'Контрольная точка WAL ({checkpointed} стр.)', started)
+
+    def _done(self, action, started):
+        self.stdout.write(self.style.SUCCESS(
+            f'{action}: {(time.perf_counter() - started) * 1000:.0f} мс'))
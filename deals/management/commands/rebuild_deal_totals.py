@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Sum, OuterRef, Subquery, Value, DecimalField
+from django.db.models.functions import Coalesce
+
+from deals.models import Deal, DealService
+
+
+class Command(BaseCommand):
+    """Пересчет и проверка сохраненной стоимости сделок"""
+    help = 'Пересчитывает поле Deal.total по услугам сделки'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только проверить суммы, ничего не изменяя')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Количество сделок в одном UPDATE')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        services_sum = DealService.objects.filter(
+            deal=OuterRef('pk')
+        ).order_by().values('deal').annotate(
+            total=Sum('price')).values('total')
+        deals = Deal.objects.order_by().annotate(
+            actual_total=Coalesce(
+                Subquery(services_sum),
+                Value(0),
+                output_field=DecimalField(max_digits=12, decimal_places=2)
+            )
+        ).values_list('id', 'total', 'actual_total')
+
+        mismatched = []
+        checked = 0
+        for deal_id, total, actual_total in deals.iterator(
+                chunk_size=batch_size):
+            checked += 1
+            if total != actual_total:
+                mismatched.append(deal_id)
+
+        self.stdout.write(
+            f'Проверено сделок: {checked}, расхождений: {len(mismatched)}')
+
+        if options['check']:
+            if mismatched:
+                preview = ', '.join(str(pk) for pk in mismatched[:20])
+                raise CommandError(
+                    f'Неверная сумма у сделок: {preview}'
+                    f'{"..." if len(mismatched) > 20 else ""}')
+            return
+
+        for start in range(0, len(mismatched), batch_size):
+            Deal.refresh_totals(mismatched[start:start + batch_size])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано сделок: {len(mismatched)}'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from deals import search
+
+
+class Command(BaseCommand):
+    """Полная перестройка полнотекстового индекса сделок"""
+    help = 'Перестраивает поисковый индекс сделок'
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            raise CommandError(
+                'Полнотекстовый поиск доступен только на SQLite и PostgreSQL')
+
+        indexed = search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(
+            f'Проиндексировано сделок: {indexed}'))
@@ -0,0 +1,288 @@
+import datetime
+import random
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
+from django.utils import timezone
+
+from clients.models import Client, AdditionalContact
+from core.cache import bump_versions
+from deals.models import Deal, DealService, Comment
+from price.models import Service, ServiceCategory
+
+
+# Каталог услуг: категория -> (название, цена, срок в днях)
+CATALOG = {
+    'Пошив': [
+        ('Пошив платья', 9000, 14), ('Пошив брюк', 5000, 10),
+        ('Пошив пиджака', 15000, 21), ('Пошив юбки', 4000, 7),
+        ('Пошив рубашки', 4500, 10), ('Пошив пальто', 25000, 30),
+    ],
+    'Ремонт одежды': [
+        ('Замена молнии', 800, 2), ('Подшив брюк', 500, 1),
+        ('Ушив по фигуре', 1500, 3), ('Замена подкладки', 3000, 5),
+        ('Штопка', 600, 2), ('Замена пуговиц', 300, 1),
+    ],
+    'Кожа и мех': [
+        ('Ремонт кожаной куртки', 4000, 7), ('Реставрация шубы', 12000, 14),
+        ('Укорачивание дубленки', 3500, 7), ('Покраска кожи', 5000, 10),
+    ],
+    'Вышивка': [
+        ('Машинная вышивка', 1200, 3), ('Ручная вышивка', 6000, 14),
+        ('Нанесение логотипа', 900, 2),
+    ],
+    'Химчистка': [
+        ('Чистка костюма', 1800, 3), ('Чистка пальто', 2200, 4),
+        ('Чистка платья', 1600, 3), ('Стирка и глажка', 700, 2),
+    ],
+}
+
+FIRST_NAMES = [
+    'Александр', 'Мария', 'Дмитрий', 'Анна', 'Сергей', 'Елена', 'Андрей',
+    'Ольга', 'Алексей', 'Наталья', 'Иван', 'Татьяна', 'Михаил', 'Ирина',
+    'Николай', 'Светлана', 'Павел', 'Юлия', 'Артем', 'Екатерина',
+]
+LAST_NAMES = [
+    'Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Петров',
+    'Соколов', 'Михайлов', 'Новиков', 'Федоров', 'Морозов', 'Волков',
+    'Алексеев', 'Лебедев', 'Семенов', 'Егоров', 'Павлов', 'Козлов',
+]
+DESCRIPTIONS = [
+    'Срочный заказ', 'Клиент принесет ткань', 'Примерка через неделю',
+    'Постоянный клиент', 'Нужна консультация по фасону', 'Подарок',
+    'Согласовать цвет ниток', '', '', '',
+]
+COMMENTS = [
+    'Позвонить клиенту', 'Клиент подтвердил заказ', 'Ожидаем ткань',
+    'Примерка назначена', 'Готово, ждем клиента', 'Внесена предоплата',
+    'Перенос сроков по просьбе клиента',
+]
+
+DEFAULT_STATUS_WEIGHTS = 'new=4,in_progress=4,ready=2,successful=60,closed=30'
+
+
+def parse_weights(value):
+    """Веса статусов из строки вида "new=4,successful=60" """
+    statuses = dict(Deal.STATUS_CHOICES)
+    weights = {}
+    try:
+        for item in value.split(','):
+            status, weight = item.split('=')
+            weights[status.strip()] = float(weight)
+    except ValueError:
+        raise CommandError(f'Неверный формат весов статусов: {value}')
+    unknown = set(weights) - set(statuses)
+    if unknown:
+        raise CommandError(f'Неизвестные статусы: {", ".join(unknown)}')
+    if not any(weights.values()):
+        raise CommandError('Все веса статусов равны нулю')
+    return weights
+
+
+def _batches(total, size):
+    for start in range(0, total, size):
+        yield min(size, total - start)
+
+
+class Command(BaseCommand):
+    """Генерация синтетических данных CRM"""
+    help = ('Заполняет базу синтетическими клиентами, услугами, '
+            'сделками и комментариями')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=1000,
+                            help='Количество клиентов')
+        parser.add_argument('--deals', type=int, default=10000,
+                            help='Количество сделок')
+        parser.add_argument('--services', type=int, default=0,
+                            help='Количество услуг (0 - весь каталог)')
+        parser.add_argument('--max-services', type=int, default=3,
+                            help='Максимум услуг в одной сделке')
+        parser.add_argument('--max-comments', type=int, default=3,
+                            help='Максимум комментариев к сделке')
+        parser.add_argument('--contacts-share', type=float, default=0.1,
+                            help='Доля сделок с дополнительным контактом')
+        parser.add_argument('--statuses', default=DEFAULT_STATUS_WEIGHTS,
+                            help='Веса статусов: new=4,successful=60,...')
+        parser.add_argument('--days', type=int, default=730,
+                            help='Глубина истории в днях')
+        parser.add_argument('--growth', type=float, default=1.0,
+                            help='Смещение сделок к последним датам '
+                                 '(0 - равномерно)')
+        parser.add_argument('--active-days', type=int, default=45,
+                            help='Сделки старше этого срока получают '
+                                 'только завершенные статусы')
+        parser.add_argument('--seed', type=int, default=42,
+                            help='Зерно генератора случайных чисел')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Размер пачки bulk_create')
+
+    def handle(self, *args, **options):
+        if options['clients'] < 1 and options['deals']:
+            raise CommandError('Для сделок нужен хотя бы один клиент')
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        self.weights = parse_weights(options['statuses'])
+        started = time.monotonic()
+
+        services = self._create_services(options['services'])
+        client_ids = self._create_clients(options['clients'])
+        self._create_deals(options, client_ids, services)
+
+        self.stdout.write('Перестройка поискового индекса, статистики '
+                          'и счетчиков клиентов...')
+        call_command('rebuild_search_index', stdout=self.stdout)
+        call_command('rebuild_statistics', stdout=self.stdout)
+        call_command('rebuild_client_stats', stdout=self.stdout)
+        bump_versions([
+            model._meta.label_lower
+            for model in (Deal, DealService, Client, Service)
+        ])
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.monotonic() - started:.1f} с'))
+
+    def _create_services(self, count):
+        rng = self.rng
+        catalog = [
+            (category, name, price, days)
+            for category, items in CATALOG.items()
+            for name, price, days in items
+        ]
+        count = count or len(catalog)
+
+        with transaction.atomic():
+            categories = ServiceCategory.objects.bulk_create([
+                ServiceCategory(name=name, order=order)
+                for order, name in enumerate(CATALOG)
+            ])
+            category_ids = {c.name: c.pk for c in categories}
+            services = []
+            for i in range(count):
+                category, name, price, days = catalog[i % len(catalog)]
+                if i >= len(catalog):
+                    name = f'{name} ({i // len(catalog) + 1})'
+                services.append(Service(
+                    name=name,
+                    price=Decimal(price) * Decimal(rng.choice(
+                        ['0.9', '1', '1', '1.1', '1.25'])),
+                    duration_days=days,
+                    is_active=rng.random() > 0.05,
+                    category_id=category_ids[category],
+                ))
+            services = Service.objects.bulk_create(services)
+
+        self.stdout.write(f'Услуг: {len(services)}')
+        return [(s.pk, s.price, s.duration_days) for s in services]
+
+    def _phone(self, number):
+        digits = f'9{number:09d}'
+        return (f'+7 ({digits[:3]}) {digits[3:6]}-'
+                f'{digits[6:8]}-{digits[8:]}')
+
+    def _create_clients(self, count):
+        rng = self.rng
+        # Уникальные номера без хранения всех сгенерированных телефонов
+        numbers = rng.sample(range(10 ** 9), count)
+        client_ids = []
+        for offset, size in enumerate(_batches(count, self.batch_size)):
+            start = offset * self.batch_size
+            clients = []
+            for number in numbers[start:start + size]:
+                first = rng.choice(FIRST_NAMES)
+                last = rng.choice(LAST_NAMES)
+                if first.endswith('а') or first.endswith('я'):
+                    last += 'а'
+                client = Client(
+                    name=f'{last} {first}',
+                    phone=self._phone(number),
+                    email=(f'client{number}@example.com'
+                           if rng.random() < 0.6 else None),
+                )
+                client.fill_phone_keys()
+                clients.append(client)
+            with transaction.atomic():
+                Client.objects.bulk_create(clients)
+            client_ids.extend(c.pk for c in clients)
+        self.stdout.write(f'Клиентов: {len(client_ids)}')
+        return client_ids
+
+    def _deal_status(self, age_days, active_days):
+        statuses = list(self.weights)
+        if age_days > active_days:
+            finished = [s for s in statuses
+                        if s not in Deal.ACTIVE_STATUSES
+                        and self.weights[s]]
+            if finished:
+                statuses = finished
+        return self.rng.choices(
+            statuses, weights=[self.weights[s] for s in statuses])[0]
+
+    def _create_deals(self, options, client_ids, services):
+        rng = self.rng
+        total = options['deals']
+        if not total:
+            return
+        author, _ = User.objects.get_or_create(username='seed_author')
+        growth = max(options['growth'], 0)
+        created = 0
+
+        for size in _batches(total, self.batch_size):
+            deals, items = [], []
+            for _ in range(size):
+                age = options['days'] * rng.random() ** (1 + growth)
+                start_date = self.now - datetime.timedelta(days=age)
+                chosen = rng.sample(services, rng.randint(
+                    1, min(options['max_services'], len(services))))
+                prices = [price for _, price, _ in chosen]
+                deals.append(Deal(
+                    client_id=rng.choice(client_ids),
+                    description=rng.choice(DESCRIPTIONS),
+                    status=self._deal_status(age, options['active_days']),
+                    start_date=start_date,
+                    end_date=start_date + datetime.timedelta(
+                        days=max(days for _, _, days in chosen)),
+                    total=sum(prices),
+                ))
+                items.append(chosen)
+
+            with transaction.atomic():
+                Deal.objects.bulk_create(deals)
+                DealService.objects.bulk_create([
+                    DealService(deal_id=deal.pk, service_id=service_id,
+                                price=price)
+                    for deal, chosen in zip(deals, items)
+                    for service_id, price, _ in chosen
+                ])
+                Comment.objects.bulk_create([
+                    Comment(deal_id=deal.pk, author=author,
+                            text=rng.choice(COMMENTS))
+                    for deal in deals
+                    for _ in range(rng.randint(0, options['max_comments']))
+                ])
+                AdditionalContact.objects.bulk_create([
+                    AdditionalContact(
+                        deal_id=deal.pk,
+                        name=rng.choice(FIRST_NAMES),
+                        phone=self._phone(rng.randrange(10 ** 9)))
+                    for deal in deals
+                    if rng.random() < options['contacts_share']
+                ])
+                # auto_now_add в bulk_create ставит текущее время,
+                # дату создания переносим на дату начала сделки
+                first_id, last_id = deals[0].pk, deals[-1].pk
+                Deal.objects.filter(pk__gte=first_id, pk__lte=last_id).update(
+                    created_at=F('start_date'), updated_at=F('start_date'))
+                Comment.objects.filter(
+                    deal__gte=first_id, deal__lte=last_id
+                ).update(
+                    created_at=Subquery(Deal.objects.filter(
+                        pk=OuterRef('deal_id')).values('start_date')[:1]))
+
+            created += size
+            self.stdout.write(f'Сделок: {created}/{total}')
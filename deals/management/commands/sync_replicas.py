@@ -0,0 +1,54 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core.routers import read_database_aliases
+
+
+class Command(BaseCommand):
+    """Копирование основной базы SQLite в файлы реплик.
+
+    Для локальной проверки маршрутизации чтения: реплики - отдельные
+    файлы (CRM_SQLITE_REPLICAS), копия снимается через backup API
+    SQLite и согласована даже во время записи. С --watch копирование
+    повторяется, имитируя отставание реплики.
+    """
+    help = 'Копирует основную базу SQLite в файлы реплик'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--watch', type=float, metavar='SECONDS',
+                            help='Повторять копирование с этим интервалом')
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES[DEFAULT_DB_ALIAS]
+        replicas = [
+            alias for alias in read_database_aliases()
+            if connections[alias].vendor == 'sqlite'
+            and str(settings.DATABASES[alias]['NAME']) != str(primary['NAME'])
+        ]
+        if connections[DEFAULT_DB_ALIAS].vendor != 'sqlite' or not replicas:
+            raise CommandError(
+                'Нет реплик SQLite в отдельных файлах (CRM_SQLITE_REPLICAS)')
+
+        while True:
+            for alias in replicas:
+                self._copy(primary['NAME'], alias)
+            if not options['watch']:
+                return
+            time.sleep(options['watch'])
+
+    def _copy(self, source_path, alias):
+        started = time.perf_counter()
+        connections[alias].close()
+        source = sqlite3.connect(source_path)
+        target = sqlite3.connect(settings.DATABASES[alias]['NAME'])
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        self.stdout.write(self.style.SUCCESS(
+            f'{alias}: {(time.perf_counter() - started) * 1000:.0f} мс'))
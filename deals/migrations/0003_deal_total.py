@@ -0,0 +1,36 @@
+# Generated by Django 4.2 on 2026-10-18 13:37
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_deal_totals(apps, schema_editor):
+    """Заполнение сохраненной стоимости для существующих сделок"""
+    Deal = apps.get_model('deals', 'Deal')
+    DealService = apps.get_model('deals', 'DealService')
+    services_sum = DealService.objects.filter(
+        deal=OuterRef('pk')
+    ).order_by().values('deal').annotate(
+        total=Sum('price')).values('total')
+    Deal.objects.update(total=Coalesce(
+        Subquery(services_sum),
+        Value(0),
+        output_field=models.DecimalField(max_digits=12, decimal_places=2)
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deals', '0002_alter_deal_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deal',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='Общая стоимость'),
+        ),
+        migrations.RunPython(fill_deal_totals, migrations.RunPython.noop),
+    ]
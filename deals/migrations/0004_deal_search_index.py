@@ -0,0 +1,81 @@
+from django.db import migrations
+
+
+# Копия SQL из deals.search на момент миграции: последующие правки
+# модуля не должны менять то, что делает уже примененная миграция
+SEARCH_TABLE = 'deals_deal_search'
+
+SQLITE_DOCUMENTS_SQL = """
+    SELECT d.id,
+           d.description || ' ' || c.name || ' ' || c.phone || ' '
+           || c.phone_normalized || ' ' || COALESCE(c.email, '') || ' '
+           || COALESCE((SELECT group_concat(s.name, ' ')
+                        FROM deals_dealservice ds
+                        JOIN price_service s ON s.id = ds.service_id
+                        WHERE ds.deal_id = d.id), '') || ' '
+           || COALESCE((SELECT group_concat(cm.text, ' ')
+                        FROM deals_comment cm
+                        WHERE cm.deal_id = d.id), '')
+    FROM deals_deal d
+    JOIN clients_client c ON c.id = d.client_id
+"""
+
+POSTGRESQL_DOCUMENTS_SQL = """
+    SELECT d.id,
+           to_tsvector('simple',
+               d.description || ' ' || c.name || ' ' || c.phone || ' '
+               || c.phone_normalized || ' ' || COALESCE(c.email, '') || ' '
+               || COALESCE((SELECT string_agg(s.name, ' ')
+                            FROM deals_dealservice ds
+                            JOIN price_service s ON s.id = ds.service_id
+                            WHERE ds.deal_id = d.id), '') || ' '
+               || COALESCE((SELECT string_agg(cm.text, ' ')
+                            FROM deals_comment cm
+                            WHERE cm.deal_id = d.id), ''))
+    FROM deals_deal d
+    JOIN clients_client c ON c.id = d.client_id
+"""
+
+
+def create_search_index(apps, schema_editor):
+    """Создание и первичное заполнение полнотекстового индекса"""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+            f"USING fts5(document, "
+            f"tokenize='unicode61 remove_diacritics 2')")
+        schema_editor.execute(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, document) "
+            f"{SQLITE_DOCUMENTS_SQL}")
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            f"CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ("
+            f"deal_id bigint PRIMARY KEY "
+            f"REFERENCES deals_deal(id) ON DELETE CASCADE "
+            f"DEFERRABLE INITIALLY DEFERRED, "
+            f"document tsvector NOT NULL)")
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document_gin "
+            f"ON {SEARCH_TABLE} USING GIN (document)")
+        schema_editor.execute(
+            f"INSERT INTO {SEARCH_TABLE} (deal_id, document) "
+            f"{POSTGRESQL_DOCUMENTS_SQL}")
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deals', '0003_deal_total'),
+        ('clients', '0003_client_phone_normalized'),
+        ('price', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
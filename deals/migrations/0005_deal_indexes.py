@@ -0,0 +1,41 @@
+# Generated by Django 4.2 on 2026-10-18 13:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deals', '0004_deal_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='deal',
+            index=models.Index(fields=['status', 'end_date'], name='deal_status_end_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deal',
+            index=models.Index(fields=['status', 'created_at'], name='deal_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deal',
+            index=models.Index(fields=['created_at', 'id'], name='deal_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deal',
+            index=models.Index(fields=['total', 'id'], name='deal_total_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deal',
+            index=models.Index(fields=['client', 'created_at'], name='deal_client_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dealservice',
+            index=models.Index(fields=['deal', 'price'], name='dealservice_deal_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dealservice',
+            index=models.Index(fields=['service', 'price'], name='dealservice_service_price_idx'),
+        ),
+    ]
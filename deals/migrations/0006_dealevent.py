@@ -0,0 +1,27 @@
+# Generated by Django 4.2 on 2026-10-18 14:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deals', '0005_deal_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DealEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('deal_id', models.BigIntegerField(verbose_name='Сделка')),
+                ('kind', models.CharField(choices=[('created', 'Создана'), ('updated', 'Изменена'), ('status', 'Изменен статус'), ('services', 'Изменены услуги'), ('deleted', 'Удалена')], max_length=20, verbose_name='Изменение')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Дата создания')),
+            ],
+            options={
+                'verbose_name': 'Событие сделки',
+                'verbose_name_plural': 'События сделок',
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-18 15:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deals', '0006_dealevent'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['deal', 'created_at'], name='comment_deal_created_idx'),
+        ),
+    ]
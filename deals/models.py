@@ -1,6 +1,7 @@
 from django.db import models
 from django.utils import timezone
-from django.db.models import Sum
+from django.db.models import Sum, OuterRef, Subquery, Value, DecimalField
+from django.db.models.functions import Coalesce
 from django.core.validators import MinValueValidator
 from django.contrib.auth.models import User
 
@@ -14,6 +15,8 @@ class Deal(models.Model):
         ('successful', 'Успешная'),
         ('closed', 'Закрытая'),
     ]
+    # Статусы сделок, которые находятся в работе (колонки канбана)
+    ACTIVE_STATUSES = ['new', 'in_progress', 'ready']
 
     # Используем строковую ссылку вместо импорта
     client = models.ForeignKey(
@@ -32,6 +35,9 @@ class Deal(models.Model):
                               default='new', verbose_name="Статус")
     start_date = models.DateTimeField(verbose_name="Дата начала")
     end_date = models.DateTimeField(verbose_name="Дата окончания")
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0,
+                                editable=False,
+                                verbose_name="Общая стоимость")
     created_at = models.DateTimeField(auto_now_add=True,
                                       verbose_name="Дата создания")
     updated_at = models.DateTimeField(auto_now=True,
@@ -41,6 +47,30 @@ class Deal(models.Model):
         verbose_name = "Сделка"
         verbose_name_plural = "Сделки"
         ordering = ['-created_at']
+        indexes = [
+            # Колонки канбана и просроченные сделки
+            models.Index(fields=['status', 'end_date'],
+                         name='deal_status_end_idx'),
+            # Архив с фильтром по статусу, отсортированный по дате
+            models.Index(fields=['status', 'created_at'],
+                         name='deal_status_created_idx'),
+            # Фильтр по дате и курсорная пагинация по (created_at, id)
+            models.Index(fields=['created_at', 'id'],
+                         name='deal_created_idx'),
+            # Сортировка по стоимости
+            models.Index(fields=['total', 'id'], name='deal_total_idx'),
+            # Сделки клиента по дате
+            models.Index(fields=['client', 'created_at'],
+                         name='deal_client_created_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        deal = super().from_db(db, field_names, values)
+        # Клиент при загрузке: при смене клиента пересчитываются
+        # счетчики обоих (deals.signals)
+        deal._loaded_client_id = deal.__dict__.get('client_id')
+        return deal
 
     def __str__(self):
         services_names = ", ".join(
@@ -51,16 +81,50 @@ class Deal(models.Model):
 
     @property
     def total_price(self):
-        """Общая стоимость всех услуг в сделке"""
-        return self.dealservice_set.aggregate(total=Sum('price'))['total'] or 0
+        """Общая стоимость всех услуг в сделке
+        (хранится в поле total и поддерживается сигналами DealService)"""
+        return self.total
+
+    @classmethod
+    def refresh_totals(cls, deal_ids):
+        """Пересчет сохраненной стоимости для набора сделок
+        одним UPDATE с подзапросом по услугам.
+
+        Вызывается при изменении услуг сделки, поэтому сдвигает и
+        updated_at (ключ кеша карточек).
+        """
+        services_sum = DealService.objects.filter(
+            deal=OuterRef('pk')
+        ).order_by().values('deal').annotate(
+            total=Sum('price')).values('total')
+        return cls.objects.filter(pk__in=deal_ids).update(
+            total=Coalesce(
+                Subquery(services_sum),
+                Value(0),
+                output_field=DecimalField(max_digits=12, decimal_places=2)
+            ),
+            updated_at=timezone.now(),
+        )
+
+    @classmethod
+    def touch(cls, deal_ids, batch_size=5000):
+        """Сдвиг updated_at без других изменений (связанные данные
+        изменились: клиент сделки)"""
+        now = timezone.now()
+        deal_ids = list(deal_ids)
+        for start in range(0, len(deal_ids), batch_size):
+            cls.objects.filter(
+                pk__in=deal_ids[start:start + batch_size]
+            ).update(updated_at=now)
 
     def get_services_with_prices(self):
         """Список услуг с ценами"""
         return self.dealservice_set.select_related('service').all()   
 
     def prices(self):
-        services = self.dealservice_set.values_list('service__name', flat=True)
-        return ', '.join(services)
+        """Названия услуг через запятую
+        (использует prefetch_related('services') если он есть)"""
+        return ', '.join(service.name for service in self.services.all())
 
     def add_service(self, service, price=None):
         """Добавление услуги к сделке"""
@@ -71,6 +135,8 @@ class Deal(models.Model):
             service=service,
             price=price or service.price
         )
+        # Сумма пересчитана сигналом, подтягиваем её в текущий объект
+        self.refresh_from_db(fields=['total'])
 
     def is_expired(self):
         """Проверка просрочена ли сделка"""
@@ -100,6 +166,13 @@ class DealService(models.Model):
         verbose_name = "Услуга в сделке"
         verbose_name_plural = "Услуги в сделках"
         unique_together = ['deal', 'service']
+        indexes = [
+            # Покрывающие индексы для сумм по сделке и по услуге
+            models.Index(fields=['deal', 'price'],
+                         name='dealservice_deal_price_idx'),
+            models.Index(fields=['service', 'price'],
+                         name='dealservice_service_price_idx'),
+        ]
 
     def __str__(self):
         return f"{self.deal} - {self.service.name} ({self.price} руб.)"
@@ -125,6 +198,41 @@ class Comment(models.Model):
         verbose_name = "Комментарий"
         verbose_name_plural = "Комментарии"
         ordering = ['-created_at']
+        indexes = [
+            # Лента комментариев сделки, новые первыми
+            models.Index(fields=['deal', 'created_at'],
+                         name='comment_deal_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.author} - {self.created_at.strftime('%d.%m.%Y %H:%M')}"
+
+
+class DealEvent(models.Model):
+    """Журнал изменений сделок для живого обновления канбана.
+
+    id события служит курсором: клиент запрашивает события после
+    последнего полученного id, поэтому его может обслужить любой воркер.
+    """
+    KIND_CHOICES = [
+        ('created', 'Создана'),
+        ('updated', 'Изменена'),
+        ('status', 'Изменен статус'),
+        ('services', 'Изменены услуги'),
+        ('deleted', 'Удалена'),
+    ]
+
+    # Без внешнего ключа: события об удаленных сделках тоже нужны
+    deal_id = models.BigIntegerField(verbose_name="Сделка")
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES,
+                            verbose_name="Изменение")
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True,
+                                      verbose_name="Дата создания")
+
+    class Meta:
+        verbose_name = "Событие сделки"
+        verbose_name_plural = "События сделок"
+        ordering = ['id']
+
+    def __str__(self):
+        return f"{self.deal_id}: {self.kind}"
@@ -0,0 +1,243 @@
+"""Полнотекстовый поиск по сделкам.
+
+Индекс хранится в отдельной таблице deals_deal_search:
+на SQLite это виртуальная таблица FTS5 (rowid = id сделки),
+на PostgreSQL - столбец tsvector с GIN индексом.
+Документ сделки собирается одним SQL запросом из описания,
+данных клиента, названий услуг и текстов комментариев.
+Найденные сделки отбираются подзапросом к индексу без ограничения
+количества (search_filter), страницы в порядке релевантности
+выбираются курсором по (ранг, id) в самом запросе к индексу
+(SearchPaginator). На остальных СУБД поиск недоступен и
+search_filter возвращает None.
+"""
+import re
+
+from django.db import connection, connections, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from core.pagination import (InvalidCursor, KeysetPage, decode_cursor,
+                             encode_cursor, estimate_count)
+
+
+SEARCH_TABLE = 'deals_deal_search'
+
+# Документы сделок: описание, клиент, услуги, комментарии
+SQLITE_DOCUMENTS_SQL = """
+    SELECT d.id,
+           d.description || ' ' || c.name || ' ' || c.phone || ' '
+           || c.phone_normalized || ' ' || COALESCE(c.email, '') || ' '
+           || COALESCE((SELECT group_concat(s.name, ' ')
+                        FROM deals_dealservice ds
+                        JOIN price_service s ON s.id = ds.service_id
+                        WHERE ds.deal_id = d.id), '') || ' '
+           || COALESCE((SELECT group_concat(cm.text, ' ')
+                        FROM deals_comment cm
+                        WHERE cm.deal_id = d.id), '')
+    FROM deals_deal d
+    JOIN clients_client c ON c.id = d.client_id
+"""
+
+POSTGRESQL_DOCUMENTS_SQL = """
+    SELECT d.id,
+           to_tsvector('simple',
+               d.description || ' ' || c.name || ' ' || c.phone || ' '
+               || c.phone_normalized || ' ' || COALESCE(c.email, '') || ' '
+               || COALESCE((SELECT string_agg(s.name, ' ')
+                            FROM deals_dealservice ds
+                            JOIN price_service s ON s.id = ds.service_id
+                            WHERE ds.deal_id = d.id), '') || ' '
+               || COALESCE((SELECT string_agg(cm.text, ' ')
+                            FROM deals_comment cm
+                            WHERE cm.deal_id = d.id), ''))
+    FROM deals_deal d
+    JOIN clients_client c ON c.id = d.client_id
+"""
+
+
+def is_supported(conn=None):
+    """Поддерживает ли текущая СУБД полнотекстовый индекс"""
+    return (conn or connection).vendor in ('sqlite', 'postgresql')
+
+
+def _id_placeholders(deal_ids):
+    return ', '.join(['%s'] * len(deal_ids))
+
+
+def index_deals(deal_ids, conn=None):
+    """Обновление документов индекса для указанных сделок.
+
+    Удаленные сделки убираются из индекса.
+    """
+    conn = conn or connection
+    deal_ids = list(deal_ids)
+    if not deal_ids or not is_supported(conn):
+        return
+
+    placeholders = _id_placeholders(deal_ids)
+    # Одна транзакция: параллельное обновление тех же сделок
+    # не вставит документ дважды
+    with transaction.atomic(using=conn.alias), conn.cursor() as cursor:
+        if conn.vendor == 'sqlite':
+            cursor.execute(
+                f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})",
+                deal_ids)
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE} (rowid, document) "
+                f"{SQLITE_DOCUMENTS_SQL} WHERE d.id IN ({placeholders})",
+                deal_ids)
+        else:
+            cursor.execute(
+                f"DELETE FROM {SEARCH_TABLE} "
+                f"WHERE deal_id IN ({placeholders})",
+                deal_ids)
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE} (deal_id, document) "
+                f"{POSTGRESQL_DOCUMENTS_SQL} WHERE d.id IN ({placeholders})",
+                deal_ids)
+
+
+def rebuild_index(conn=None):
+    """Полная перестройка индекса одним INSERT ... SELECT"""
+    conn = conn or connection
+    if not is_supported(conn):
+        return 0
+
+    documents_sql = (SQLITE_DOCUMENTS_SQL if conn.vendor == 'sqlite'
+                     else POSTGRESQL_DOCUMENTS_SQL)
+    id_column = 'rowid' if conn.vendor == 'sqlite' else 'deal_id'
+    # Одна транзакция: поиск не видит пустой индекс между DELETE и INSERT
+    with transaction.atomic(using=conn.alias), conn.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE} ({id_column}, document) "
+            f"{documents_sql}")
+        return cursor.rowcount
+
+
+def _query_terms(query):
+    """Слова поискового запроса без служебных символов"""
+    return re.findall(r'\w+', query.lower())
+
+
+def _match_query(terms, conn):
+    """Запрос к индексу: каждое слово - префикс, все слова обязательны"""
+    if conn.vendor == 'sqlite':
+        return ' '.join(f'"{term}"*' for term in terms)
+    return ' & '.join(f'{term}:*' for term in terms)
+
+
+def search_filter(query, conn=None):
+    """Условие на сделки, найденные по запросу (подзапрос к индексу).
+
+    Возвращает None, если СУБД не поддерживает индекс.
+    """
+    conn = conn or connection
+    if not is_supported(conn):
+        return None
+
+    terms = _query_terms(query)
+    if not terms:
+        return Q(pk__in=[])
+
+    if conn.vendor == 'sqlite':
+        sql = (f"SELECT rowid FROM {SEARCH_TABLE} "
+               f"WHERE {SEARCH_TABLE} MATCH %s")
+    else:
+        sql = (f"SELECT deal_id FROM {SEARCH_TABLE} "
+               f"WHERE document @@ to_tsquery('simple', %s)")
+    return Q(pk__in=RawSQL(sql, [_match_query(terms, conn)]))
+
+
+def _key(row):
+    """Ключ курсора (ранг, id) из строки (id, ранг)"""
+    return [row[1], row[0]]
+
+
+class SearchPaginator:
+    """Курсорная пагинация найденных сделок по релевантности.
+
+    deals - отфильтрованный QuerySet сделок (с условием search_filter),
+    страница выбирается запросом к индексу с условием по ключу
+    (ранг, id) последней показанной сделки. object_list страницы -
+    id сделок. count: None, 'exact' или 'estimate', как в
+    KeysetPaginator.
+    """
+
+    def __init__(self, deals, query, per_page=25, count=None):
+        self.deals = deals
+        self.terms = _query_terms(query)
+        self.per_page = per_page
+        self.count_mode = count
+        self.conn = connections[deals.db]
+
+    def _sql(self, direction, after):
+        """Запрос страницы; ранг - чем меньше, тем релевантнее"""
+        deals_sql, deals_params = self.deals.order_by().values(
+            'pk').query.sql_with_params()
+        if self.conn.vendor == 'sqlite':
+            id_column, rank = 'rowid', 'rank'
+            sql = (f"SELECT rowid, rank FROM {SEARCH_TABLE} "
+                   f"WHERE {SEARCH_TABLE} MATCH %s")
+            # +rowid: без этого FTS5 выполняет MATCH заново
+            # для каждого id из подзапроса
+            sql += f" AND +rowid IN ({deals_sql})"
+        else:
+            id_column, rank = 'deal_id', '-ts_rank(document, query)'
+            sql = (f"SELECT deal_id, {rank} FROM {SEARCH_TABLE}, "
+                   f"to_tsquery('simple', %s) query WHERE document @@ query")
+            sql += f" AND deal_id IN ({deals_sql})"
+        params = [_match_query(self.terms, self.conn), *deals_params]
+
+        lookup, order = ('>', 'ASC') if direction == 'n' else ('<', 'DESC')
+        if after is not None:
+            sql += (f" AND ({rank} {lookup} %s "
+                    f"OR ({rank} = %s AND {id_column} {lookup} %s))")
+            params += [after[0], after[0], after[1]]
+        sql += f" ORDER BY {rank} {order}, {id_column} {order} LIMIT %s"
+        return sql, params + [self.per_page + 1]
+
+    def _count(self):
+        if self.count_mode == 'exact':
+            return self.deals.count(), False
+        if self.count_mode == 'estimate':
+            return estimate_count(self.deals), True
+        return None, False
+
+    def get_page(self, cursor=None):
+        """Страница после (или перед) курсором; без курсора - первая"""
+        direction, after = 'n', None
+        if cursor:
+            try:
+                values, direction = decode_cursor(cursor)
+                after = (float(values[0]), int(values[1]))
+            except (InvalidCursor, ValueError, TypeError, IndexError):
+                # Поврежденный курсор - показываем первую страницу
+                direction, after = 'n', None
+
+        rows = []
+        if self.terms:
+            with self.conn.cursor() as db_cursor:
+                db_cursor.execute(*self._sql(direction, after))
+                rows = db_cursor.fetchall()
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == 'p':
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if direction == 'n':
+                if has_more:
+                    next_cursor = encode_cursor(_key(rows[-1]), 'n')
+                if after is not None:
+                    previous_cursor = encode_cursor(_key(rows[0]), 'p')
+            else:
+                next_cursor = encode_cursor(_key(rows[-1]), 'n')
+                if has_more:
+                    previous_cursor = encode_cursor(_key(rows[0]), 'p')
+
+        count, is_estimate = self._count()
+        return KeysetPage([row[0] for row in rows], next_cursor,
+                          previous_cursor, count, is_estimate)
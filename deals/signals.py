@@ -0,0 +1,158 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver, Signal
+
+from clients.models import Client
+from clients.stats import refresh_client_stats, refresh_deal_clients
+from core.cache import bump_versions_on_commit
+from core.deferred import defer_on_commit
+from price.models import Service, ServiceCategory
+from . import search
+from .events import record_deal_events
+from .models import Deal, DealService, Comment
+
+
+# Сигнал для массовых изменений сделок, которые не вызывают
+# post_save/post_delete (bulk_create, update). Аргументы: deal_ids и
+# необязательный change - вид изменения для ленты событий
+# (created, updated, status, services; по умолчанию updated).
+# sender=Client - у сделок изменились только данные клиента.
+deals_changed = Signal()
+
+
+@receiver(post_save, sender=DealService)
+@receiver(post_delete, sender=DealService)
+def update_deal_total(sender, instance, **kwargs):
+    """Пересчет сохраненной стоимости сделки при изменении её услуг"""
+    Deal.refresh_totals([instance.deal_id])
+    # Стоимость сделки входит в сумму, потраченную клиентом
+    refresh_deal_clients([instance.deal_id])
+
+
+# --- Счетчики сделок клиентов ---
+# Пересчитываются сразу, в транзакции изменения сделок
+
+@receiver(post_save, sender=Deal)
+def refresh_saved_deal_client(sender, instance, **kwargs):
+    client_ids = {instance.client_id}
+    loaded_client_id = getattr(instance, '_loaded_client_id', None)
+    if loaded_client_id is not None:
+        # Сделку могли перенести на другого клиента
+        client_ids.add(loaded_client_id)
+    instance._loaded_client_id = instance.client_id
+    refresh_client_stats(client_ids)
+
+
+@receiver(post_delete, sender=Deal)
+def refresh_deleted_deal_client(sender, instance, **kwargs):
+    refresh_client_stats([instance.client_id])
+
+
+@receiver(deals_changed)
+def refresh_changed_deal_clients(sender, deal_ids, **kwargs):
+    if sender is Client:
+        # Изменились только данные клиента, сделки те же
+        return
+    refresh_deal_clients(deal_ids)
+
+
+# --- Синхронизация поискового индекса ---
+
+def schedule_search_index(deal_ids):
+    """Отложенная переиндексация: в пределах транзакции
+    каждая сделка переиндексируется один раз"""
+    defer_on_commit('search_index', deal_ids, search.index_deals)
+
+
+@receiver(post_save, sender=Deal)
+@receiver(post_delete, sender=Deal)
+def index_deal(sender, instance, **kwargs):
+    schedule_search_index([instance.pk])
+
+
+@receiver(post_save, sender=DealService)
+@receiver(post_delete, sender=DealService)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def index_deal_relation(sender, instance, **kwargs):
+    schedule_search_index([instance.deal_id])
+
+
+@receiver(post_save, sender=Client)
+def index_client_deals(sender, instance, created, **kwargs):
+    if not created:
+        schedule_search_index(
+            instance.deals.values_list('id', flat=True))
+
+
+# --- Время изменения сделок для кеша фрагментов ---
+
+@receiver(post_save, sender=Client)
+def touch_client_deals(sender, instance, created, **kwargs):
+    """Данные клиента выводятся в карточках его сделок: сдвиг
+    updated_at и событие в ленте (обновление канбана и его ETag)"""
+    if not created:
+        deal_ids = list(instance.deals.values_list('id', flat=True))
+        Deal.touch(deal_ids)
+        record_deal_events('updated', deal_ids)
+
+
+@receiver(deals_changed)
+def touch_changed_client_deals(sender, deal_ids, **kwargs):
+    if sender is Client:
+        Deal.touch(deal_ids)
+
+
+@receiver(deals_changed)
+def index_changed_deals(sender, deal_ids, **kwargs):
+    schedule_search_index(deal_ids)
+
+
+# --- Версии данных для кеша агрегатов ---
+
+@receiver(post_save, sender=Deal)
+@receiver(post_delete, sender=Deal)
+@receiver(post_save, sender=DealService)
+@receiver(post_delete, sender=DealService)
+@receiver(post_save, sender=Client)
+@receiver(post_delete, sender=Client)
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+@receiver(post_save, sender=ServiceCategory)
+@receiver(post_delete, sender=ServiceCategory)
+def bump_data_version(sender, **kwargs):
+    bump_versions_on_commit([sender._meta.label_lower])
+
+
+@receiver(deals_changed)
+def bump_changed_deals_version(sender, **kwargs):
+    bump_versions_on_commit([
+        Deal._meta.label_lower, DealService._meta.label_lower])
+
+
+# --- Лента изменений для канбана ---
+
+@receiver(post_save, sender=Deal)
+def deal_saved_event(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        kind = 'created'
+    elif update_fields and set(update_fields) <= {'status', 'updated_at'}:
+        kind = 'status'
+    else:
+        kind = 'updated'
+    record_deal_events(kind, [instance.pk])
+
+
+@receiver(post_delete, sender=Deal)
+def deal_deleted_event(sender, instance, **kwargs):
+    record_deal_events('deleted', [instance.pk])
+
+
+@receiver(post_save, sender=DealService)
+@receiver(post_delete, sender=DealService)
+def deal_services_event(sender, instance, **kwargs):
+    record_deal_events('services', [instance.deal_id])
+
+
+@receiver(deals_changed)
+def changed_deals_event(sender, deal_ids, change='updated', **kwargs):
+    record_deal_events(change, deal_ids)
@@ -1,3 +1,846 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
+import csv
+import json
+import zipfile
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DatabaseError, connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from clients.models import Client
+from core.pagination import KeysetPaginator, nulls_last_ordering
+from core.testing import CRMTestCase, CRMTransactionTestCase, walk_pages
+from price.models import Service
+from .bulk import create_deals, replace_deal_services
+from .cards import attach_cards, attach_rows
+from .dashboard import load_dashboard_data
+from .events import aevent_stream
+from .export import DEAL_EXPORT_HEADER
+from .filters import DEAL_SORT_ORDERINGS, filter_deals
+from .models import Comment, Deal, DealEvent, DealService
+from .search import SearchPaginator
+from .views import COMMENTS_PER_PAGE
+
+
+def deal_data(client_name, client_phone, services, status='new',
+              description=''):
+    """Данные сделки для create_deals: services - список (услуга, цена)"""
+    now = timezone.now()
+    return {
+        'client_name': client_name,
+        'client_phone': client_phone,
+        'status': status,
+        'description': description,
+        'start_date': now.isoformat(),
+        'end_date': (now + timedelta(days=7)).isoformat(),
+        'services': [{'service_id': service.pk, 'price': price}
+                     for service, price in services],
+    }
+
+
+def check_command(name):
+    """Вывод команды сверки с --check (CommandError при расхождениях)"""
+    out = StringIO()
+    call_command(name, '--check', stdout=out)
+    return out.getvalue()
+
+
+class DealTotalTests(CRMTestCase):
+    """Deal.total поддерживается сигналами DealService"""
+
+    def setUp(self):
+        super().setUp()
+        self.repair = Service.objects.create(name='Ремонт', price=1500)
+        self.polish = Service.objects.create(name='Полировка', price=700)
+
+    def test_service_changes_update_total(self):
+        with self.commit():
+            first, second = create_deals([
+                deal_data('Иван Петров', '+79001112233',
+                          [(self.repair, '1000'), (self.polish, None)]),
+                deal_data('Анна Смирнова', '89004445566',
+                          [(self.polish, '500')]),
+            ])
+        first.refresh_from_db()
+        self.assertEqual(first.total, Decimal('1700'))
+
+        with self.commit():
+            replace_deal_services(first, [(self.repair.pk, '2500')])
+            DealService.objects.create(deal=second, service=self.repair,
+                                       price=300)
+            DealService.objects.filter(deal=second,
+                                       service=self.polish).delete()
+        self.assertEqual(Deal.objects.get(pk=first.pk).total,
+                         Decimal('2500'))
+        self.assertEqual(Deal.objects.get(pk=second.pk).total,
+                         Decimal('300'))
+        self.assertIn('расхождений: 0', check_command('rebuild_deal_totals'))
+
+    def test_stale_instance_keeps_stored_total(self):
+        with self.commit():
+            deal, = create_deals([deal_data(
+                'Иван Петров', '+79001112233', [(self.repair, '1000')])])
+        stale = Deal.objects.get(pk=deal.pk)
+        with self.commit():
+            DealService.objects.create(deal=deal, service=self.polish,
+                                       price=200)
+
+        # Смена статуса из канбана сохраняет только статус
+        response = self.client.post(
+            reverse('update_deal_status', args=[deal.pk]),
+            {'status': 'ready'})
+        self.assertEqual(response.status_code, 200)
+        stale.status = 'in_progress'
+        stale.save(update_fields=['status', 'updated_at'])
+
+        deal.refresh_from_db()
+        self.assertEqual((deal.status, deal.total),
+                         ('in_progress', Decimal('1200')))
+
+    def test_check_reports_and_fix_repairs_mismatch(self):
+        with self.commit():
+            deal, = create_deals([deal_data(
+                'Иван Петров', '+79001112233', [(self.repair, '1000')])])
+        # update() не отправляет сигналы
+        Deal.objects.filter(pk=deal.pk).update(total=1)
+        with self.assertRaises(CommandError):
+            check_command('rebuild_deal_totals')
+
+        call_command('rebuild_deal_totals', stdout=StringIO())
+        self.assertEqual(Deal.objects.get(pk=deal.pk).total, Decimal('1000'))
+        self.assertIn('расхождений: 0', check_command('rebuild_deal_totals'))
+
+
+class DashboardTests(CRMTestCase):
+    """Главная страница: число запросов не зависит от числа сделок"""
+
+    def setUp(self):
+        super().setUp()
+        self.repair = Service.objects.create(name='Ремонт', price=1500)
+        self.created = 0
+
+    def create(self, count, status='new', days=7):
+        with self.commit():
+            deals = create_deals([
+                deal_data(f'Клиент {number}', f'+7901{number:07}',
+                          [(self.repair, '1000')], status=status)
+                for number in range(self.created, self.created + count)
+            ])
+        self.created += count
+        if days < 0:
+            Deal.objects.filter(pk__in=[deal.pk for deal in deals]).update(
+                end_date=timezone.now() + timedelta(days=days))
+        return deals
+
+    def count_queries(self):
+        """Запросы холодной загрузки (без кеша агрегатов и карточек)"""
+        for cache in caches.all():
+            cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('dashboard'))
+        return len(queries)
+
+    def test_columns_and_expired_deals(self):
+        new = self.create(2)
+        in_progress = self.create(1, status='in_progress', days=-1)
+        self.create(3, status='successful')
+
+        data = load_dashboard_data()
+        self.assertEqual({deal.pk for deal in data['deals_new']},
+                         {deal.pk for deal in new})
+        self.assertEqual([deal.pk for deal in data['deals_in_progress']],
+                         [in_progress[0].pk])
+        self.assertEqual(data['deals_ready'], [])
+        self.assertEqual([deal.pk for deal in data['expired_deals']],
+                         [in_progress[0].pk])
+        self.assertEqual(data['status_counts'],
+                         {'new': 2, 'in_progress': 1, 'successful': 3})
+        self.assertEqual(data['total_revenue'], Decimal('6000'))
+        self.assertTrue(all(f'data-id="{deal.pk}"' in deal.card_html
+                            for deal in data['deals_new']))
+
+    def test_query_count_does_not_grow_with_deals(self):
+        self.create(2)
+        small = self.count_queries()
+        self.assertLessEqual(small, 10)
+        self.create(20, status='ready')
+        self.assertEqual(self.count_queries(), small)
+
+
+class BulkDealCreateTests(CRMTestCase):
+    """Пакетное создание сделок одной транзакцией"""
+
+    def setUp(self):
+        super().setUp()
+        self.repair = Service.objects.create(name='Ремонт', price=1500)
+        self.polish = Service.objects.create(name='Полировка', price=700)
+
+    def post_batch(self, payload):
+        with self.commit():
+            return self.client.post(reverse('create_deals_batch_api'),
+                                    json.dumps(payload),
+                                    content_type='application/json')
+
+    def test_batch_reuses_client_by_phone(self):
+        client = Client.objects.create(name='Иван', phone='+7 900 111-22-33')
+        response = self.post_batch({'deals': [
+            deal_data('Иван Петров', '89001112233',
+                      [(self.repair, '1000'), (self.polish, None)]),
+            deal_data('Анна Смирнова', '+79004445566',
+                      [(self.polish, '500')]),
+        ]})
+        self.assertEqual(response.status_code, 200)
+        deal_ids = response.json()['deal_ids']
+
+        client.refresh_from_db()
+        self.assertEqual(client.name, 'Иван Петров')
+        self.assertEqual(Client.objects.count(), 2)
+        self.assertEqual(
+            list(Deal.objects.filter(pk__in=deal_ids).order_by('id')
+                 .values_list('client_id', 'total')),
+            [(client.pk, Decimal('1700')),
+             (Client.objects.get(phone='+79004445566').pk, Decimal('500'))])
+
+    def test_error_in_one_deal_rolls_back_batch(self):
+        for bad_services in ([{'service_id': 999, 'price': '100'}],
+                             [{'service_id': self.repair.pk,
+                               'price': 'NaN'}]):
+            bad = deal_data('Анна Смирнова', '+79004445566', [])
+            bad['services'] = bad_services
+            response = self.post_batch({'deals': [
+                deal_data('Иван Петров', '+79001112233',
+                          [(self.repair, '1000')]),
+                bad,
+            ]})
+            self.assertEqual(response.status_code, 400)
+            self.assertFalse(response.json()['success'])
+        self.assertFalse(Deal.objects.exists())
+        self.assertFalse(Client.objects.exists())
+
+    def test_invalid_payload_types(self):
+        cases = [
+            ([deal_data('Иван', '+79001112233', [(self.repair, '1')])],
+             'error'),
+            ({'deals': {'client_name': 'Иван'}}, 'error'),
+            ({'deals': ['сделка']}, 'errors'),
+            ({'deals': [{**deal_data('Иван', '+79001112233', []),
+                         'services': 'Ремонт'}]}, 'errors'),
+            ({'deals': [{**deal_data('Иван', '+79001112233',
+                                     [(self.repair, '1')]),
+                         'status': ['new']}]}, 'errors'),
+        ]
+        for payload, key in cases:
+            with self.subTest(payload=payload):
+                response = self.post_batch(payload)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(key, response.json())
+        self.assertFalse(Deal.objects.exists())
+
+    def test_create_deal_form_view(self):
+        now = timezone.now()
+        form = {
+            'client_name': 'Иван Петров',
+            'client_phone': '+79001112233',
+            'status': 'new',
+            'start_date': now.isoformat(),
+            'end_date': (now + timedelta(days=3)).isoformat(),
+            'services[]': [self.repair.pk, self.polish.pk],
+            'prices[]': ['1000', ''],
+        }
+        with self.commit():
+            response = self.client.post(reverse('create_deal'), form)
+        self.assertRedirects(response, reverse('dashboard'),
+                             fetch_redirect_response=False)
+        self.assertEqual(Deal.objects.get().total, Decimal('1700'))
+
+        response = self.client.post(reverse('create_deal'),
+                                    {**form, 'end_date': 'завтра'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('general', response.json()['errors'])
+        self.assertEqual(Deal.objects.count(), 1)
+
+
+class DealSearchTests(CRMTestCase):
+    """Полнотекстовый поиск и фильтры списка сделок"""
+
+    def setUp(self):
+        super().setUp()
+        self.repair = Service.objects.create(name='Ремонт', price=1500)
+        self.polish = Service.objects.create(name='Полировка', price=700)
+        with self.commit():
+            self.deals = create_deals([
+                deal_data(f'Клиент Волков {number}', f'+7900000{number:04}',
+                          [(self.repair, 1000 + number)],
+                          status='successful' if number % 3 else 'new',
+                          description=f'заказ {number}')
+                for number in range(30)
+            ] + [
+                deal_data('Мария Соколова', '+79005550000',
+                          [(self.polish, '700')], description='стекло'),
+            ])
+
+    def search(self, params):
+        return filter_deals(Deal.objects.all(), params)
+
+    def test_search_by_client_service_and_comment(self):
+        deals, filters = self.search({'search': 'волк'})
+        self.assertEqual(deals.count(), 30)
+        self.assertEqual(filters['sort_by'], 'relevance')
+
+        deals, _ = self.search({'search': 'полиров'})
+        self.assertEqual(list(deals), [self.deals[-1]])
+
+        user = User.objects.create_user('manager', password='secret')
+        with self.commit():
+            Comment.objects.create(deal=self.deals[0], author=user,
+                                   text='Клиент просил перезвонить')
+        deals, _ = self.search({'search': 'перезвон'})
+        self.assertEqual(list(deals), [self.deals[0]])
+
+        deals, _ = self.search({'search': '!!!'})
+        self.assertFalse(deals.exists())
+
+    def test_search_with_filters(self):
+        deals, _ = self.search({'search': 'волков', 'status': 'new'})
+        self.assertEqual(deals.count(), 10)
+        self.assertTrue(all(deal.status == 'new' for deal in deals))
+
+        deals, _ = self.search({'search': 'волков',
+                                'service': str(self.polish.pk)})
+        self.assertFalse(deals.exists())
+
+    def test_index_follows_deletes_and_rebuild(self):
+        with self.commit():
+            self.deals[-1].delete()
+        deals, _ = self.search({'search': 'соколова'})
+        self.assertFalse(deals.exists())
+
+        call_command('rebuild_search_index', stdout=StringIO())
+        deals, _ = self.search({'search': 'волков'})
+        self.assertEqual(deals.count(), 30)
+
+    def test_relevance_pagination_walks_all_matches(self):
+        deals, filters = self.search({'search': 'волков'})
+        paginator = SearchPaginator(deals, filters['search_query'],
+                                    per_page=7, count='exact')
+        first = paginator.get_page()
+        self.assertEqual(first.count, 30)
+        self.assertFalse(first.has_previous())
+
+        seen, page = list(first), first
+        while page.has_next():
+            page = paginator.get_page(page.next_cursor)
+            seen += page.object_list
+        self.assertEqual(sorted(seen), sorted(deal.pk for deal in deals))
+
+        second = paginator.get_page(first.next_cursor)
+        back = paginator.get_page(second.previous_cursor)
+        self.assertEqual(back.object_list, first.object_list)
+
+    def test_all_deals_page_search(self):
+        response = self.client.get(reverse('closed_deals'), {
+            'search': 'соколова', 'count': 'exact'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Мария Соколова')
+        self.assertEqual(response.context['deals'].count, 1)
+
+
+class DealKeysetPaginationTests(CRMTestCase):
+    """Курсорная пагинация списка сделок по всем сортировкам"""
+
+    def setUp(self):
+        super().setUp()
+        repair = Service.objects.create(name='Ремонт', price=1500)
+        with self.commit():
+            # Повторяющиеся суммы: порядок внутри них задает id
+            create_deals([
+                deal_data(f'Клиент {number}', f'+7900000{number:04}',
+                          [(repair, 1000 + number % 4)],
+                          status='successful')
+                for number in range(30)
+            ])
+
+    def test_pages_follow_ordering_both_ways(self):
+        for sort_by, ordering in DEAL_SORT_ORDERINGS.items():
+            with self.subTest(sort=sort_by):
+                expected = list(Deal.objects.order_by(
+                    *nulls_last_ordering(Deal, ordering)).values_list(
+                    'pk', flat=True))
+                forward, backward = walk_pages(KeysetPaginator(
+                    Deal.objects.all(), ordering, per_page=5))
+                self.assertEqual(sum(forward, []), expected)
+                self.assertEqual(backward, forward)
+
+    def test_invalid_cursor_shows_first_page(self):
+        paginator = KeysetPaginator(Deal.objects.all(),
+                                    DEAL_SORT_ORDERINGS['price_high'],
+                                    per_page=5)
+        first = paginator.get_page()
+        for cursor in ('мусор', 'e30', first.next_cursor[:-3]):
+            self.assertEqual(paginator.get_page(cursor).object_list,
+                             first.object_list)
+
+    def test_all_deals_page_cursor(self):
+        url = reverse('closed_deals')
+        first = self.client.get(url, {'sort': 'price_low'})
+        page = first.context['deals']
+        self.assertTrue(page.has_next())
+        second = self.client.get(url, {'sort': 'price_low',
+                                       'cursor': page.next_cursor})
+        self.assertEqual(second.status_code, 200)
+        self.assertFalse(set(page.object_list)
+                         & set(second.context['deals'].object_list))
+
+
+class DealExportTests(CRMTestCase):
+    """Потоковая выгрузка сделок с фильтрами страницы всех сделок"""
+
+    def setUp(self):
+        super().setUp()
+        repair = Service.objects.create(name='Ремонт', price=1500)
+        polish = Service.objects.create(name='Полировка', price=700)
+        with self.commit():
+            self.deals = create_deals([
+                deal_data('Иван Петров', '+79001112233',
+                          [(repair, '1000'), (polish, '300')],
+                          status='successful', description='стекло'),
+                deal_data('Анна Смирнова', '+79004445566',
+                          [(repair, '2000')], status='successful'),
+                deal_data('Петр Волков', '+79007778899',
+                          [(polish, '500')], description='стекло'),
+            ])
+
+    def export(self, export_format, params):
+        response = self.client.get(
+            reverse('export_deals', args=[export_format]), params)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def csv_rows(self, params):
+        _, content = self.export('csv', params)
+        text = content.decode('utf-8')
+        self.assertTrue(text.startswith('\ufeff'))
+        return list(csv.reader(StringIO(text[1:]), delimiter=';'))
+
+    def test_csv_uses_page_filters_and_sort(self):
+        header, *rows = self.csv_rows({'status': 'successful',
+                                       'sort': 'price_high'})
+        self.assertEqual(header, DEAL_EXPORT_HEADER)
+        self.assertEqual(
+            [(row[2], row[6], row[7]) for row in rows],
+            [('Анна Смирнова', '2000.00', 'Успешная'),
+             ('Иван Петров', '1300.00', 'Успешная')])
+        self.assertEqual(sorted(rows[1][5].split(', ')),
+                         ['Полировка', 'Ремонт'])
+
+    def test_relevance_export_reads_all_pages(self):
+        with mock.patch('deals.export.EXPORT_CHUNK_SIZE', 1):
+            _, *rows = self.csv_rows({'search': 'стекло'})
+        self.assertEqual(sorted(row[2] for row in rows),
+                         ['Иван Петров', 'Петр Волков'])
+
+    def test_xlsx_export(self):
+        response, content = self.export('xlsx', {'sort': 'oldest'})
+        self.assertIn('.xlsx', response['Content-Disposition'])
+        with zipfile.ZipFile(BytesIO(content)) as archive:
+            sheet = archive.read('xl/worksheets/sheet1.xml').decode()
+        self.assertEqual(sheet.count('<row>'), 4)
+        self.assertLess(sheet.index('Иван Петров'),
+                        sheet.index('Петр Волков'))
+
+        response = self.client.get(reverse('export_deals', args=['pdf']))
+        self.assertEqual(response.status_code, 404)
+
+
+class DealStatusUpdateTests(CRMTestCase):
+    """Массовая смена статусов сделок для канбана"""
+
+    def setUp(self):
+        super().setUp()
+        repair = Service.objects.create(name='Ремонт', price=1500)
+        with self.commit():
+            self.first, self.second, self.third = create_deals([
+                deal_data('Иван Петров', '+79001112233',
+                          [(repair, '1000')]),
+                deal_data('Иван Петров', '+79001112233',
+                          [(repair, '500')]),
+                deal_data('Анна Смирнова', '+79004445566',
+                          [(repair, '700')], status='ready'),
+            ])
+
+    def post_changes(self, payload):
+        with self.commit():
+            return self.client.post(reverse('update_deal_statuses_api'),
+                                    json.dumps(payload),
+                                    content_type='application/json')
+
+    def statuses(self):
+        return dict(Deal.objects.values_list('pk', 'status'))
+
+    def test_changes_applied_with_per_item_results(self):
+        response = self.post_changes({'changes': [
+            {'id': self.first.pk, 'status': 'in_progress'},
+            [self.second.pk, 'ready'],
+            {'id': self.second.pk, 'status': 'successful'},
+            {'id': self.third.pk, 'status': 'ready'},
+            {'id': 999999, 'status': 'new'},
+            {'id': self.third.pk, 'status': 'unknown'},
+        ]})
+        data = response.json()
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(data['success'])
+        self.assertEqual(data['message'], 'Обновлено сделок: 3')
+        self.assertEqual(
+            [(result['id'], result['success'], result.get('changed'))
+             for result in data['results']],
+            [(self.first.pk, True, True), (self.second.pk, True, True),
+             (self.second.pk, True, True), (self.third.pk, True, False),
+             (999999, False, None), (self.third.pk, False, None)])
+        self.assertEqual(self.statuses(), {
+            self.first.pk: 'in_progress',
+            self.second.pk: 'successful',
+            self.third.pk: 'ready',
+        })
+
+        client = Client.objects.get(pk=self.first.client_id)
+        self.assertEqual((client.active_deals_count, client.total_spent),
+                         (1, Decimal('500')))
+
+    def test_invalid_payloads(self):
+        for payload in ([{'id': self.first.pk, 'status': 'ready'}],
+                        {'changes': {'id': self.first.pk}},
+                        {'changes': []},
+                        {'changes': [{'id': self.first.pk,
+                                      'status': ['ready']}]}):
+            with self.subTest(payload=payload):
+                response = self.post_changes(payload)
+                self.assertFalse(response.json()['success'])
+        self.assertEqual(self.statuses()[self.first.pk], 'new')
+
+        response = self.client.get(reverse('update_deal_statuses_api'))
+        self.assertEqual(response.status_code, 405)
+
+
+class DealEventsTests(CRMTestCase):
+    """Лента изменений сделок: запись после коммита, long-poll и SSE"""
+
+    def setUp(self):
+        super().setUp()
+        self.repair = Service.objects.create(name='Ремонт', price=1500)
+
+    def create(self):
+        with self.commit():
+            deal, = create_deals([deal_data(
+                'Иван Петров', '+79001112233', [(self.repair, '1000')])])
+        return deal
+
+    def events(self):
+        return list(DealEvent.objects.values_list('deal_id', 'kind'))
+
+    def test_events_written_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            deal, = create_deals([deal_data(
+                'Иван Петров', '+79001112233', [(self.repair, '1000')])])
+        self.assertEqual(self.events(), [])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.events(), [(deal.pk, 'created')])
+
+        with self.commit():
+            deal.status = 'ready'
+            deal.save(update_fields=['status', 'updated_at'])
+        pk = deal.pk
+        with self.commit():
+            deal.delete()
+        # Удаление сделки удаляет и ее услуги
+        self.assertEqual(self.events()[1:], [
+            (pk, 'status'), (pk, 'deleted'), (pk, 'services')])
+
+    def test_long_poll_returns_events_after_cursor(self):
+        url = reverse('deal_events')
+        self.create()
+        after = DealEvent.objects.get().pk
+        second = self.create()
+
+        data = self.client.get(url, {'mode': 'poll', 'after': after}).json()
+        self.assertEqual([event['deal_id'] for event in data['events']],
+                         [second.pk])
+        self.assertEqual(data['last_id'], data['events'][-1]['id'])
+
+        with mock.patch('deals.views.LONG_POLL_TIMEOUT', 0):
+            data = self.client.get(url, {'mode': 'poll',
+                                         'after': data['last_id']}).json()
+        self.assertEqual(data['events'], [])
+
+    def test_sse_only_under_asgi(self):
+        # Под WSGI поток не открывается: доска работает через long-poll
+        response = self.client.get(reverse('deal_events'))
+        self.assertEqual(response.status_code, 204)
+        self.assertContains(self.client.get(reverse('dashboard')),
+                            'data-events-mode="poll"')
+
+    async def test_event_stream_format(self):
+        deal = await Deal.objects.acreate(
+            client=await Client.objects.acreate(name='Иван Петров',
+                                                phone='+79001112233'),
+            start_date=timezone.now(), end_date=timezone.now())
+        event = await DealEvent.objects.acreate(deal_id=deal.pk,
+                                                kind='created')
+        stream = aevent_stream(event.pk - 1)
+        self.assertEqual(await anext(stream), 'retry: 3000\n\n')
+        message = await anext(stream)
+        await stream.aclose()
+        self.assertTrue(message.startswith(f'id: {event.pk}\nevent: deal\n'))
+        self.assertEqual(
+            json.loads(message.split('data: ')[1]),
+            {'id': event.pk, 'deal_id': deal.pk, 'kind': 'created'})
+
+    def test_event_write_failure_is_logged(self):
+        with mock.patch.object(DealEvent.objects, 'bulk_create',
+                               side_effect=DatabaseError('locked')):
+            with self.assertLogs('crm.events', 'ERROR'):
+                deal = self.create()
+        self.assertEqual(Deal.objects.get().pk, deal.pk)
+        self.assertEqual(self.events(), [])
+
+
+class DashboardApiTests(CRMTransactionTestCase):
+    """JSON API канбана с ETag и условным GET"""
+
+    def setUp(self):
+        super().setUp()
+        repair = Service.objects.create(name='Ремонт', price=1500)
+        self.deal, _ = create_deals([
+            deal_data('Иван Петров', '+79001112233', [(repair, '1000')]),
+            deal_data('Анна Смирнова', '+79004445566', [(repair, '500')],
+                      status='successful'),
+        ])
+        self.url = reverse('dashboard_api')
+
+    def test_columns_and_counts(self):
+        response = self.client.get(self.url)
+        data = response.json()
+        self.assertEqual(data['columns'],
+                         {'new': [self.deal.pk], 'in_progress': [],
+                          'ready': []})
+        self.assertEqual(data['counts'], {'new': 1, 'successful': 1})
+        self.assertEqual(data['deals'][0]['services'], ['Ремонт'])
+        self.assertEqual(data['deals'][0]['client']['name'], 'Иван Петров')
+        self.assertIn('no-cache', response['Cache-Control'])
+
+    def test_not_modified_until_deal_changes(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        self.deal.status = 'ready'
+        self.deal.save(update_fields=['status', 'updated_at'])
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['columns']['ready'],
+                         [self.deal.pk])
+
+    def test_expired_deal_changes_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        # Срок прошел без изменения данных сделки
+        Deal.objects.filter(pk=self.deal.pk).update(
+            end_date=timezone.now() - timedelta(minutes=1))
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['expired'], [self.deal.pk])
+
+    def test_only_get(self):
+        self.assertEqual(self.client.post(self.url).status_code, 405)
+
+
+class FragmentCacheTests(CRMTestCase):
+    """Кеш карточек и строк сделок по updated_at"""
+
+    def setUp(self):
+        super().setUp()
+        self.repair = Service.objects.create(name='Ремонт', price=1500)
+        with self.commit():
+            self.deal, = create_deals([deal_data(
+                'Иван Петров', '+79001112233', [(self.repair, '1000')])])
+
+    def card(self):
+        deals = list(Deal.objects.only('id', 'status', 'end_date',
+                                       'updated_at'))
+        return attach_cards(deals)[0].card_html
+
+    def test_cached_card_needs_no_queries(self):
+        html = self.card()
+        deals = list(Deal.objects.only('id', 'updated_at'))
+        with self.assertNumQueries(0):
+            self.assertEqual(attach_cards(deals)[0].card_html, html)
+        self.assertIn('<td', attach_rows(deals)[0].row_html)
+
+    def test_related_changes_refresh_fragment(self):
+        self.assertIn('Иван Петров', self.card())
+
+        client = Client.objects.get()
+        client.name = 'Иван Сергеевич'
+        with self.commit():
+            client.save()
+        self.assertIn('Иван Сергеевич', self.card())
+
+        self.repair.name = 'Кузовной ремонт'
+        with self.commit():
+            self.repair.save()
+        self.assertIn('Кузовной ремонт', self.card())
+
+        with self.commit():
+            replace_deal_services(self.deal, [(self.repair.pk, '2500')])
+        self.assertIn('2500', self.card())
+
+    def test_cards_endpoint(self):
+        response = self.client.get(reverse('deal_cards'),
+                                   {'ids': f'{self.deal.pk},999999,x'})
+        data = response.json()
+        self.assertEqual(data['missing'], [999999])
+        card, = data['cards']
+        self.assertEqual((card['id'], card['status'], card['active']),
+                         (self.deal.pk, 'new', True))
+        self.assertIn(f'data-id="{self.deal.pk}"', card['html'])
+
+
+class DealCommentsTests(CRMTestCase):
+    """Страница сделки: первая страница комментариев и подгрузка"""
+
+    def setUp(self):
+        super().setUp()
+        repair = Service.objects.create(name='Ремонт', price=1500)
+        with self.commit():
+            self.deal, = create_deals([deal_data(
+                'Иван Петров', '+79001112233', [(repair, '1000')])])
+        self.user = User.objects.create_user('manager', password='secret')
+        self.url = reverse('deal_detail', args=[self.deal.pk])
+
+    def add_comments(self, count):
+        with self.commit():
+            Comment.objects.bulk_create([
+                Comment(deal=self.deal, author=self.user,
+                        text=f'Комментарий {number}')
+                for number in range(count)
+            ])
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_comments(self):
+        self.add_comments(2)
+        few = self.count_queries()
+        self.add_comments(3 * COMMENTS_PER_PAGE)
+        self.assertEqual(self.count_queries(), few)
+
+    def test_older_comments_loaded_by_cursor(self):
+        self.add_comments(COMMENTS_PER_PAGE * 2 + 5)
+        page = self.client.get(self.url).context['comments']
+        self.assertEqual(len(page), COMMENTS_PER_PAGE)
+
+        loaded = len(page)
+        cursor = page.next_cursor
+        while cursor:
+            data = self.client.get(
+                reverse('deal_comments', args=[self.deal.pk]),
+                {'cursor': cursor}).json()
+            self.assertEqual(data['html'].count('class="comment"'),
+                             data['count'])
+            loaded += data['count']
+            cursor = data['next_cursor']
+        self.assertEqual(loaded, COMMENTS_PER_PAGE * 2 + 5)
+        self.assertEqual(
+            [comment.pk for comment in page],
+            list(Comment.objects.order_by('-created_at', '-id').values_list(
+                'pk', flat=True)[:COMMENTS_PER_PAGE]))
+
+    def test_add_comment(self):
+        self.client.force_login(self.user)
+        with self.commit():
+            response = self.client.post(self.url, {
+                'add_comment': '1', 'text': 'Клиент просил перезвонить'})
+        self.assertRedirects(response, self.url)
+        self.assertContains(self.client.get(self.url),
+                            'Клиент просил перезвонить')
+
+
+class DealsApiTests(CRMTestCase):
+    """JSON API сделок: выбор полей, фильтры и курсорная пагинация"""
+
+    def setUp(self):
+        super().setUp()
+        self.repair = Service.objects.create(name='Ремонт', price=1500)
+        self.polish = Service.objects.create(name='Полировка', price=700)
+        with self.commit():
+            self.deals = create_deals([
+                deal_data(f'Клиент Волков {number}', f'+7900000{number:04}',
+                          [(self.repair, 1000 + number)],
+                          status='successful' if number % 3 else 'new')
+                for number in range(30)
+            ])
+        self.url = reverse('deals_api')
+
+    def test_fields_and_detail(self):
+        data = self.client.get(self.url, {
+            'fields': 'status,total', 'limit': 1}).json()
+        self.assertEqual(data['deals'], [{
+            'id': self.deals[-1].pk, 'status': 'successful',
+            'total': 1029.0}])
+
+        with self.commit():
+            self.deals[0].add_service(self.polish, 200)
+        response = self.client.get(
+            reverse('deal_detail_api', args=[self.deals[0].pk]),
+            {'fields': 'client,services'})
+        deal = response.json()['deal']
+        self.assertEqual(deal['client']['name'], 'Клиент Волков 0')
+        self.assertEqual(
+            sorted((item['name'], item['price']) for item in deal['services']),
+            [('Полировка', 200), ('Ремонт', 1000)])
+
+    def test_invalid_params(self):
+        for params in ({'fields': 'id,secret'}, {'limit': '0'},
+                       {'limit': 'all'}):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 400)
+        response = self.client.get(
+            reverse('deal_detail_api', args=[999999]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_pagination_and_count(self):
+        params = {'search': 'волков', 'status': 'successful',
+                  'limit': 8, 'fields': 'id,status'}
+        data = self.client.get(self.url, {**params, 'count': 'exact'}).json()
+        self.assertEqual(data['count'], 20)
+        self.assertFalse(data['count_is_estimate'])
+
+        ids = [deal['id'] for deal in data['deals']]
+        while data['next_cursor']:
+            data = self.client.get(self.url, {
+                **params, 'cursor': data['next_cursor']}).json()
+            ids += [deal['id'] for deal in data['deals']]
+        self.assertEqual(len(ids), 20)
+        self.assertEqual(len(set(ids)), 20)
+
+    def test_keyset_pagination_by_price(self):
+        params = {'sort': 'price_high', 'limit': 10, 'fields': 'total'}
+        data = self.client.get(self.url, params).json()
+        totals = [deal['total'] for deal in data['deals']]
+        while data['next_cursor']:
+            data = self.client.get(self.url, {
+                **params, 'cursor': data['next_cursor']}).json()
+            totals += [deal['total'] for deal in data['deals']]
+        self.assertEqual(len(totals), 30)
+        self.assertEqual(totals, sorted(totals, reverse=True))
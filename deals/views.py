@@ -1,155 +1,183 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse
-from django.db.models import Q, Sum, Count
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
 from django.utils import timezone
-from django.core.paginator import Paginator
 from django.contrib import messages
+from django.core.exceptions import ValidationError
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
-from datetime import timedelta
-from decimal import Decimal
 import json
 
-from deals.models import Deal, DealService
-from clients.models import Client
+from deals.models import Comment, Deal
 from price.models import Service
 from core.forms import CommentForm
-
-
+from core.pagination import KeysetPaginator, requested_count_mode
+from deals.cards import attach_cards, attach_rows
+from deals.dashboard import load_dashboard_data
+from deals.events import (EVENT_BATCH_LIMIT, LONG_POLL_TIMEOUT, aevent_stream,
+                          latest_event_id, wait_for_events)
+from deals.bulk import create_deal_with_services
+from deals.filters import DEAL_SORT_ORDERINGS, filter_deals
+from deals.search import SearchPaginator
+from deals.export import DEAL_EXPORT_HEADER, deal_export_rows
+from core.export import export_response
+from core.routers import use_read_database
+
+
+@use_read_database
 def dashboard(request):
     """Главная страница с группировкой сделок по статусам"""
-    # Активные услуги
-    services = Service.objects.filter(is_active=True)
-    clients = Client.objects.all().order_by('name')
-
-    # Сделки с предзагрузкой связанных данных
-    deals_new = Deal.objects.filter(
-        status='new').select_related(
-            'client').prefetch_related('services')
-    deals_in_progress = Deal.objects.filter(
-        status='in_progress').select_related(
-            'client').prefetch_related('services')
-    deals_ready = Deal.objects.filter(
-        status='ready').select_related(
-            'client').prefetch_related('services')
-    deals_completed = Deal.objects.filter(
-        status='completed').select_related(
-            'client').prefetch_related('services')
-    deals_cancelled = Deal.objects.filter(
-        status='cancelled').select_related(
-            'client').prefetch_related('services')
-
-    # Статистика по статусам
-    deals_by_status = Deal.objects.values('status').annotate(count=Count('id'))
-    status_counts = {status: count for status, count in deals_by_status}
-
-    # Просроченные сделки (не завершенные и дата окончания прошла)
-    expired_deals = Deal.objects.filter(
-        Q(status__in=['new', 'in_progress', 'ready']) &
-        Q(end_date__lt=timezone.now())
-    ).select_related('client').prefetch_related('services')
-
-    # Общая статистика
-    total_deals = Deal.objects.count()
-    total_revenue = DealService.objects.aggregate(
-        total=Sum('price'))['total'] or 0
-
-    # Статистика по услугам
-    popular_services = Service.objects.annotate(
-        deal_count=Count('dealservice')
-    ).order_by('-deal_count')[:5]
-
-    context = {
-        'deals_new': deals_new,
-        'deals_in_progress': deals_in_progress,
-        'deals_ready': deals_ready,
-        'deals_completed': deals_completed,
-        'deals_cancelled': deals_cancelled,
-        'expired_deals': expired_deals,
-        'status_counts': status_counts,
-        'services': services,
-        'total_deals': total_deals,
-        'total_revenue': total_revenue,
-        'popular_services': popular_services,
-        'clients': clients,
-    }
+    context = load_dashboard_data()
+    # Курсор ленты изменений: доска получает события после этого id
+    context['last_event_id'] = latest_event_id()
+    # SSE держит соединение открытым: только под ASGI, иначе long-poll
+    context['events_mode'] = (
+        'sse' if isinstance(request, ASGIRequest) else 'poll')
+    # Активные услуги для формы новой сделки
+    context['services'] = Service.objects.filter(is_active=True)
     return render(request, 'dashboard.html', context)
 
 
+@use_read_database
+def deal_events(request):
+    """Лента изменений сделок: SSE, с ?mode=poll - long-poll JSON.
+
+    SSE отдается только под ASGI: синхронный поток занимал бы воркер
+    WSGI на все время соединения. Курсор - заголовок Last-Event-ID
+    (переподключение EventSource) или параметр after; без курсора -
+    только новые события.
+    """
+    after = request.headers.get('Last-Event-ID') or request.GET.get('after')
+    try:
+        after = int(after)
+    except (TypeError, ValueError):
+        after = latest_event_id()
+
+    if request.GET.get('mode') == 'poll':
+        events = wait_for_events(after, LONG_POLL_TIMEOUT)
+        return JsonResponse({
+            'events': events,
+            'last_id': events[-1]['id'] if events else after,
+        })
+
+    if not isinstance(request, ASGIRequest):
+        # 204: EventSource не переподключается, доска работает через poll
+        return HttpResponse(status=204)
+
+    response = StreamingHttpResponse(
+        aevent_stream(after), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@use_read_database
+def deal_cards(request):
+    """Карточки канбана по списку id (?ids=1,2,3) для обновления доски"""
+    ids = [
+        int(value) for value in request.GET.get('ids', '').split(',')
+        if value.isdigit()
+    ][:EVENT_BATCH_LIMIT]
+    deals = Deal.objects.filter(pk__in=ids).only(
+        'id', 'status', 'end_date', 'updated_at')
+
+    now = timezone.now()
+    cards = []
+    for deal in attach_cards(deals):
+        active = deal.status in Deal.ACTIVE_STATUSES
+        cards.append({
+            'id': deal.id,
+            'status': deal.status,
+            'active': active,
+            'expired': active and deal.end_date < now,
+            'html': deal.card_html,
+        })
+
+    found = {card['id'] for card in cards}
+    return JsonResponse({
+        'cards': cards,
+        'missing': [pk for pk in ids if pk not in found],
+    })
+
+
+@use_read_database
 def all_deals(request):
-    # Получаем все сделки
-    deals = Deal.objects.select_related('client').all()
-
-    # Фильтрация по статусу
-    status_filter = request.GET.get('status', 'all')
-    if status_filter != 'all':
-        deals = deals.filter(status=status_filter)
-
-    # Фильтрация по дате
-    date_filter = request.GET.get('date', 'all')
-    if date_filter != 'all':
-        from django.utils import timezone
-        from datetime import timedelta
-
-        now = timezone.now()
-        if date_filter == 'today':
-            deals = deals.filter(created_at__date=now.date())
-        elif date_filter == 'week':
-            week_ago = now - timedelta(days=7)
-            deals = deals.filter(created_at__gte=week_ago)
-        elif date_filter == 'month':
-            month_ago = now - timedelta(days=30)
-            deals = deals.filter(created_at__gte=month_ago)
-        elif date_filter == 'quarter':
-            quarter_ago = now - timedelta(days=90)
-            deals = deals.filter(created_at__gte=quarter_ago)
-
-    # Сортировка
-    sort_by = request.GET.get('sort', 'newest')
-    if sort_by == 'oldest':
-        deals = deals.order_by('created_at')
-    elif sort_by == 'price_high':
-        deals = deals.order_by('-price')
-    elif sort_by == 'price_low':
-        deals = deals.order_by('price')
-    else:  # newest по умолчанию
-        deals = deals.order_by('-created_at')
-
-    # Поиск
-    search_query = request.GET.get('search', '')
-    if search_query:
-        deals = deals.filter(
-            Q(client__name__icontains=search_query) |
-            Q(client__phone__icontains=search_query) |
-            Q(services__icontains=search_query)
-        )
-
-    # Пагинация
-    paginator = Paginator(deals, 25)  # 25 сделок на страницу
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Клиенты и услуги нужны только для строк, которых нет в кеше
+    deals = Deal.objects.all()
+    # Фильтры по статусу, услуге, дате и поиск
+    deals, filters = filter_deals(deals, request.GET)
+    sort_by = filters['sort_by']
+
+    # Курсорная пагинация, общее количество - только по запросу
+    cursor = request.GET.get('cursor')
+    if sort_by == 'relevance':
+        # Порядок релевантности задает индекс: страница id сделок
+        # из запроса к индексу, затем только сделки этой страницы
+        page_obj = SearchPaginator(
+            deals, filters['search_query'], per_page=25,
+            count=requested_count_mode(request)).get_page(cursor)
+        page_deals = Deal.objects.in_bulk(page_obj.object_list)
+        page_obj.object_list = [
+            page_deals[pk] for pk in page_obj.object_list
+            if pk in page_deals]
+    else:
+        paginator = KeysetPaginator(
+            deals, DEAL_SORT_ORDERINGS[sort_by], per_page=25,
+            count=requested_count_mode(request))
+        page_obj = paginator.get_page(cursor)
+
+    # Параметры фильтров для ссылок пагинации
+    filter_query = request.GET.copy()
+    filter_query.pop('cursor', None)
+    filter_query.pop('page', None)
+
+    page_obj.object_list = attach_rows(page_obj.object_list)
 
     context = {
         'deals': page_obj,
-        'status_filter': status_filter,
-        'date_filter': date_filter,
-        'sort_by': sort_by,
-        'search_query': search_query,
+        'filter_query': filter_query.urlencode(),
+        **filters,
     }
 
     return render(request, 'closed.html', context)
 
 
+@use_read_database
+def export_deals(request, export_format):
+    """Выгрузка сделок в CSV или XLSX с фильтрами страницы всех сделок"""
+    deals, filters = filter_deals(Deal.objects.all(), request.GET)
+    rows = deal_export_rows(deals, filters['sort_by'],
+                            filters['search_query'])
+    return export_response(export_format, DEAL_EXPORT_HEADER, rows,
+                           f'deals_{timezone.now():%Y%m%d}')
+
+
+# Комментариев на странице сделки и в одной подгрузке
+COMMENTS_PER_PAGE = 20
+
+
+def comments_page(deal_id, cursor=None):
+    """Страница комментариев сделки, новые первыми"""
+    comments = Comment.objects.filter(deal_id=deal_id).select_related(
+        'author')
+    return KeysetPaginator(
+        comments, ('-created_at', '-id'), per_page=COMMENTS_PER_PAGE
+    ).get_page(cursor)
+
+
 def deal_detail(request, deal_id):
-    """Детальная страница сделки"""
-    deal = get_object_or_404(
-        Deal.objects.select_related('client').prefetch_related(
-                       'services', 'comments__author', 'dealservice_set'
-                       ),
-        id=deal_id
-    )
-
-    services_with_prices = deal.dealservice_set.select_related('service').all()
+    """Детальная страница сделки.
+
+    Сделка с клиентом, услуги с ценами и первая страница комментариев -
+    три запроса при любом количестве комментариев; более старые
+    комментарии страница подгружает из deal_comments при прокрутке.
+    """
+    deal = get_object_or_404(Deal.objects.select_related('client'),
+                             id=deal_id)
+
+    services_with_prices = list(
+        deal.dealservice_set.select_related('service').order_by('id'))
     comment_form = CommentForm()
 
     if request.method == 'POST':
@@ -166,37 +194,30 @@ def deal_detail(request, deal_id):
     context = {
         'deal': deal,
         'services_with_prices': services_with_prices,
+        'comments': comments_page(deal.id),
         'comment_form': comment_form,
     }
     return render(request, 'deal_detail.html', context)
 
 
-@csrf_exempt
+@use_read_database
+def deal_comments(request, deal_id):
+    """Следующая страница комментариев сделки (?cursor=) для подгрузки"""
+    page = comments_page(deal_id, request.GET.get('cursor'))
+    return JsonResponse({
+        'html': render_to_string('deal_comments.html', {'comments': page}),
+        'count': len(page),
+        'next_cursor': page.next_cursor,
+    })
+
+
 @csrf_exempt
 def create_deal(request):
     if request.method == 'POST':
         try:
             # Получаем данные из формы
-            client_name = request.POST.get('client_name')
-            client_phone = request.POST.get('client_phone')
             service_ids = request.POST.getlist('services[]')
             prices = request.POST.getlist('prices[]')
-            start_date = request.POST.get('start_date')
-            end_date = request.POST.get('end_date')
-            status = request.POST.get('status')
-            description = request.POST.get('description')
-
-            # Валидация обязательных полей
-            if not all(
-                [client_name, client_phone, start_date, end_date, status]
-            ):
-                return JsonResponse({
-                    'success': False,
-                    'errors': {
-                        'general': 'Все обязательные поля'
-                        'должны быть заполнены'
-                        }
-                }, status=400)
 
             if not service_ids or not any(service_ids):
                 return JsonResponse({
@@ -204,66 +225,29 @@ def create_deal(request):
                     'errors': {'services': 'Выберите хотя бы одну услугу'}
                 }, status=400)
 
-            # Создаем или находим клиента
-            client, created = Client.objects.get_or_create(
-                phone=client_phone,
-                defaults={'name': client_name}
-            )
-
-            # Если клиент уже существовал, но имя изменилось - обновляем
-            if not created and client.name != client_name:
-                client.name = client_name
-                client.save()
-
-            # Преобразуем даты с учетом timezone
-            from django.utils import timezone
-            import datetime
-
-            # Преобразуем строки в datetime объекты
-            start_date_obj = datetime.datetime.fromisoformat(
-                start_date.replace('Z', '+00:00'))
-            end_date_obj = datetime.datetime.fromisoformat(
-                end_date.replace('Z', '+00:00'))
-
-            # Делаем даты aware (с учетом timezone)
-            start_date_aware = timezone.make_aware(start_date_obj)
-            end_date_aware = timezone.make_aware(end_date_obj)
-
-            # Создаем сделку
-            deal = Deal.objects.create(
-                client=client,
-                description=description or '',
-                status=status,
-                start_date=start_date_aware,
-                end_date=end_date_aware
-            )
-
-            # Добавляем услуги к сделке
-            for i in range(len(service_ids)):
-                if service_ids[i]:  # Проверяем, что услуга выбрана
-                    service = Service.objects.get(id=service_ids[i])
-                    price = prices[i] if i < len(prices) else service.price
-
-                    # Создаем связь между сделкой и услугой
-                    DealService.objects.create(
-                        deal=deal,
-                        service=service,
-                        price=price or service.price
-                        )
+            # Клиент, сделка и услуги сохраняются в одной транзакции
+            create_deal_with_services({
+                'client_name': request.POST.get('client_name'),
+                'client_phone': request.POST.get('client_phone'),
+                'start_date': request.POST.get('start_date'),
+                'end_date': request.POST.get('end_date'),
+                'status': request.POST.get('status'),
+                'description': request.POST.get('description'),
+                'services': [
+                    {
+                        'service_id': service_id,
+                        'price': prices[i] if i < len(prices) else None
+                    }
+                    for i, service_id in enumerate(service_ids)
+                ],
+            })
 
             return redirect('dashboard')
 
-        except Service.DoesNotExist as e:
-            print(f"DEBUG: Service error - {str(e)}")
-            return JsonResponse({
-                'success': False,
-                'errors': {'service': 'Услуга не найдена'}
-            }, status=400)
-        except Exception as e:
-            print(f"DEBUG: General error - {str(e)}")
+        except ValidationError as e:
             return JsonResponse({
                 'success': False,
-                'errors': {'general': f'Ошибка при создании сделки: {str(e)}'}
+                'errors': {'general': '; '.join(e.messages)}
             }, status=400)
 
     return JsonResponse({
@@ -292,9 +276,9 @@ def update_deal_status(request, deal_id):
                 'valid_statuses': list(dict(Deal.STATUS_CHOICES).keys())
             }, status=400)
 
-        old_status = deal.status
         deal.status = new_status
-        deal.save()
+        # Обновляем только статус, а не все колонки строки
+        deal.save(update_fields=['status', 'updated_at'])
 
         return JsonResponse({
             'success': True,
@@ -329,7 +313,8 @@ def restore_deal(request, deal_id):
             deal = Deal.objects.get(
                 id=deal_id, status__in=['completed', 'cancelled'])
             deal.status = 'new'
-            deal.save()
+            # Только статус: total поддерживается сигналами DealService
+            deal.save(update_fields=['status', 'updated_at'])
             return JsonResponse({'success': True})
         except Deal.DoesNotExist:
             return JsonResponse(
@@ -5,6 +5,12 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
+
+Запуск под ASGI (requirements-asgi.txt):
+    uvicorn grey_crm.asgi:application --workers 4 --timeout-keep-alive 30
+
+Под ASGI асинхронные view (поиск клиента, API канбана и статистики)
+и поток событий канбана не занимают поток на каждый запрос.
 """
 
 import os
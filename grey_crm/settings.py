@@ -47,6 +47,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Первым, чтобы замеры включали все остальные middleware
+    'core.middleware.PerformanceMiddleware',
+    # Чтение из основной базы сразу после записи (core.routers)
+    'core.routers.PrimaryStickyMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -61,7 +65,9 @@ ROOT_URLCONF = 'grey_crm.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates с замером времени рендеринга (core.middleware)
+        'BACKEND': 'core.template_backend.TimedDjangoTemplates',
+        'NAME': 'django',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -80,12 +86,55 @@ WSGI_APPLICATION = 'grey_crm.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
+# SQLite в режиме для продакшена (core.sqlite): WAL, busy_timeout,
+# прагмы производительности и BEGIN IMMEDIATE для записи.
+# Алиас read - соединения только для чтения к тому же файлу, через него
+# читают view с декоратором core.routers.use_read_database.
+# Соединения постоянные (CONN_MAX_AGE): прагмы выполняются при открытии
+# соединения, а не на каждый запрос; перед повторным использованием
+# соединение проверяется (CONN_HEALTH_CHECKS).
+_connection_reuse = {'CONN_MAX_AGE': 600, 'CONN_HEALTH_CHECKS': True}
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'core.sqlite',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        **_connection_reuse,
+    },
+    'read': {
+        'ENGINE': 'core.sqlite',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {'read_only': True},
+        **_connection_reuse,
+        'TEST': {'MIRROR': 'default'},
+    },
 }
+
+# Реплики для чтения. Для локальной проверки - копии файла базы,
+# пути через запятую в CRM_SQLITE_REPLICAS (обновляются командой
+# sync_replicas); для PostgreSQL - алиасы реплик в DATABASES
+# и в CRM_READ_DATABASES.
+CRM_READ_DATABASES = ['read']
+_replicas = [
+    path for path in os.environ.get('CRM_SQLITE_REPLICAS', '').split(',')
+    if path
+]
+if _replicas:
+    CRM_READ_DATABASES = []
+    for _number, _path in enumerate(_replicas, 1):
+        DATABASES[f'replica{_number}'] = {
+            'ENGINE': 'core.sqlite',
+            'NAME': _path,
+            'OPTIONS': {'read_only': True},
+            **_connection_reuse,
+            'TEST': {'MIRROR': 'default'},
+        }
+        CRM_READ_DATABASES.append(f'replica{_number}')
+
+DATABASE_ROUTERS = ['core.routers.PrimaryReplicaRouter']
+
+# Сколько секунд после записи сессия браузера читает из основной базы
+# (реплика может отставать)
+CRM_PRIMARY_STICKY_SECONDS = 10
 #DATABASES = {
 #    'default': {
 #        'ENGINE': 'django.db.backends.postgresql',
@@ -98,6 +147,62 @@ DATABASES = {
 #}
 
 
+# Кеш агрегатов и версий данных (core.cache) должен быть общим для всех
+# воркеров: иначе изменения, сделанные в одном процессе, не видны другим.
+# Файловый кеш общий для процессов одного сервера; для нескольких
+# серверов используйте кеш в БД (DatabaseCache) или memcached/redis.
+# Фрагменты карточек и строк сделок (по записи на сделку) - в памяти
+# процесса: ключ включает updated_at сделки и версии данных из общего
+# кеша, поэтому фрагмент одного процесса не устаревает в других.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+    },
+    'fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'grey-crm-fragments',
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+}
+
+
+
+# Замеры запросов (core.middleware): Server-Timing и лог crm.perf.
+# BUDGETS - лимиты по имени url, при превышении пишется warning
+CRM_PERF = {
+    'ENABLED': True,
+    'SERVER_TIMING': True,
+    'DUPLICATE_THRESHOLD': 3,
+    'BUDGETS': {
+        'dashboard': {'queries': 10, 'time_ms': 500},
+        'closed_deals': {'queries': 10, 'time_ms': 500},
+        'statistics': {'queries': 10, 'time_ms': 500},
+        'contacts': {'queries': 10, 'time_ms': 500},
+        'client_detail': {'queries': 10, 'time_ms': 500},
+        'deal_detail': {'queries': 10, 'time_ms': 500},
+    },
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        # WARNING - только превышения бюджета; строка на каждый запрос -
+        # с CRM_PERF_LOG_LEVEL=INFO
+        'crm.perf': {
+            'handlers': ['console'],
+            'level': os.environ.get('CRM_PERF_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
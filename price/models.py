@@ -6,6 +6,8 @@ class ServiceCategory(models.Model):
     name = models.CharField(max_length=100, verbose_name="Название категории")
     description = models.TextField(blank=True, verbose_name="Описание")
     order = models.IntegerField(default=0, verbose_name="Порядок сортировки")
+    updated_at = models.DateTimeField(auto_now=True,
+                                      verbose_name="Дата обновления")
 
     class Meta:
         verbose_name = "Категория услуг"
@@ -1,3 +1,64 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.urls import reverse
+from django.utils import timezone
+
+from clients.models import Client
+from core.testing import CRMTestCase
+from deals.models import Deal, DealService
+from .models import Service, ServiceCategory
+
+
+class ServicesPageTests(CRMTestCase):
+    """Страница услуг: статистика прайса и условный GET"""
+
+    def setUp(self):
+        super().setUp()
+        self.category = ServiceCategory.objects.create(name='Кузов')
+        self.repair = Service.objects.create(
+            name='Ремонт', price=1500, category=self.category)
+        self.polish = Service.objects.create(
+            name='Полировка', price=700, is_active=False,
+            description='Кузов и фары')
+        self.url = reverse('services')
+
+    def test_services_and_search(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['total_services'], 2)
+        self.assertEqual(response.context['active_services_count'], 1)
+        self.assertEqual(response.context['avg_price'], 1100)
+
+        response = self.client.get(self.url, {'search': 'Кузов'})
+        self.assertEqual(
+            sorted(service.name for service in response.context['services']),
+            ['Полировка', 'Ремонт'])
+
+    def test_not_modified_until_price_or_usage_changes(self):
+        # CSRF cookie формы входит в ETag: первый ответ его выставляет
+        self.client.get(self.url)
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.polish.price = 800
+            self.polish.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        # Использование услуг меняется вместе с услугами сделок
+        client = Client.objects.create(name='Иван Петров',
+                                       phone='+79001112233')
+        now = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            deal = Deal.objects.create(client=client, start_date=now,
+                                       end_date=now + timedelta(days=7))
+            DealService.objects.create(deal=deal, service=self.repair,
+                                       price=1500)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {service.name: service.usage_count
+             for service in response.context['services']},
+            {'Ремонт': 1, 'Полировка': 0})
@@ -1,9 +1,27 @@
 from django.shortcuts import render
 from django.db.models import Q, Count, Avg
 
-from .models import Service
+from core.conditional import (conditional_get, csrf_cookie, make_etag,
+                              model_fingerprint)
+from core.routers import use_read_database
+from deals.events import latest_event_id
+from .models import Service, ServiceCategory
 
 
+def services_etag(request):
+    """ETag страницы услуг: прайс, категории и использование услуг
+    (изменения услуг сделок записываются в ленту событий)"""
+    return make_etag(
+        'services',
+        csrf_cookie(request),
+        model_fingerprint(Service),
+        model_fingerprint(ServiceCategory),
+        latest_event_id(),
+    )
+
+
+@use_read_database
+@conditional_get(services_etag)
 def services(request):
     """Страница управления услугами"""
     search_query = request.GET.get('search', '')
@@ -17,6 +17,48 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
             
+    // Импорт клиентов из файла
+    const importClientsBtn = document.getElementById('importClientsBtn');
+    const importClientsFile = document.getElementById('importClientsFile');
+    if (importClientsBtn && importClientsFile) {
+        importClientsBtn.addEventListener('click', () => importClientsFile.click());
+        importClientsFile.addEventListener('change', function() {
+            if (!this.files.length) return;
+            const formData = new FormData();
+            formData.append('file', this.files[0]);
+            importClientsBtn.disabled = true;
+
+            fetch(this.dataset.url, {
+                method: 'POST',
+                headers: {
+                    'X-CSRFToken': document.querySelector('[name=csrfmiddlewaretoken]').value,
+                    'X-Requested-With': 'XMLHttpRequest'
+                },
+                body: formData
+            })
+            .then(response => response.json())
+            .then(data => {
+                if (!data.success) {
+                    alert('Ошибка импорта: ' + Object.values(data.errors).join(', '));
+                    return;
+                }
+                let message = `Создано: ${data.created}, обновлено: ${data.updated}, ` +
+                    `без изменений: ${data.unchanged}, повторов в файле: ${data.duplicates}, ` +
+                    `пропущено: ${data.skipped}`;
+                if (data.errors.length) {
+                    message += '\n\n' + data.errors.slice(0, 10).join('\n');
+                }
+                alert(message);
+                window.location.reload();
+            })
+            .catch(error => alert('Ошибка импорта: ' + error.message))
+            .finally(() => {
+                importClientsBtn.disabled = false;
+                importClientsFile.value = '';
+            });
+        });
+    }
+
     // Поиск клиентов
     const clientSearch = document.getElementById('clientSearch');
     if (clientSearch) {
@@ -82,26 +82,77 @@ function updateDealStatus() {
 }
 
 function updateDealStatusDirect(dealId, status) {
-    fetch(`/crm/deal/${dealId}/update_status/`, {
+    closeStatusModal();
+    queueStatusChange(dealId, status);
+}
+
+// --- Очередь изменений статусов ---
+// Изменения копятся и отправляются одним запросом на /crm/api/deals/status/
+
+const STATUS_FLUSH_DELAY = 800;
+const pendingStatusChanges = new Map();
+let statusFlushTimer = null;
+
+function dealCards(dealId) {
+    return document.querySelectorAll(`.deal-card[data-id="${dealId}"]`);
+}
+
+function queueStatusChange(dealId, status) {
+    pendingStatusChanges.set(String(dealId), status);
+    dealCards(dealId).forEach(card => card.classList.add('status-pending'));
+
+    clearTimeout(statusFlushTimer);
+    statusFlushTimer = setTimeout(flushStatusChanges, STATUS_FLUSH_DELAY);
+}
+
+function queueColumnStatus(button, status) {
+    const cards = button.closest('.column').querySelectorAll('.deal-card');
+    if (!cards.length) return;
+    if (!confirm(`Изменить статус сделок: ${cards.length}?`)) return;
+
+    cards.forEach(card => queueStatusChange(card.getAttribute('data-id'), status));
+    flushStatusChanges();
+}
+
+function flushStatusChanges(keepalive = false) {
+    clearTimeout(statusFlushTimer);
+    if (!pendingStatusChanges.size) return Promise.resolve();
+
+    const changes = Array.from(pendingStatusChanges,
+        ([id, status]) => ({ id: Number(id), status: status }));
+    pendingStatusChanges.clear();
+
+    return fetch('/crm/api/deals/status/', {
         method: 'POST',
+        keepalive: keepalive,
         headers: {
             'Content-Type': 'application/json',
             'X-CSRFToken': csrftoken,
             'X-Requested-With': 'XMLHttpRequest'
         },
-        body: JSON.stringify({ status: status })
-    })
-    .then(response => {
-        if (!response.ok) throw new Error('Network response was not ok');
-        return response.json();
+        body: JSON.stringify({ changes: changes })
     })
+    .then(response => response.json())
     .then(data => {
-        if (data.success) {
-            showNotification(`Статус изменен на: ${data.status_display}`, 'success');
-            setTimeout(() => location.reload(), 1500);
+        if (!data.results) {
+            changes.forEach(change => dealCards(change.id).forEach(
+                card => card.classList.remove('status-pending')));
+            showNotification(`Ошибка: ${data.error}`, 'error');
+            return;
+        }
+
+        const failed = data.results.filter(result => !result.success);
+        failed.forEach(result => dealCards(result.id).forEach(
+            card => card.classList.remove('status-pending')));
+
+        if (failed.length) {
+            showNotification(`Не обновлено сделок: ${failed.length} (${failed[0].error})`, 'error');
         } else {
-            showNotification(`Ошибка: ${data.message}`, 'error');
+            showNotification(data.message, 'success');
         }
+        // Карточки перерисуются по событиям ленты изменений
+        const updated = data.results.filter(result => result.success);
+        refreshCards(updated.map(result => result.id));
     })
     .catch(error => {
         console.error('Error:', error);
@@ -109,21 +160,128 @@ function updateDealStatusDirect(dealId, status) {
     });
 }
 
+// Несохраненные изменения отправляются при уходе со страницы
+window.addEventListener('pagehide', () => flushStatusChanges(true));
+
+// --- Живое обновление доски ---
+// События изменений сделок приходят по SSE (/crm/events/deals/,
+// только под ASGI), иначе - через long-poll. Измененные карточки
+// запрашиваются одним запросом и перекладываются по колонкам.
+
+const CARDS_REFRESH_DELAY = 300;
+const LONG_POLL_RETRY_DELAY = 5000;
+const pendingCardIds = new Set();
+let cardsRefreshTimer = null;
+let lastEventId = 0;
+
+function connectDealEvents() {
+    const board = document.querySelector('.columns[data-last-event-id]');
+    if (!board) return;
+    lastEventId = Number(board.getAttribute('data-last-event-id')) || 0;
+
+    if (window.EventSource && board.getAttribute('data-events-mode') === 'sse') {
+        const source = new EventSource(`/crm/events/deals/?after=${lastEventId}`);
+        source.addEventListener('deal', e => handleDealEvent(JSON.parse(e.data)));
+    } else {
+        pollDealEvents();
+    }
+}
+
+function pollDealEvents() {
+    fetch(`/crm/events/deals/?mode=poll&after=${lastEventId}`)
+        .then(response => response.json())
+        .then(data => {
+            data.events.forEach(handleDealEvent);
+            lastEventId = data.last_id;
+            pollDealEvents();
+        })
+        .catch(() => setTimeout(pollDealEvents, LONG_POLL_RETRY_DELAY));
+}
+
+function handleDealEvent(event) {
+    lastEventId = Math.max(lastEventId, event.id);
+    if (event.kind === 'deleted') {
+        removeCards(event.deal_id);
+        updateColumnCounts();
+        return;
+    }
+    refreshCards([event.deal_id]);
+}
+
+function refreshCards(dealIds) {
+    dealIds.forEach(dealId => pendingCardIds.add(Number(dealId)));
+    clearTimeout(cardsRefreshTimer);
+    cardsRefreshTimer = setTimeout(loadCards, CARDS_REFRESH_DELAY);
+}
+
+function loadCards() {
+    if (!pendingCardIds.size) return;
+    const ids = Array.from(pendingCardIds);
+    pendingCardIds.clear();
+
+    fetch(`/crm/deals/cards/?ids=${ids.join(',')}`)
+        .then(response => response.json())
+        .then(data => {
+            data.missing.forEach(removeCards);
+            data.cards.forEach(placeCard);
+            updateColumnCounts();
+        })
+        .catch(error => console.error('Error:', error));
+}
+
+function removeCards(dealId) {
+    dealCards(dealId).forEach(card => card.remove());
+}
+
+function placeCard(card) {
+    // Карточка с неотправленным изменением статуса не трогается
+    if (pendingStatusChanges.has(String(card.id))) return;
+    removeCards(card.id);
+    if (!card.active) return;
+
+    insertCard(card.status, card.id, card.html);
+    if (card.expired) {
+        insertCard('expired', card.id, card.html);
+    }
+}
+
+function insertCard(columnName, dealId, html) {
+    const column = document.querySelector(`.column[data-column="${columnName}"]`);
+    if (!column) return;
+
+    const template = document.createElement('template');
+    template.innerHTML = html.trim();
+    // Колонки отсортированы от новых к старым: новая карточка
+    // встает перед первой карточкой с меньшим id
+    const next = Array.from(column.querySelectorAll('.deal-card')).find(
+        other => Number(other.getAttribute('data-id')) < dealId);
+    column.insertBefore(template.content.firstElementChild,
+        next || column.querySelector('.no-deals'));
+}
+
+function updateColumnCounts() {
+    document.querySelectorAll('.column[data-column]').forEach(column => {
+        const count = column.querySelectorAll('.deal-card').length;
+        column.querySelector('.deal-count').textContent = count;
+        column.querySelector('.no-deals').hidden = count > 0;
+    });
+}
+
 // --- Инициализация при загрузке страницы ---
 
 document.addEventListener('DOMContentLoaded', () => {
     initModals();
     setCurrentDate();
     calculateTotal();
-
-    // Обработчики для карточек сделок
-    document.querySelectorAll('.deal-card').forEach(card => {
-        card.addEventListener('click', e => {
-            if (!e.target.closest('.deal-actions')) {
-                const dealId = card.getAttribute('data-id');
-                window.location.href = `/crm/deal/${dealId}/`;
-            }
-        });
+    connectDealEvents();
+
+    // Обработчик для карточек сделок, в том числе добавленных позже
+    document.addEventListener('click', e => {
+        const card = e.target.closest('.deal-card');
+        if (card && !e.target.closest('.deal-actions')) {
+            const dealId = card.getAttribute('data-id');
+            window.location.href = `/crm/deal/${dealId}/`;
+        }
     });
 });
 
@@ -14,3 +14,46 @@ function toggleEditMode() {
         editBtn.innerHTML = '<i class="fas fa-times"></i> Отменить редактирование';
     }
 }
+
+// Подгрузка более ранних комментариев при прокрутке
+document.addEventListener('DOMContentLoaded', function() {
+    const loadButton = document.getElementById('loadComments');
+    const commentsList = document.getElementById('commentsList');
+    if (!loadButton || !commentsList) return;
+
+    let loading = false;
+
+    function loadComments() {
+        if (loading || !loadButton.dataset.cursor) return;
+        loading = true;
+        loadButton.disabled = true;
+
+        const url = loadButton.dataset.url + '?cursor=' + encodeURIComponent(loadButton.dataset.cursor);
+        fetch(url, { headers: { 'X-Requested-With': 'XMLHttpRequest' } })
+            .then(response => response.json())
+            .then(data => {
+                commentsList.insertAdjacentHTML('beforeend', data.html);
+                if (data.next_cursor) {
+                    loadButton.dataset.cursor = data.next_cursor;
+                } else {
+                    loadButton.remove();
+                    if (observer) observer.disconnect();
+                }
+            })
+            .catch(error => console.error('Ошибка загрузки комментариев:', error))
+            .finally(() => {
+                loading = false;
+                loadButton.disabled = false;
+            });
+    }
+
+    loadButton.addEventListener('click', loadComments);
+
+    // Кнопка в зоне видимости списка - загружаем следующую страницу
+    const observer = 'IntersectionObserver' in window
+        ? new IntersectionObserver(entries => {
+            if (entries.some(entry => entry.isIntersecting)) loadComments();
+        }, { root: document.querySelector('.comments-section') })
+        : null;
+    if (observer) observer.observe(loadButton);
+});
@@ -1,10 +1,10 @@
-<script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
-// Данные для графиков из Django контекста
+// Данные для графиков из Django контекста (json_script в statistics.html)
+const chartData = JSON.parse(document.getElementById('chart-data').textContent);
 const monthlyData = {
-    labels: {{ monthly_labels|safe }},
+    labels: chartData.monthlyLabels,
     datasets: [{
         label: 'Количество сделок',
-        data: {{ monthly_data|safe }},
+        data: chartData.monthlyData,
         backgroundColor: 'rgba(54, 162, 235, 0.2)',
         borderColor: 'rgba(54, 162, 235, 1)',
         borderWidth: 2,
@@ -13,9 +13,9 @@ const monthlyData = {
 };
 
 const servicesData = {
-    labels: {{ services_labels|safe }},
+    labels: chartData.servicesLabels,
     datasets: [{
-        data: {{ services_data|safe }},
+        data: chartData.servicesData,
         backgroundColor: [
             'rgba(255, 99, 132, 0.7)',
             'rgba(54, 162, 235, 0.7)',
@@ -38,10 +38,13 @@ document.addEventListener('DOMContentLoaded', function() {
     });
 });
 
+let monthlyChart = null;
+let servicesChart = null;
+
 function initCharts() {
     // Линейный график
     const monthlyCtx = document.getElementById('monthlyChart').getContext('2d');
-    new Chart(monthlyCtx, {
+    monthlyChart = new Chart(monthlyCtx, {
         type: 'line',
         data: monthlyData,
         options: {
@@ -60,7 +63,7 @@ function initCharts() {
 
     // Круговая диаграмма
     const servicesCtx = document.getElementById('servicesChart').getContext('2d');
-    new Chart(servicesCtx, {
+    servicesChart = new Chart(servicesCtx, {
         type: 'pie',
         data: servicesData,
         options: {
@@ -80,7 +83,7 @@ function initCharts() {
 
 function updateCharts(period) {
     // AJAX запрос для обновления данных
-    fetch(`/statistics/update/?period=${period}`, {
+    fetch(`/crm/statistics/update/?period=${period}`, {
         method: 'GET',
         headers: {
             'X-Requested-With': 'XMLHttpRequest',
@@ -96,7 +99,8 @@ function updateCharts(period) {
         servicesData.datasets[0].data = data.services_data;
                 
         // Перерисовка графиков
-        initCharts();
+        monthlyChart.update();
+        servicesChart.update();
     })
     .catch(error => {
         console.error('Error:', error);
@@ -86,7 +86,7 @@ function exportData(format) {
     const dateFilter = document.getElementById('dateFilter').value;
     const sortBy = document.getElementById('sortBy').value;
             
-    let url = `/successful/deals/export/${format}/?`;
+    let url = `/crm/closed/export/${format}/?`;
     if (searchValue) url += `search=${encodeURIComponent(searchValue)}&`;
     if (serviceFilter !== 'all') url += `service=${serviceFilter}&`;
     if (dateFilter !== 'all') url += `date=${dateFilter}&`;
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from statistic import rollups
+
+
+class Command(BaseCommand):
+    """Полная перестройка помесячных сводок статистики"""
+    help = 'Пересчитывает сводки выручки по месяцам и услугам'
+
+    def handle(self, *args, **options):
+        months = rollups.rebuild_all()
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано месяцев: {months}'))
@@ -0,0 +1,84 @@
+# Generated by Django 4.2 on 2026-10-18 13:42
+
+from django.db import migrations, models
+from django.db.models import Count, Sum, Q
+from django.db.models.functions import TruncMonth
+import django.db.models.deletion
+
+
+def fill_monthly_stats(apps, schema_editor):
+    """Первичное заполнение сводок по существующим сделкам"""
+    Deal = apps.get_model('deals', 'Deal')
+    DealService = apps.get_model('deals', 'DealService')
+    MonthlyStat = apps.get_model('statistic', 'MonthlyStat')
+    MonthlyServiceStat = apps.get_model('statistic', 'MonthlyServiceStat')
+
+    MonthlyStat.objects.bulk_create([
+        MonthlyStat(month=row['month'], revenue=row['revenue'] or 0,
+                    deals_count=row['deals_count'],
+                    completed_count=row['completed_count'])
+        for row in Deal.objects.order_by().annotate(
+            month=TruncMonth('created_at', output_field=models.DateField())
+        ).values('month').annotate(
+            revenue=Sum('total'),
+            deals_count=Count('id'),
+            completed_count=Count(
+                'id', filter=Q(status__in=['successful', 'completed'])),
+        )
+    ])
+    MonthlyServiceStat.objects.bulk_create([
+        MonthlyServiceStat(month=row['month'], service_id=row['service'],
+                           revenue=row['revenue'] or 0,
+                           deals_count=row['deals_count'])
+        for row in DealService.objects.order_by().annotate(
+            month=TruncMonth('deal__created_at',
+                             output_field=models.DateField())
+        ).values('month', 'service').annotate(
+            revenue=Sum('price'), deals_count=Count('id'))
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('price', '0001_initial'),
+        ('deals', '0004_deal_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(unique=True, verbose_name='Месяц')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Выручка')),
+                ('deals_count', models.IntegerField(default=0, verbose_name='Количество сделок')),
+                ('completed_count', models.IntegerField(default=0, verbose_name='Завершенных сделок')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+            ],
+            options={
+                'verbose_name': 'Сводка за месяц',
+                'verbose_name_plural': 'Сводки по месяцам',
+                'ordering': ['month'],
+            },
+        ),
+        migrations.CreateModel(
+            name='MonthlyServiceStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='Месяц')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Выручка')),
+                ('deals_count', models.IntegerField(default=0, verbose_name='Количество сделок')),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_stats', to='price.service', verbose_name='Услуга')),
+            ],
+            options={
+                'verbose_name': 'Сводка по услуге за месяц',
+                'verbose_name_plural': 'Сводки по услугам за месяц',
+                'ordering': ['month'],
+                'unique_together': {('month', 'service')},
+            },
+        ),
+        migrations.RunPython(fill_monthly_stats, migrations.RunPython.noop),
+    ]
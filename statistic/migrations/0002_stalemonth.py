@@ -0,0 +1,24 @@
+# Generated by Django 4.2 on 2026-10-18 16:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('statistic', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StaleMonth',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(unique=True, verbose_name='Месяц')),
+            ],
+            options={
+                'verbose_name': 'Устаревшая сводка',
+                'verbose_name_plural': 'Устаревшие сводки',
+            },
+        ),
+    ]
@@ -1,3 +1,56 @@
 from django.db import models
 
-# Create your models here.
+
+class MonthlyStat(models.Model):
+    """Сводка по сделкам за месяц (поддерживается сигналами)"""
+    month = models.DateField(unique=True, verbose_name="Месяц")
+    revenue = models.DecimalField(max_digits=14, decimal_places=2,
+                                  default=0, verbose_name="Выручка")
+    deals_count = models.IntegerField(default=0,
+                                      verbose_name="Количество сделок")
+    completed_count = models.IntegerField(
+        default=0, verbose_name="Завершенных сделок")
+    updated_at = models.DateTimeField(auto_now=True,
+                                      verbose_name="Дата обновления")
+
+    class Meta:
+        verbose_name = "Сводка за месяц"
+        verbose_name_plural = "Сводки по месяцам"
+        ordering = ['month']
+
+    def __str__(self):
+        return f"{self.month:%m.%Y}: {self.revenue} руб."
+
+
+class MonthlyServiceStat(models.Model):
+    """Сводка по услуге за месяц (поддерживается сигналами)"""
+    month = models.DateField(verbose_name="Месяц")
+    service = models.ForeignKey('price.Service', on_delete=models.CASCADE,
+                                related_name='monthly_stats',
+                                verbose_name="Услуга")
+    revenue = models.DecimalField(max_digits=14, decimal_places=2,
+                                  default=0, verbose_name="Выручка")
+    deals_count = models.IntegerField(default=0,
+                                      verbose_name="Количество сделок")
+
+    class Meta:
+        verbose_name = "Сводка по услуге за месяц"
+        verbose_name_plural = "Сводки по услугам за месяц"
+        ordering = ['month']
+        unique_together = ['month', 'service']
+
+    def __str__(self):
+        return f"{self.service} {self.month:%m.%Y}: {self.revenue} руб."
+
+
+class StaleMonth(models.Model):
+    """Месяц, сводки которого нужно пересчитать (отмечается сигналами
+    после изменения сделок, снимается при пересчете)"""
+    month = models.DateField(unique=True, verbose_name="Месяц")
+
+    class Meta:
+        verbose_name = "Устаревшая сводка"
+        verbose_name_plural = "Устаревшие сводки"
+
+    def __str__(self):
+        return f"{self.month:%m.%Y}"
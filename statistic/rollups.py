@@ -0,0 +1,209 @@
+"""Помесячные сводки выручки и сделок.
+
+Сделка относится к месяцу своего создания. Изменения сделок только
+отмечают затронутые месяцы (StaleMonth), а пересчитываются они перед
+чтением статистики (refresh_stale_months): все изменения месяца между
+двумя чтениями - один агрегат по диапазону created_at. Страница
+статистики читает несколько строк сводки вместо агрегатов по всей
+истории.
+"""
+import datetime
+
+from django.db import transaction
+from django.db.models import Count, Sum, Q, DateField
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from core.cache import bump_versions
+from core.routers import read_from_primary
+from deals.models import Deal, DealService
+from .models import MonthlyStat, MonthlyServiceStat, StaleMonth
+
+
+# Статусы, которые считаются успешно завершенными
+COMPLETED_STATUSES = ['successful', 'completed']
+
+# Окно графиков для периодов update_statistics (в месяцах)
+PERIOD_MONTHS = {
+    'week': 1,
+    'month': 1,
+    'quarter': 3,
+    'year': 12,
+}
+
+MONTH_LABELS = ['Янв', 'Фев', 'Мар', 'Апр', 'Май', 'Июн',
+                'Июл', 'Авг', 'Сен', 'Окт', 'Ноя', 'Дек']
+
+
+def month_start(value):
+    """Первое число месяца для даты или aware datetime"""
+    if isinstance(value, datetime.datetime):
+        value = timezone.localtime(value).date()
+    return value.replace(day=1)
+
+
+def add_months(month, count):
+    """Сдвиг первого числа месяца на count месяцев"""
+    index = month.year * 12 + month.month - 1 + count
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def _month_range(month):
+    """Границы месяца как aware datetime для фильтра по created_at"""
+    start = timezone.make_aware(
+        datetime.datetime.combine(month, datetime.time.min))
+    end = timezone.make_aware(
+        datetime.datetime.combine(add_months(month, 1), datetime.time.min))
+    return start, end
+
+
+def _deal_totals(deals):
+    return deals.aggregate(
+        revenue=Sum('total'),
+        deals_count=Count('id'),
+        completed_count=Count(
+            'id', filter=Q(status__in=COMPLETED_STATUSES)),
+    )
+
+
+def _refresh_month(month):
+    """Пересчет сводок одного месяца (внутри транзакции)"""
+    start, end = _month_range(month)
+    totals = _deal_totals(Deal.objects.filter(
+        created_at__gte=start, created_at__lt=end))
+    if totals['deals_count']:
+        MonthlyStat.objects.update_or_create(
+            month=month,
+            defaults={
+                'revenue': totals['revenue'] or 0,
+                'deals_count': totals['deals_count'],
+                'completed_count': totals['completed_count'],
+            })
+    else:
+        MonthlyStat.objects.filter(month=month).delete()
+
+    MonthlyServiceStat.objects.filter(month=month).delete()
+    MonthlyServiceStat.objects.bulk_create([
+        MonthlyServiceStat(
+            month=month,
+            service_id=row['service'],
+            revenue=row['revenue'] or 0,
+            deals_count=row['deals_count'],
+        )
+        for row in DealService.objects.filter(
+            deal__created_at__gte=start, deal__created_at__lt=end
+        ).order_by().values('service').annotate(
+            revenue=Sum('price'), deals_count=Count('id'))
+    ])
+
+
+def mark_months_stale(months):
+    """Отметка месяцев для пересчета перед следующим чтением"""
+    StaleMonth.objects.bulk_create(
+        [StaleMonth(month=month) for month in set(months)],
+        ignore_conflicts=True)
+
+
+def mark_deal_months_stale(deal_ids):
+    """Отметка месяцев, к которым относятся сделки"""
+    mark_months_stale(
+        Deal.objects.filter(pk__in=deal_ids).dates('created_at', 'month'))
+
+
+def refresh_stale_months():
+    """Пересчет отмеченных месяцев; возвращает пересчитанные.
+
+    Отметку снимает тот, кто пересчитывает месяц: параллельный запрос
+    его пропустит, а изменение после снятия отметки поставит новую.
+    """
+    with read_from_primary():
+        months = sorted(StaleMonth.objects.values_list('month', flat=True))
+    refreshed = []
+    for month in months:
+        with transaction.atomic():
+            if StaleMonth.objects.filter(month=month).delete()[0]:
+                _refresh_month(month)
+                refreshed.append(month)
+    if refreshed:
+        bump_versions([MonthlyStat._meta.label_lower])
+    return refreshed
+
+
+def rebuild_all():
+    """Полная перестройка сводок двумя GROUP BY по всей истории"""
+    month = TruncMonth('created_at', output_field=DateField())
+    deal_rows = Deal.objects.order_by().annotate(month=month).values(
+        'month').annotate(
+            revenue=Sum('total'),
+            deals_count=Count('id'),
+            completed_count=Count(
+                'id', filter=Q(status__in=COMPLETED_STATUSES)),
+    )
+    service_rows = DealService.objects.order_by().annotate(
+        month=TruncMonth('deal__created_at', output_field=DateField())
+    ).values('month', 'service').annotate(
+        revenue=Sum('price'), deals_count=Count('id'))
+
+    with transaction.atomic():
+        StaleMonth.objects.all().delete()
+        MonthlyStat.objects.all().delete()
+        MonthlyServiceStat.objects.all().delete()
+        stats = MonthlyStat.objects.bulk_create([
+            MonthlyStat(
+                month=row['month'],
+                revenue=row['revenue'] or 0,
+                deals_count=row['deals_count'],
+                completed_count=row['completed_count'],
+            )
+            for row in deal_rows
+        ])
+        MonthlyServiceStat.objects.bulk_create([
+            MonthlyServiceStat(
+                month=row['month'],
+                service_id=row['service'],
+                revenue=row['revenue'] or 0,
+                deals_count=row['deals_count'],
+            )
+            for row in service_rows
+        ], batch_size=1000)
+    bump_versions([MonthlyStat._meta.label_lower])
+    return len(stats)
+
+
+def monthly_series(months_count, now=None):
+    """Подписи и значения по месяцам за последние months_count месяцев"""
+    last = month_start(now or timezone.now())
+    first = add_months(last, -(months_count - 1))
+    stats = {
+        stat.month: stat
+        for stat in MonthlyStat.objects.filter(month__gte=first)
+    }
+
+    labels, deals, revenue = [], [], []
+    for i in range(months_count):
+        month = add_months(first, i)
+        stat = stats.get(month)
+        labels.append(f'{MONTH_LABELS[month.month - 1]} {month:%y}')
+        deals.append(stat.deals_count if stat else 0)
+        revenue.append(float(stat.revenue) if stat else 0.0)
+    return labels, deals, revenue
+
+
+def service_totals(first_month=None):
+    """Выручка и количество по услугам начиная с first_month"""
+    rows = MonthlyServiceStat.objects.all()
+    if first_month is not None:
+        rows = rows.filter(month__gte=first_month)
+    return rows.order_by().values('service', 'service__name').annotate(
+        count=Sum('deals_count'),
+        total_revenue=Sum('revenue'),
+    ).order_by('-total_revenue')
+
+
+def summary_totals():
+    """Итоги по всей истории из помесячных сводок"""
+    return MonthlyStat.objects.aggregate(
+        revenue=Sum('revenue'),
+        deals_count=Sum('deals_count'),
+        completed_count=Sum('completed_count'),
+    )
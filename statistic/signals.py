@@ -0,0 +1,34 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from clients.models import Client
+from core.deferred import defer_on_commit
+from deals.models import Deal, DealService
+from deals.signals import deals_changed
+from . import rollups
+
+
+@receiver(post_save, sender=Deal)
+@receiver(post_delete, sender=Deal)
+def mark_deal_month(sender, instance, **kwargs):
+    """Отметка месяца создания сделки: сводка пересчитается
+    перед чтением статистики (statistic.rollups)"""
+    defer_on_commit('statistic_months',
+                    [rollups.month_start(instance.created_at)],
+                    rollups.mark_months_stale)
+
+
+@receiver(post_save, sender=DealService)
+@receiver(post_delete, sender=DealService)
+def mark_deal_service_month(sender, instance, **kwargs):
+    defer_on_commit('statistic_deals', [instance.deal_id],
+                    rollups.mark_deal_months_stale)
+
+
+@receiver(deals_changed)
+def mark_changed_deals(sender, deal_ids, **kwargs):
+    if sender is Client:
+        # Изменились только данные клиента сделок: сводки те же
+        return
+    defer_on_commit('statistic_deals', deal_ids,
+                    rollups.mark_deal_months_stale)
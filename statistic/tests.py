@@ -1,3 +1,104 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
 
-# Create your tests here.
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+
+from core.testing import CRMTestCase
+from clients.models import Client
+from deals.models import Deal, DealService
+from price.models import Service
+from . import rollups
+from .models import MonthlyServiceStat, MonthlyStat, StaleMonth
+
+
+class MonthlyRollupTests(CRMTestCase):
+    """Помесячные сводки пересчитываются по отметкам перед чтением"""
+
+    def setUp(self):
+        super().setUp()
+        self.repair = Service.objects.create(name='Ремонт', price=1500)
+        self.polish = Service.objects.create(name='Полировка', price=700)
+        self.ivan = Client.objects.create(name='Иван Петров',
+                                          phone='+79001112233')
+        self.month = rollups.month_start(timezone.now())
+
+    def create_deal(self, services, status='new'):
+        now = timezone.now()
+        with self.commit():
+            deal = Deal.objects.create(
+                client=self.ivan, status=status, start_date=now,
+                end_date=now + timedelta(days=7))
+            for service, price in services:
+                DealService.objects.create(deal=deal, service=service,
+                                           price=price)
+        return deal
+
+    def snapshot(self):
+        return (
+            list(MonthlyStat.objects.values_list(
+                'month', 'revenue', 'deals_count', 'completed_count')),
+            list(MonthlyServiceStat.objects.order_by(
+                'month', 'service').values_list(
+                'month', 'service', 'revenue', 'deals_count')),
+        )
+
+    def test_deal_write_marks_month_until_read(self):
+        self.create_deal([(self.repair, 1000), (self.polish, 500)],
+                         status='successful')
+        self.assertEqual(
+            list(StaleMonth.objects.values_list('month', flat=True)),
+            [self.month])
+        self.assertFalse(MonthlyStat.objects.exists())
+
+        response = self.client.get(reverse('statistics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(StaleMonth.objects.exists())
+        stat = MonthlyStat.objects.get()
+        self.assertEqual(
+            (stat.month, stat.revenue, stat.deals_count,
+             stat.completed_count),
+            (self.month, Decimal('1500'), 1, 1))
+        self.assertEqual(response.context['total_revenue'], 1500.0)
+
+    def test_refresh_matches_full_rebuild(self):
+        old = self.create_deal([(self.repair, 1000)], status='successful')
+        # Сделка прошлого месяца: created_at меняется только через update
+        Deal.objects.filter(pk=old.pk).update(
+            created_at=timezone.now() - timedelta(days=40))
+        rollups.rebuild_all()
+
+        deal = self.create_deal([(self.repair, 1200)])
+        self.create_deal([(self.polish, 700)])
+        with self.commit():
+            old = Deal.objects.get(pk=old.pk)
+            old.status = 'closed'
+            old.save(update_fields=['status', 'updated_at'])
+            DealService.objects.create(deal=deal, service=self.polish,
+                                       price=300)
+        self.assertEqual(len(rollups.refresh_stale_months()), 2)
+        incremental = self.snapshot()
+
+        rollups.rebuild_all()
+        self.assertEqual(self.snapshot(), incremental)
+
+        with self.commit():
+            Deal.objects.all().delete()
+        rollups.refresh_stale_months()
+        self.assertEqual(self.snapshot(), ([], []))
+
+    def test_rebuild_statistics_command(self):
+        self.create_deal([(self.repair, 1000)])
+        out = StringIO()
+        call_command('rebuild_statistics', stdout=out)
+        self.assertIn('Пересчитано месяцев: 1', out.getvalue())
+        self.assertFalse(StaleMonth.objects.exists())
+
+        response = self.client.get(reverse('update_statistics'),
+                                   {'period': 'quarter'})
+        data = response.json()
+        self.assertEqual(len(data['monthly_labels']), 3)
+        self.assertEqual(data['monthly_revenue'][-1], 1000.0)
+        self.assertEqual(data['services_labels'], ['Ремонт'])
@@ -1,39 +1,84 @@
 from django.shortcuts import render
 from django.http import JsonResponse
-from django.db.models import Count, Sum, Avg
 from django.utils import timezone
 from datetime import timedelta
 from decimal import Decimal
-import json
 
-from deals.models import Deal, DealService
 from clients.models import Client
+from core.asyncdb import run_parallel
+from core.cache import cached_bundle
+from core.conditional import conditional_get, make_etag, model_fingerprint
+from core.routers import use_read_database
 from price.models import Service
+from . import rollups
+from .models import MonthlyStat
 
 
+# Модели, от которых зависят агрегаты статистики
+STATISTICS_DEPENDENCIES = [
+    'deals.deal', 'deals.dealservice', 'clients.client', 'price.service',
+    'statistic.monthlystat',
+]
+
+
+def _new_clients_count():
+    """Новые клиенты за последние 30 дней"""
+    return Client.objects.filter(
+        created_at__gte=timezone.now() - timedelta(days=30)).count()
+
+
+def _service_stats(first_month=None):
+    """Статистика по услугам из помесячных сводок"""
+    service_stats = list(rollups.service_totals(first_month))
+    for stats in service_stats:
+        stats['avg_price'] = (
+            round(stats['total_revenue'] / stats['count'], 2)
+            if stats['count'] else Decimal('0'))
+    return service_stats
+
+
+def statistics_etag(request, *args, **kwargs):
+    """ETag статистики: отпечатки сводок и прайса, новые клиенты.
+
+    Сначала пересчитываются месяцы, отмеченные после изменений сделок,
+    поэтому ETag и данные всех view статистики строятся по свежим
+    сводкам. Сводки по услугам пересчитываются вместе со сводкой
+    месяца (statistic.rollups), поэтому их изменения видны по
+    updated_at MonthlyStat. Дата входит в отпечаток: графики строятся
+    от текущего месяца.
+    """
+    rollups.refresh_stale_months()
+    return make_etag(
+        'statistics',
+        timezone.localdate(),
+        model_fingerprint(MonthlyStat),
+        model_fingerprint(Service),
+        _new_clients_count(),
+    )
+
+
+@use_read_database
+@conditional_get(statistics_etag)
 def statistics(request):
-    """Страница статистики"""
-    # Получение данных из БД
-    total_revenue = DealService.objects.aggregate(
-        Sum('price'))['price__sum'] or Decimal('0')
-    total_deals = Deal.objects.count()
+    """Страница статистики (данные из помесячных сводок)"""
+    context = cached_bundle(
+        'statistics', STATISTICS_DEPENDENCIES, load_statistics_data)
+    return render(request, 'statistics.html', context)
+
+
+def load_statistics_data():
+    """Агрегаты страницы статистики (кешируются до изменения данных)"""
+    totals = rollups.summary_totals()
+    total_revenue = totals['revenue'] or Decimal('0')
+    total_deals = totals['deals_count'] or 0
+    total_completed = totals['completed_count'] or 0
 
     # Статистика по услугам
-    service_stats = Service.objects.annotate(
-        count=Count('dealservice'),
-        total_revenue=Sum('dealservice__price'),
-        avg_price=Avg('dealservice__price')
-    ).filter(count__gt=0)
-
-    # Данные для графиков
-    monthly_data = [120, 190, 150, 170, 220, 190, 240, 170, 200, 180, 160, 220]
-    monthly_labels = ['Янв', 'Фев', 'Мар', 'Апр', 'Май',
-                      'Июн', 'Июл', 'Авг', 'Сен', 'Окт', 'Ноя', 'Дек']
-
-    # Дополнительная статистика
-    completed_deals = Deal.objects.filter(status='completed').count()
-    successful_deals = Deal.objects.filter(status='successful').count()
-    total_completed = completed_deals + successful_deals
+    service_stats = _service_stats()
+
+    # Данные для графиков за последний год
+    monthly_labels, monthly_data, monthly_revenue = rollups.monthly_series(
+        rollups.PERIOD_MONTHS['year'])
 
     # Функция для преобразования Decimal в float
     def decimal_to_float(value):
@@ -42,22 +87,15 @@ def statistics(request):
         return value
 
     # Подготавливаем данные для графиков
-    services_revenue = []
-    for stats in service_stats[:6]:
-        if stats.total_revenue is not None:
-            services_revenue.append(float(stats.total_revenue))
-        else:
-            services_revenue.append(0.0)
+    services_revenue = [
+        float(stats['total_revenue'] or 0) for stats in service_stats[:6]
+    ]
 
     context = {
         'total_revenue': decimal_to_float(total_revenue),
         'total_deals': total_deals,
         'total_completed': total_completed,
-        'completed_deals': completed_deals,
-        'successful_deals': successful_deals,
-        'new_clients': Client.objects.filter(
-            created_at__gte=timezone.now()-timedelta(days=30)).count(
-            ),
+        'new_clients': _new_clients_count(),
         'conversion_rate': round(
             (total_completed / total_deals * 100) if total_deals > 0 else 0, 1
             ),
@@ -66,23 +104,84 @@ def statistics(request):
         'clients_change': 12.3,
         'conversion_change': 3.2,
         'service_stats': service_stats,
-        'monthly_data': json.dumps(monthly_data),
-        'monthly_labels': json.dumps(monthly_labels),
-        'services_data': json.dumps(services_revenue),
-        'services_labels': json.dumps(
-            [stats.name for stats in service_stats[:6]]
-            ),
+        # Данные графиков: в шаблоне через json_script, не в разметку
+        'chart_data': {
+            'monthlyLabels': monthly_labels,
+            'monthlyData': monthly_data,
+            'monthlyRevenue': monthly_revenue,
+            'servicesLabels': [
+                stats['service__name'] for stats in service_stats[:6]],
+            'servicesData': services_revenue,
+        },
     }
+    return context
 
-    return render(request, 'statistics.html', context)
 
+async def aload_statistics_summary():
+    """Агрегаты статистики для API: независимые запросы параллельно"""
+    months = rollups.PERIOD_MONTHS['year']
+    totals, service_stats, series, new_clients = await run_parallel(
+        rollups.summary_totals,
+        _service_stats,
+        lambda: rollups.monthly_series(months),
+        _new_clients_count,
+    )
+    total_deals = totals['deals_count'] or 0
+    total_completed = totals['completed_count'] or 0
+    monthly_labels, monthly_data, monthly_revenue = series
+
+    return {
+        'total_revenue': float(totals['revenue'] or 0),
+        'total_deals': total_deals,
+        'total_completed': total_completed,
+        'new_clients': new_clients,
+        'conversion_rate': round(
+            (total_completed / total_deals * 100) if total_deals else 0, 1),
+        'services': [
+            {
+                'id': stats['service'],
+                'name': stats['service__name'],
+                'count': stats['count'],
+                'revenue': float(stats['total_revenue'] or 0),
+                'avg_price': float(stats['avg_price']),
+            }
+            for stats in service_stats
+        ],
+        'monthly_labels': monthly_labels,
+        'monthly_data': monthly_data,
+        'monthly_revenue': monthly_revenue,
+    }
 
+
+@use_read_database
+@conditional_get(statistics_etag)
 def update_statistics(request):
     """Обновление статистики (AJAX)"""
     period = request.GET.get('period', 'month')
-    return JsonResponse({
-        'monthly_labels': ['Янв', 'Фев', 'Мар', 'Апр', 'Май', 'Июн'],
-        'monthly_data': [120, 190, 150, 170, 220, 190],
-        'services_labels': ['Услуга 1', 'Услуга 2', 'Услуга 3'],
-        'services_data': [40, 30, 30]
-    })
+    if period not in rollups.PERIOD_MONTHS:
+        period = 'month'
+    return JsonResponse(cached_bundle(
+        f'statistics_{period}', STATISTICS_DEPENDENCIES,
+        lambda: load_period_data(period)))
+
+
+def load_period_data(period):
+    """Данные графиков за период из помесячных сводок"""
+    months = rollups.PERIOD_MONTHS[period]
+
+    monthly_labels, monthly_data, monthly_revenue = rollups.monthly_series(
+        months)
+    first_month = rollups.add_months(
+        rollups.month_start(timezone.now()), -(months - 1))
+    service_stats = _service_stats(first_month)[:6]
+
+    return {
+        'period': period,
+        'monthly_labels': monthly_labels,
+        'monthly_data': monthly_data,
+        'monthly_revenue': monthly_revenue,
+        'services_labels': [stats['service__name'] for stats in service_stats],
+        'services_data': [
+            float(stats['total_revenue'] or 0) for stats in service_stats
+        ],
+    }